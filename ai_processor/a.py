@@ -1,11 +1,22 @@
 import cv2
-import numpy as np
 import requests
 import os
-import time
-import threading
 import json
 
+from pipeline import FramePipeline
+from detection import ScaledFaceDetector, DETECT_MAX_SIDE
+from tracker import FaceTracker
+from recognizers import create_backend
+from enrollment import EnrollmentWatcher
+from uploader import EventUploader
+from uniform import ColorCoverage, chest_below, WHITE_HSV_WIDE, UNIFORM_RATIO
+from rules import BehaviorRules, RULE_PROFILES, NOSE_OFFSET, LOW_HEAD
+from cooldown import CooldownStore
+from sources import open_source, FRAME_SOURCE
+from scheduler import AnalysisScheduler
+from motion import MotionGate
+from resolution import ResolutionController, capture_size
+
 # ================= CẤU HÌNH SERVER =================
 # Chỉ cần địa chỉ Server Node.js
 SERVER_URL = "http://localhost:3000" 
@@ -13,34 +24,50 @@ SERVER_URL = "http://localhost:3000"
 # Cấu hình Model AI
 DATASET_DIR = "faces_db"
 YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
+RECOGNIZER_BACKEND = "lbph"  # "lbph" | "sface"
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"       # Không vẽ / imshow (máy không màn hình)
 
 # ================= CLASS XỬ LÝ AI =================
 class SmartMonitor:
-    def __init__(self):
+    def __init__(self, source=None):
         print("▶ SMART CLASSROOM - AI CLIENT (SERVER MODE)")
         print(f"📡 Kết nối tới: {SERVER_URL}")
 
         self.download_model()
         
         # Cấu hình Camera
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        # Webcam hoặc FrameSource (video / thư mục ảnh / synthetic), xem sources.open_source
+        self.cap = source if source is not None else open_source(FRAME_SOURCE, size=(1280, 720))
 
         # Khởi tạo AI
         self.detector = cv2.FaceDetectorYN.create(YUNET_MODEL, "", (320, 320), 0.7, 0.3)
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        self.face_detector = ScaledFaceDetector(self.detector, DETECT_MAX_SIDE)
+        self.tracker = FaceTracker()
+        self.rules = BehaviorRules(**RULE_PROFILES["a"])
+        # Nhịp detect tự chỉnh theo độ trễ; xác minh lại danh tính theo nhịp "identify"
+        self.scheduler = AnalysisScheduler()
+        # Phòng trống / cảnh tĩnh: bỏ detect, hết giờ học thì đọc camera chậm lại
+        self.motion = MotionGate()
+        # Tăng / giảm độ phân giải camera theo kích thước mặt thực tế, không cần restart
+        self.resolution = ResolutionController(start=capture_size(self.cap) or (1280, 720), detector=self.face_detector)
+        self.recognizer = create_backend(RECOGNIZER_BACKEND, YUNET_MODEL)
         
         self.labels = {}
         self.uniforms = {}
         self.load_data()
+        # Đăng ký nóng: thêm ảnh vào faces_db là nhận diện được ngay, không cần restart
+        self.enrollment = EnrollmentWatcher(
+            DATASET_DIR, lambda: self.recognizer,
+            lambda: create_backend(RECOGNIZER_BACKEND, YUNET_MODEL), self.swap_recognizer
+        ).start()
         
         self.running = True
+        # 1 thread + 1 session keep-alive gửi batch sự kiện lên server
+        self.uploader = EventUploader(f"{SERVER_URL}/api")
         
         # Biến chống spam (Cache)
-        self.logged_attendance = set()
-        self.logged_uniform = set()
-        self.violation_cooldown = {}
+        # Điểm danh / đồng phục: 1 lần mỗi ngày; hành vi: 30s mỗi (tên, loại)
+        self.cooldowns = CooldownStore(daily_reset=True)
 
     def download_model(self):
         if not os.path.exists(YUNET_MODEL):
@@ -59,139 +86,121 @@ class SmartMonitor:
         except: pass
 
         # Load khuôn mặt
-        faces, ids = [], []
-        idx = 0
-        for name in os.listdir(DATASET_DIR):
-            p = os.path.join(DATASET_DIR, name)
-            if not os.path.isdir(p): continue
-            
-            self.labels[idx] = name
-            has_img = False
-            for img in os.listdir(p):
-                if img.endswith(('jpg','png','jpeg')):
-                    g = cv2.imread(os.path.join(p, img), cv2.IMREAD_GRAYSCALE)
-                    if g is not None:
-                        faces.append(cv2.resize(g, (200, 200)))
-                        ids.append(idx)
-                        has_img = True
-            if has_img: idx += 1
-
-        if faces:
-            self.recognizer.train(faces, np.array(ids))
+        self.labels = self.recognizer.train(DATASET_DIR)
+        if self.labels:
             print(f"✅ Đã học dữ liệu của {len(self.labels)} sinh viên.")
 
+    def swap_recognizer(self, backend):
+        # Gán tham chiếu là nguyên tử: frame đang xử lý dùng model cũ, frame sau dùng model mới
+        self.recognizer = backend
+        self.labels = backend.labels
+        print(f"✅ Đã cập nhật dữ liệu: {len(self.labels)} sinh viên")
+
     # --- GỬI DỮ LIỆU LÊN SERVER ---
     def send_api(self, endpoint, data):
-        def _req():
-            try:
-                requests.post(f"{SERVER_URL}/api/{endpoint}", json=data, timeout=2)
-                # print(f"📡 Gửi {endpoint}: {data}") # Bật dòng này nếu muốn xem log chi tiết
-            except: 
-                pass # Lỗi mạng thì bỏ qua, không làm lag camera
-        threading.Thread(target=_req).start()
+        # Chỉ đưa vào hàng đợi, uploader gom batch và gửi ở nền -> không làm lag camera
+        return self.uploader.send(endpoint, data)
 
     def handle_attendance(self, name):
-        if name in self.logged_attendance: return
-        self.logged_attendance.add(name)
+        if not self.cooldowns.allow((name, "attendance")): return
         print(f"✅ Điểm danh: {name}")
         self.send_api("attendance", {"name": name})
 
     def handle_violation(self, name, v_type):
-        now = time.time()
-        
         # 1. Sai đồng phục: Chỉ báo 1 lần duy nhất
         if "dong phuc" in v_type:
-            if name in self.logged_uniform: return
-            self.logged_uniform.add(name)
+            if not self.cooldowns.allow((name, "uniform")): return
             print(f"⚠️ Vi phạm đồng phục: {name}")
             self.send_api("report", {"name": name, "type": v_type})
             
         # 2. Mất tập trung / Ngủ: Báo lại sau mỗi 30s
         else:
-            key = f"{name}_{v_type}"
-            if key in self.violation_cooldown and (now - self.violation_cooldown[key] < 30):
+            if not self.cooldowns.allow((name, v_type), ttl=30):
                 return
-            self.violation_cooldown[key] = now
             print(f"⚠️ Vi phạm hành vi: {name} - {v_type}")
             self.send_api("report", {"name": name, "type": v_type})
 
     # --- LOGIC NHẬN DIỆN ---
-    def check_focus(self, landmarks):
-        """Kiểm tra Mất tập trung (Mũi lệch khỏi tâm 2 mắt)"""
-        x_re = landmarks[4]; x_le = landmarks[6]; x_nose = landmarks[8]
-        eye_dist = abs(x_le - x_re)
-        offset = abs(x_nose - (x_re + x_le) / 2)
-        return (offset / eye_dist) > 0.5 if eye_dist > 0 else False
-
-    def check_sleep(self, y, h):
-        """Kiểm tra Ngủ (Đầu thấp dưới 60% khung hình)"""
-        return y > h * 0.6
-
-    def check_uniform(self, frame, box):
-        x, y, w, h = box
-        roi_y = min(y + h, frame.shape[0])
-        roi_y_end = min(y + h + 80, frame.shape[0])
-        if roi_y >= roi_y_end: return "unknown"
-        
-        roi = frame[roi_y:roi_y_end, max(0, x):min(x+w, frame.shape[1])]
-        if roi.size == 0: return "unknown"
-
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, np.array([0, 0, 168]), np.array([172, 111, 255]))
-        return "white" if cv2.countNonZero(mask) / mask.size > 0.3 else "other"
+    def check_uniform(self, coverage, chest):
+        ratio = coverage.fraction(chest)
+        if ratio is None: return "unknown"
+        return "white" if ratio > UNIFORM_RATIO else "other"
+
+    def analyze(self, frame):
+        """Tầng suy luận: detect, nhận diện, check lỗi (chạy trên thread riêng)."""
+        h, w = frame.shape[:2]
+        faces = self.face_detector.detect(frame)
+        tracks = self.tracker.update(faces)
+        self.motion.note_faces(len(tracks))
+        self.resolution.observe([t.box[3] for t in tracks], frame.shape[1::-1])
+
+        # 1. Nhận diện (1 batch cho các track mới / đến hạn xác minh lại)
+        self.tracker.identify(tracks, frame, self.recognizer, reverify=self.scheduler.due("identify"))
+
+        # Vùng ngực của mọi track có tên -> 1 lần HSV + mask cho cả frame
+        chests = {t.id: chest_below(t.box, frame.shape, 80) for t in tracks if t.name != "Unknown"}
+        coverage = ColorCoverage(frame, chests.values(), *WHITE_HSV_WIDE)
+
+        # Mất tập trung / ngủ gật tính 1 lần cho mọi track
+        flags = self.rules.evaluate([t.face for t in tracks], h)
+
+        results = []
+        for t, flag in zip(tracks, flags):
+            box = list(t.box)
+            name = t.name
+
+            if name != "Unknown":
+                self.handle_attendance(name)
+                
+                violation = ""
+                # 2. Check lỗi
+                if flag[NOSE_OFFSET]:
+                    violation = "Mat tap trung"
+                elif flag[LOW_HEAD]:
+                    violation = "Ngu gat"
+                elif self.check_uniform(coverage, chests[t.id]) != "white":
+                    # Mặc định ai cũng phải mặc áo trắng
+                    violation = "Sai dong phuc"
+
+                # Gửi báo cáo (Nếu có lỗi)
+                if violation:
+                    self.handle_violation(name, violation)
+
+                results.append((box, name, violation))
+        return results
+
+    def render(self, packet):
+        """Tầng hiển thị: vẽ kết quả và imshow."""
+        if not self.running:
+            return False
+
+        if HEADLESS:
+            return True
+
+        frame = packet.frame
+        for box, name, violation in packet.result:
+            # Vẽ
+            color = (0,0,255) if violation else (0,255,0)
+            cv2.rectangle(frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), color, 2)
+            cv2.putText(frame, f"{name} {violation}", (box[0], box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        cv2.imshow("AI Monitor", frame)
+        if cv2.waitKey(1) & 0xFF == ord('q'): return False
+        return True
 
     def run(self):
-        print("📷 Camera đang chạy... (Nhấn 'q' để thoát)")
+        print("📷 Camera đang chạy... (Nhấn 'q' để thoát)" if not HEADLESS else "📷 Camera đang chạy (headless)... Ctrl+C để thoát")
         
-        while self.running:
-            ret, frame = self.cap.read()
-            if not ret: break
-
-            h, w = frame.shape[:2]
-            self.detector.setInputSize((w, h))
-            _, faces = self.detector.detect(frame)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            if faces is not None:
-                for f in faces:
-                    box = list(map(int, f[:4]))
-                    
-                    # 1. Nhận diện
-                    name = "Unknown"
-                    roi = gray[box[1]:box[1]+box[3], box[0]:box[0]+box[2]]
-                    if roi.size > 0:
-                        try:
-                            label, conf = self.recognizer.predict(cv2.resize(roi, (200, 200)))
-                            if conf < 85: name = self.labels.get(label, "Unknown")
-                        except: pass
-
-                    if name != "Unknown":
-                        self.handle_attendance(name)
-                        
-                        violation = ""
-                        # 2. Check lỗi
-                        if self.check_focus(f): 
-                            violation = "Mat tap trung"
-                        elif self.check_sleep(box[1], h):
-                            violation = "Ngu gat"
-                        elif self.check_uniform(frame, box) != "white":
-                            # Mặc định ai cũng phải mặc áo trắng
-                            violation = "Sai dong phuc"
-
-                        # Gửi báo cáo (Nếu có lỗi)
-                        if violation:
-                            self.handle_violation(name, violation)
-
-                        # Vẽ
-                        color = (0,0,255) if violation else (0,255,0)
-                        cv2.rectangle(frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), color, 2)
-                        cv2.putText(frame, f"{name} {violation}", (box[0], box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-
-            cv2.imshow("AI Monitor", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'): break
+        try:
+            FramePipeline(self.cap, self.analyze, self.render, scheduler=self.scheduler,
+                          gate=self.motion, adjust=self.resolution.apply).run()
+        except KeyboardInterrupt:
+            pass
             
+        self.uploader.close()
         self.cap.release()
-        cv2.destroyAllWindows()
+        if not HEADLESS:
+            cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     try:
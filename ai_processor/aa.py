@@ -1,5 +1,4 @@
 import cv2
-import numpy as np
 import time
 import os
 import json
@@ -8,6 +7,21 @@ import requests
 from datetime import datetime
 import secrets
 
+from pipeline import FramePipeline
+from detection import ScaledFaceDetector, DETECT_MAX_SIDE
+from tracker import FaceTracker
+from recognizers import create_backend
+from enrollment import EnrollmentWatcher
+from uploader import EventUploader
+from uniform import ColorCoverage, chest_below, WHITE_HSV_WIDE, UNIFORM_RATIO
+from rules import BehaviorRules, NOSE_OFFSET, LOW_HEAD
+from cooldown import CooldownStore
+from sources import open_source, FRAME_SOURCE
+from scheduler import AnalysisScheduler
+from motion import MotionGate
+from resolution import ResolutionController, capture_size
+from sensors import SensorPoller
+
 # ================= CẤU HÌNH SERVER & ESP =================
 SERVER_URL = "http://localhost:3000"  
 DATASET_DIR = "faces_db"
@@ -17,28 +31,97 @@ YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
 ABSENT_THRESHOLD = 1
 TEMP_THRESHOLD = 30
 
+# Backend nhận diện: "lbph" hoặc "sface"
+RECOGNIZER_BACKEND = "lbph"
+
+# Không vẽ / imshow (máy không màn hình): HEADLESS=1 python aa.py
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"
+
+# Nhịp gửi lệnh LED tối đa mà ESP8266 chịu được
+LED_MIN_INTERVAL = 0.5     # Giây giữa 2 lệnh LED liên tiếp
+LED_RETRY_INTERVAL = 2.0   # Giây chờ gửi lại khi ESP không phản hồi
+
 
 
 # ================= CLASS ĐIỀU KHIỂN ESP8266 =================
 class ESP8266Controller:
+    """
+    1 thread gửi lệnh LED duy nhất, trên session keep-alive riêng của thread đó
+    (requests.Session không an toàn đa luồng: SensorPoller đọc DHT11 qua sensor_session):
+    - led() chỉ ghi trạng thái mong muốn (O(1)), gọi bao nhiêu lần mỗi frame cũng được
+    - thread chỉ gửi trạng thái mới nhất, bỏ qua nếu ESP đã ở đúng trạng thái đó
+    - tối đa 1 lệnh / LED_MIN_INTERVAL giây
+    """
+
     def __init__(self):
         self.auth = (ESP_USER, ESP_PASS)
         self.connection_status = False
-        self.lock = threading.Lock()
+        self.session = requests.Session()          # Chỉ thread LED dùng
+        self.session.auth = self.auth
+        self.sensor_session = requests.Session()   # Chỉ thread SensorPoller dùng
+        self.sensor_session.auth = self.auth
+
+        self.cond = threading.Condition()
+        self.target = (False, False)     # (red, yellow) mà camera muốn
+        self.current = None              # Trạng thái ESP đã xác nhận (None = chưa biết)
+        self.sent_count = 0
+        self.running = True
+        self.worker = threading.Thread(target=self._led_loop, daemon=True)
+        self.worker.start()
 
     def led(self, red=False, yellow=False):
-        def _send():
-            with self.lock:
-                try:
-                    requests.post(f"http://{ESP_IP}/led", json={"red": red, "yellow": yellow}, auth=self.auth, timeout=1)
-                    self.connection_status = True
-                except:
-                    self.connection_status = False
-        threading.Thread(target=_send).start()
+        state = (bool(red), bool(yellow))
+        with self.cond:
+            if state != self.target:
+                self.target = state
+                self.cond.notify()
+
+    def _led_loop(self):
+        last_send = 0
+        while True:
+            with self.cond:
+                while self.running and self.target == self.current:
+                    self.cond.wait()
+                if not self.running:
+                    return
+
+            # Giới hạn nhịp: các lệnh đến trong lúc chờ chỉ giữ lại lệnh cuối
+            wait = LED_MIN_INTERVAL - (time.time() - last_send)
+            if wait > 0:
+                time.sleep(wait)
+            with self.cond:
+                state = self.target
+            if state == self.current:
+                continue
+
+            red, yellow = state
+            last_send = time.time()
+            try:
+                r = self.session.post(f"http://{ESP_IP}/led", json={"red": red, "yellow": yellow}, timeout=1)
+            except:
+                self.connection_status = False
+                time.sleep(LED_RETRY_INTERVAL)
+                continue
+            # ESP trả lỗi (401, 500...) -> đèn chưa đổi, giữ current cũ để gửi lại
+            self.connection_status = r.ok
+            if r.ok:
+                self.current = state
+                self.sent_count += 1
+            else:
+                print(f"⚠ ESP từ chối lệnh LED ({r.status_code})")
+                time.sleep(LED_RETRY_INTERVAL)
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.worker.join(timeout=2)
+        self.session.close()
+        self.sensor_session.close()
 
     def get_temp_humidity(self):
         try:
-            r = requests.get(f"http://{ESP_IP}/dht11", auth=self.auth, timeout=1)
+            r = self.sensor_session.get(f"http://{ESP_IP}/dht11", timeout=1)
             if r.status_code == 200:
                 j = r.json()
                 return j.get("temp"), j.get("humidity")
@@ -48,30 +131,49 @@ class ESP8266Controller:
 
 # ================= CLASS XỬ LÝ AI =================
 class SmartMonitor:
-    def __init__(self):
+    def __init__(self, source=None):
         print("▶ SMART CLASSROOM – AI CLIENT (ADVANCED LOGIC)")
         print(f"📡 Server: {SERVER_URL}")
 
         self.download_model_if_needed()
 
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        # Webcam hoặc FrameSource (video / thư mục ảnh / synthetic), xem sources.open_source
+        self.cap = source if source is not None else open_source(FRAME_SOURCE, size=(1280, 720))
 
         self.detector = cv2.FaceDetectorYN.create(YUNET_MODEL, "", (320, 320), 0.7, 0.3)
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        self.face_detector = ScaledFaceDetector(self.detector, DETECT_MAX_SIDE)
+        self.tracker = FaceTracker()
+        self.rules = BehaviorRules()
+        # Nhịp detect tự chỉnh theo độ trễ; xác minh lại danh tính theo nhịp "identify"
+        self.scheduler = AnalysisScheduler()
+        # Phòng trống / cảnh tĩnh: bỏ detect, hết giờ học thì đọc camera chậm lại
+        self.motion = MotionGate()
+        # Tăng / giảm độ phân giải camera theo kích thước mặt thực tế, không cần restart
+        self.resolution = ResolutionController(start=capture_size(self.cap) or (1280, 720), detector=self.face_detector)
+        self.recognizer = create_backend(RECOGNIZER_BACKEND, YUNET_MODEL)
         
         self.labels = {}
         self.uniforms = {}
         self.load_faces()
+        # Đăng ký nóng: thêm ảnh vào faces_db là nhận diện được ngay, không cần restart
+        self.enrollment = EnrollmentWatcher(
+            DATASET_DIR, lambda: self.recognizer,
+            lambda: create_backend(RECOGNIZER_BACKEND, YUNET_MODEL), self.swap_recognizer
+        ).start()
 
         self.esp = ESP8266Controller()
+        # 1 thread + 1 session keep-alive gửi batch sự kiện lên server
+        self.uploader = EventUploader(f"{SERVER_URL}/api")
+        # Đọc DHT11 + gửi môi trường ở thread nền, ESP mất kết nối không làm đứng hình
+        self.sensors = SensorPoller(
+            self.esp.get_temp_humidity, interval=10,
+            on_reading=lambda r: self.api_send_env(r.temp, r.humidity)
+        ).start()
         self.running = True
 
         # === DANH SÁCH CHẶN SPAM ===
-        self.logged_attendance = set()
-        self.logged_uniform = set()
-        self.violation_cooldown = {}
+        # Điểm danh / đồng phục: 1 lần mỗi ngày; hành vi: 30s mỗi (tên, loại)
+        self.cooldowns = CooldownStore(daily_reset=True)
 
     def download_model_if_needed(self):
         if not os.path.exists(YUNET_MODEL):
@@ -81,205 +183,154 @@ class SmartMonitor:
                 f.write(requests.get(url).content)
 
     def load_faces(self):
-        faces, ids = [], []
-        idx = 0
-        
         if os.path.exists(os.path.join(DATASET_DIR, "metadata.json")):
             try:
                 with open(os.path.join(DATASET_DIR, "metadata.json"), "r") as f:
                     self.uniforms = json.load(f).get("uniforms", {})
             except: pass
 
-        if not os.path.exists(DATASET_DIR): os.makedirs(DATASET_DIR)
+        self.labels = self.recognizer.train(DATASET_DIR)
 
-        for name in os.listdir(DATASET_DIR):
-            p = os.path.join(DATASET_DIR, name)
-            if not os.path.isdir(p): continue
-            
-            self.labels[idx] = name
-            has_img = False
-            for img_path in os.listdir(p):
-                if img_path.lower().endswith(('jpg','png','jpeg')):
-                    g = cv2.imread(os.path.join(p, img_path), cv2.IMREAD_GRAYSCALE)
-                    if g is not None:
-                        faces.append(cv2.resize(g, (200, 200)))
-                        ids.append(idx)
-                        has_img = True
-            if has_img: idx += 1
-
-        if faces:
-            self.recognizer.train(faces, np.array(ids))
-            print(f"✅ Đã load {len(self.labels)} sinh viên.")
+        if self.labels:
+            print(f"✅ Đã load {len(self.labels)} sinh viên ({self.recognizer.name}).")
         else:
             print("⚠️ Chưa có dữ liệu khuôn mặt!")
 
+    def swap_recognizer(self, backend):
+        # Gán tham chiếu là nguyên tử: frame đang xử lý dùng model cũ, frame sau dùng model mới
+        self.recognizer = backend
+        self.labels = backend.labels
+        print(f"✅ Đã cập nhật dữ liệu: {len(self.labels)} sinh viên")
+
     # --- HÀM GỬI API ---
     def api_send_attendance(self, name):
-        if name in self.logged_attendance: return
-        self.logged_attendance.add(name)
+        if not self.cooldowns.allow((name, "attendance")): return
 
-        def _req():
-            try:
-                print(f"⬆️ Đang gửi điểm danh: {name}")
-                requests.post(f"{SERVER_URL}/api/attendance", json={"name": name}, timeout=2)
-                print(f"✅ Điểm danh thành công: {name}")
-            except: pass
-        threading.Thread(target=_req).start()
+        print(f"⬆️ Đang gửi điểm danh: {name}")
+        self.uploader.send("attendance", {"name": name})
 
     def api_send_violation(self, name, v_type):
-        now = time.time()
         if "dong phuc" in v_type or "Đồng phục" in v_type:
-            if name in self.logged_uniform: return
-            self.logged_uniform.add(name)
+            if not self.cooldowns.allow((name, "uniform")): return
         else:
-            key = f"{name}_{v_type}"
-            if key in self.violation_cooldown and (now - self.violation_cooldown[key] < 30):
+            if not self.cooldowns.allow((name, v_type), ttl=30):
                 return
-            self.violation_cooldown[key] = now
 
-        def _req():
-            try:
-                print(f"⬆️ Đang gửi cảnh báo: {name} - {v_type}")
-                requests.post(f"{SERVER_URL}/api/report", json={"name": name, "type": v_type}, timeout=2)
-            except: pass
-        threading.Thread(target=_req).start()
+        print(f"⬆️ Đang gửi cảnh báo: {name} - {v_type}")
+        self.uploader.send("report", {"name": name, "type": v_type})
 
     def api_send_env(self, temp, hum):
-        def _req():
-            try:
-                requests.post(f"{SERVER_URL}/api/env", json={"temp": temp, "hum": hum}, timeout=2)
-            except: pass
-        threading.Thread(target=_req).start()
+        self.uploader.send("env", {"temp": temp, "hum": hum})
 
     # --- LOGIC NHẬN DIỆN & KIỂM TRA ---
-    def recognize(self, gray, box):
-        x, y, w, h = box
-        roi = gray[y:y+h, x:x+w]
-        if roi.size == 0: return "Unknown"
-        try:
-            roi = cv2.resize(roi, (200, 200))
-            label, conf = self.recognizer.predict(roi)
-            if conf < 85: return self.labels.get(label, "Unknown")
-        except: pass
-        return "Unknown"
-
-    def check_uniform(self, frame, box):
-        x, y, w, h = box
-        roi_y = min(y + h, frame.shape[0])
-        roi_y_end = min(y + h + 80, frame.shape[0])
-        if roi_y >= roi_y_end: return "unknown"
-        
-        roi = frame[roi_y:roi_y_end, max(0, x):min(x+w, frame.shape[1])]
-        if roi.size == 0: return "unknown"
-
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        lower = np.array([0, 0, 168])
-        upper = np.array([172, 111, 255])
-        mask = cv2.inRange(hsv, lower, upper)
-        return "white" if cv2.countNonZero(mask) / mask.size > 0.3 else "other"
-
-    def check_turning_head_landmarks(self, face_data):
-        """
-        Sử dụng Landmarks để phát hiện quay đầu chính xác.
-        YuNet landmarks:
-        - 4,5: Mắt phải (Right Eye)
-        - 6,7: Mắt trái (Left Eye)
-        - 8,9: Mũi (Nose Tip)
-        """
-        x_re = face_data[4] # Right eye X
-        x_le = face_data[6] # Left eye X
-        x_nose = face_data[8] # Nose X
-
-        # Khoảng cách giữa 2 mắt
-        eye_distance = abs(x_le - x_re)
-        if eye_distance == 0: return False
-
-        # Trung điểm của 2 mắt
-        x_mid = (x_re + x_le) / 2
-
-        # Độ lệch của mũi so với trung điểm
-        nose_offset = abs(x_nose - x_mid)
-
-        # Nếu mũi lệch quá 40% so với khoảng cách 2 mắt -> Quay đầu
-        # (Bình thường mũi ở giữa, offset gần 0)
-        ratio = nose_offset / eye_distance
-        
-        return ratio > 0.45  # Ngưỡng (0.4 - 0.5 là hợp lý)
+    def check_uniform(self, coverage, chest):
+        ratio = coverage.fraction(chest)
+        if ratio is None: return "unknown"
+        return "white" if ratio > UNIFORM_RATIO else "other"
+
+    def analyze(self, frame):
+        """Tầng suy luận: detect, nhận diện, check lỗi và gửi API (chạy trên thread riêng)."""
+        h, w = frame.shape[:2]
+        faces = self.face_detector.detect(frame)
+        tracks = self.tracker.update(faces)
+        self.motion.note_faces(len(tracks))
+        self.resolution.observe([t.box[3] for t in tracks], frame.shape[1::-1])
+
+        # === 1. NHẬN DIỆN (1 batch cho các track mới / đến hạn xác minh lại) ===
+        self.tracker.identify(tracks, frame, self.recognizer, reverify=self.scheduler.due("identify"))
+
+        # Vùng ngực của mọi track có tên -> 1 lần HSV + mask cho cả frame
+        chests = {t.id: chest_below(t.box, frame.shape, 80) for t in tracks if t.name != "Unknown"}
+        coverage = ColorCoverage(frame, chests.values(), *WHITE_HSV_WIDE)
+
+        # Mọi luật hành vi tính 1 lần trên ma trận faces của các track
+        flags = self.rules.evaluate([t.face for t in tracks], h)
+
+        results = []
+        red = yellow = clean = False
+        for t, flag in zip(tracks, flags):
+            # f[:4] là bounding box, f[4:14] là 5 landmarks
+            f = t.face
+            box = list(t.box)
+            name = t.name
+            violation = ""
+            
+            if name != "Unknown":
+                self.api_send_attendance(name)
+
+                # === 2. CHECK LỖI (LOGIC MỚI) ===
+                
+                # A. Quay đầu (mũi lệch khỏi trung điểm 2 mắt)
+                if flag[NOSE_OFFSET]:
+                    violation = "Gian lan (Quay dau)"
+                    red = True
+                
+                # B. Ngủ gật (Đầu cúi thấp)
+                elif flag[LOW_HEAD]:
+                    violation = "Ngu gat"
+                    yellow = True
+                
+                # C. Đồng phục
+                else:
+                    u_color = self.check_uniform(coverage, chests[t.id])
+                    if u_color != "unknown" and u_color != "white":
+                        violation = "Sai dong phuc"
+                
+                if violation:
+                    self.api_send_violation(name, violation)
+                else:
+                    clean = True
+
+            results.append((box, f[4:10], name, violation))
+
+        # 1 trạng thái LED cho cả frame; ESP8266Controller tự bỏ lệnh trùng và giới hạn nhịp
+        if red or yellow:
+            self.esp.led(red=red, yellow=yellow)
+        elif clean and int(time.time()) % 5 == 0:
+            self.esp.led(red=False, yellow=False)
+        return results
+
+    def render(self, packet):
+        """Tầng hiển thị: vẽ kết quả và imshow (môi trường đã gửi ở SensorPoller)."""
+        if not self.running:
+            return False
+        if HEADLESS:
+            return True
+
+        frame = packet.frame
+        for box, lm, name, violation in packet.result:
+            # Vẽ hình
+            color = (0, 0, 255) if violation else (0, 255, 0)
+            cv2.rectangle(frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), color, 2)
+            
+            # Vẽ landmarks (Mắt, Mũi) để debug
+            cv2.circle(frame, (int(lm[0]), int(lm[1])), 2, (255, 0, 0), -1) # Mắt phải
+            cv2.circle(frame, (int(lm[2]), int(lm[3])), 2, (0, 0, 255), -1) # Mắt trái
+            cv2.circle(frame, (int(lm[4]), int(lm[5])), 2, (0, 255, 255), -1) # Mũi
+
+            label = f"{name}"
+            if violation: label += f" - {violation}"
+            cv2.putText(frame, label, (box[0], box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        cv2.imshow("AI Client", frame)
+        if cv2.waitKey(1) & 0xFF == ord("q"): return False
+        return True
 
     def run(self):
-        last_env_time = 0
-        print("📷 Camera đang chạy... Nhấn 'q' để thoát.")
+        print("📷 Camera đang chạy... Nhấn 'q' để thoát." if not HEADLESS else "📷 Camera đang chạy (headless)... Ctrl+C để thoát.")
         
-        while self.running:
-            ret, frame = self.cap.read()
-            if not ret: break
-
-            h, w = frame.shape[:2]
-            self.detector.setInputSize((w, h))
-            _, faces = self.detector.detect(frame)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            if faces is not None:
-                for f in faces:
-                    # f[:4] là bounding box, f[4:14] là 5 landmarks
-                    box = list(map(int, f[:4]))
-                    
-                    # === 1. NHẬN DIỆN ===
-                    name = self.recognize(gray, box)
-                    
-                    if name != "Unknown":
-                        self.api_send_attendance(name)
-
-                        violation = ""
-                        
-                        # === 2. CHECK LỖI (LOGIC MỚI) ===
-                        
-                        # A. Quay đầu (Dùng Landmarks - Chính xác hơn)
-                        if self.check_turning_head_landmarks(f):
-                            violation = "Gian lan (Quay dau)"
-                            self.esp.led(red=True)
-                        
-                        # B. Ngủ gật (Đầu cúi thấp)
-                        elif box[1] > h * 0.6:
-                            violation = "Ngu gat"
-                            self.esp.led(yellow=True)
-                        
-                        # C. Đồng phục
-                        else:
-                            u_color = self.check_uniform(frame, box)
-                            if u_color != "unknown" and u_color != "white":
-                                violation = "Sai dong phuc"
-                        
-                        if violation:
-                            self.api_send_violation(name, violation)
-                        else:
-                            if int(time.time()) % 5 == 0: 
-                                self.esp.led(red=False, yellow=False)
-
-                    # Vẽ hình
-                    color = (0, 0, 255) if violation else (0, 255, 0)
-                    cv2.rectangle(frame, (box[0], box[1]), (box[0]+box[2], box[1]+box[3]), color, 2)
-                    
-                    # Vẽ landmarks (Mắt, Mũi) để debug
-                    cv2.circle(frame, (int(f[4]), int(f[5])), 2, (255, 0, 0), -1) # Mắt phải
-                    cv2.circle(frame, (int(f[6]), int(f[7])), 2, (0, 0, 255), -1) # Mắt trái
-                    cv2.circle(frame, (int(f[8]), int(f[9])), 2, (0, 255, 255), -1) # Mũi
-
-                    label = f"{name}"
-                    if violation: label += f" - {violation}"
-                    cv2.putText(frame, label, (box[0], box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-
-            # Gửi môi trường
-            if time.time() - last_env_time > 10:
-                t, hmd = self.esp.get_temp_humidity()
-                if t: self.api_send_env(t, hmd)
-                last_env_time = time.time()
-
-            cv2.imshow("AI Client", frame)
-            if cv2.waitKey(1) & 0xFF == ord("q"): break
+        try:
+            FramePipeline(self.cap, self.analyze, self.render, scheduler=self.scheduler,
+                          gate=self.motion, adjust=self.resolution.apply).run()
+        except KeyboardInterrupt:
+            pass
 
+        self.sensors.stop()
+        self.esp.close()
+        self.uploader.close()
         self.cap.release()
-        cv2.destroyAllWindows()
+        if not HEADLESS:
+            cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     try:
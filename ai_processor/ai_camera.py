@@ -1,47 +1,80 @@
 import cv2
-import numpy as np
 import requests
 import os
 import time
 import signal
 import sys
 
+from pipeline import FramePipeline
+from detection import ScaledFaceDetector, DETECT_MAX_SIDE
+from tracker import FaceTracker
+from recognizers import create_backend
+from enrollment import EnrollmentWatcher
+from uploader import EventUploader
+from uniform import ColorCoverage, clip_rect, BLUE_HSV
+from rules import BehaviorRules, RULE_PROFILES, ASPECT, LOW_HEAD
+from cooldown import CooldownStore
+from sources import open_source, FRAME_SOURCE
+from scheduler import AnalysisScheduler
+from motion import MotionGate
+from resolution import ResolutionController, capture_size
+
 # ================= CẤU HÌNH =================
 NODE_API = "http://localhost:3000/api"
 
 YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
 DATASET_DIR = "faces_db"
+RECOGNIZER_BACKEND = "lbph"   # "lbph" | "sface"
 
 SEND_INTERVAL = 3        # giây, chống spam report
 ATTENDANCE_INTERVAL = 10
 
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"   # không vẽ / imshow (máy không màn hình)
+
+UNIFORM_RATIO = 0.25     # tỉ lệ pixel áo xanh (uniform.BLUE_HSV) tối thiểu trong vùng ngực
+
 # ============================================
 
 
 class AICamera:
-    def __init__(self):
+    def __init__(self, source=None):
         print("🚀 AI Camera khởi động (Server-centered)")
 
         self.running = True
         signal.signal(signal.SIGINT, self.stop)
 
         self.last_report_time = 0
-        self.last_attendance_time = {}
-        self.attended_today = set()
+        self.attendance_cooldown = CooldownStore(ttl=ATTENDANCE_INTERVAL, daily_reset=True)
+
+        # Gửi sự kiện ở nền (batch + keep-alive), vòng lặp camera không chờ mạng
+        self.uploader = EventUploader(NODE_API)
 
         self.download_model_if_missing()
 
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        # Webcam hoặc FrameSource (video / thư mục ảnh / synthetic), xem sources.open_source
+        self.cap = source if source is not None else open_source(FRAME_SOURCE, size=(640, 480))
 
         self.detector = cv2.FaceDetectorYN.create(
             YUNET_MODEL, "", (320, 320), 0.7, 0.3, 5000
         )
-
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        self.face_detector = ScaledFaceDetector(self.detector, DETECT_MAX_SIDE)
+        self.tracker = FaceTracker()
+        self.rules = BehaviorRules(**RULE_PROFILES["ai_camera"])
+        # Nhịp detect tự chỉnh theo độ trễ; xác minh lại danh tính theo nhịp "identify"
+        self.scheduler = AnalysisScheduler()
+        # Phòng trống / cảnh tĩnh: bỏ detect, hết giờ học thì đọc camera chậm lại
+        self.motion = MotionGate()
+        # Tăng / giảm độ phân giải camera theo kích thước mặt thực tế, không cần restart
+        self.resolution = ResolutionController(start=capture_size(self.cap) or (640, 480), detector=self.face_detector)
+
+        self.recognizer = create_backend(RECOGNIZER_BACKEND, YUNET_MODEL)
         self.labels = {}
         self.load_trained_data()
+        # Đăng ký nóng: thêm ảnh vào faces_db là nhận diện được ngay, không cần restart
+        self.enrollment = EnrollmentWatcher(
+            DATASET_DIR, lambda: self.recognizer,
+            lambda: create_backend(RECOGNIZER_BACKEND, YUNET_MODEL), self.swap_recognizer
+        ).start()
 
     # ================= SYSTEM =================
     def stop(self, sig, frame):
@@ -49,9 +82,11 @@ class AICamera:
         self.running = False
 
     def cleanup(self):
+        self.uploader.close()
         if self.cap.isOpened():
             self.cap.release()
-        cv2.destroyAllWindows()
+        if not HEADLESS:
+            cv2.destroyAllWindows()
         sys.exit(0)
 
     # ================= MODEL =================
@@ -64,138 +99,116 @@ class AICamera:
                 f.write(r.content)
 
     def load_trained_data(self):
-        if not os.path.exists(DATASET_DIR):
-            os.makedirs(DATASET_DIR)
-            return
-
-        faces, ids = [], []
-        idx = 0
-
-        for name in os.listdir(DATASET_DIR):
-            person_dir = os.path.join(DATASET_DIR, name)
-            if not os.path.isdir(person_dir):
-                continue
-
-            self.labels[idx] = name
-            for img_name in os.listdir(person_dir):
-                if img_name.lower().endswith(("jpg", "png")):
-                    img = cv2.imread(os.path.join(person_dir, img_name), cv2.IMREAD_GRAYSCALE)
-                    if img is not None:
-                        img = cv2.resize(img, (200, 200))
-                        faces.append(img)
-                        ids.append(idx)
-            idx += 1
-
-        if faces:
-            self.recognizer.train(faces, np.array(ids))
+        self.labels = self.recognizer.train(DATASET_DIR)
+        if self.labels:
             print(f"✅ Load {len(self.labels)} sinh viên")
 
+    def swap_recognizer(self, backend):
+        # Gán tham chiếu là nguyên tử: frame đang xử lý dùng model cũ, frame sau dùng model mới
+        self.recognizer = backend
+        self.labels = backend.labels
+        print(f"✅ Đã cập nhật dữ liệu: {len(self.labels)} sinh viên")
+
     # ================= API =================
     def send_report(self, name, violation):
         now = time.time()
         if now - self.last_report_time < SEND_INTERVAL:
             return
 
-        try:
-            requests.post(
-                f"{NODE_API}/report",
-                json={"name": name, "type": violation},
-                timeout=1
-            )
-            self.last_report_time = now
-            print(f"🚨 {name}: {violation}")
-        except:
-            pass
+        self.uploader.send("report", {"name": name, "type": violation})
+        self.last_report_time = now
+        print(f"🚨 {name}: {violation}")
 
     def send_attendance(self, name):
-        now = time.time()
-        last = self.last_attendance_time.get(name, 0)
-
-        if now - last < ATTENDANCE_INTERVAL:
+        if not self.attendance_cooldown.allow((name, "attendance")):
             return
 
-        try:
-            requests.post(
-                f"{NODE_API}/attendance",
-                json={"name": name},
-                timeout=1
-            )
-            self.last_attendance_time[name] = now
-            print(f"✅ Điểm danh: {name}")
-        except:
-            pass
+        self.uploader.send("attendance", {"name": name})
+        print(f"✅ Điểm danh: {name}")
 
     # ================= UNIFORM =================
-    def check_uniform(self, frame, box):
+    def chest_rect(self, frame, box):
         x, y, w, h = box
         chest_y = y + int(h * 0.6)
         chest_h = int(h * 0.3)
 
+        # Ra ngoài khung hình -> không kiểm tra (coi như đúng đồng phục)
         if chest_y + chest_h > frame.shape[0]:
+            return None
+        return clip_rect(x, chest_y, x + w, chest_y + chest_h, frame.shape)
+
+    def check_uniform(self, coverage, chest):
+        ratio = coverage.fraction(chest)
+        if ratio is None:
             return True
+        return ratio > UNIFORM_RATIO
 
-        chest = frame[chest_y:chest_y + chest_h, x:x + w]
-        hsv = cv2.cvtColor(chest, cv2.COLOR_BGR2HSV)
+    # ================= MAIN =================
+    def analyze(self, frame):
+        """Tầng suy luận: detect, nhận diện, check vi phạm (chạy trên thread riêng)."""
+        h, w = frame.shape[:2]
+        faces = self.face_detector.detect(frame)
 
-        lower = np.array([90, 50, 50])   # xanh đồng phục
-        upper = np.array([130, 255, 255])
+        tracks = self.tracker.update(faces)
+        self.motion.note_faces(len(tracks))
+        self.resolution.observe([t.box[3] for t in tracks], frame.shape[1::-1])
 
-        mask = cv2.inRange(hsv, lower, upper)
-        ratio = cv2.countNonZero(mask) / (chest.size / 3)
+        # Nhận diện 1 batch: chỉ track mới sinh ra hoặc đến hạn xác minh lại
+        self.tracker.identify(tracks, frame, self.recognizer, reverify=self.scheduler.due("identify"))
 
-        return ratio > 0.25
+        # 1 lần HSV + mask cho vùng ngực của mọi track có tên
+        chests = {t.id: self.chest_rect(frame, t.box) for t in tracks if t.name != "Unknown"}
+        coverage = ColorCoverage(frame, chests.values(), *BLUE_HSV)
 
-    # ================= MAIN =================
-    def run(self):
-        while self.running:
-            ret, frame = self.cap.read()
-            if not ret:
-                break
-
-            h, w = frame.shape[:2]
-            self.detector.setInputSize((w, h))
-            _, faces = self.detector.detect(frame)
-
-            if faces is not None:
-                for f in faces:
-                    box = list(map(int, f[:4]))
-                    name = "Unknown"
-
-                    roi = frame[box[1]:box[1]+box[3], box[0]:box[0]+box[2]]
-                    if roi.size > 0:
-                        g = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-                        g = cv2.resize(g, (200, 200))
-                        label, conf = self.recognizer.predict(g)
-                        if conf < 85:
-                            name = self.labels[label]
-
-                    if name != "Unknown":
-                        self.send_attendance(name)
-
-                    violation = ""
-
-                    ratio = box[2] / box[3]
-                    if ratio < 0.65:
-                        violation = "Gian lan (Quay dau)"
-                    elif box[1] > h * 0.65:
-                        violation = "Ngu gat"
-                    elif name != "Unknown" and not self.check_uniform(frame, box):
-                        violation = "Sai dong phuc"
-
-                    color = (0, 255, 0)
-                    if violation:
-                        color = (0, 0, 255)
-                        self.send_report(name, violation)
-
-                    cv2.rectangle(frame, (box[0], box[1]),
-                                  (box[0]+box[2], box[1]+box[3]), color, 2)
-                    cv2.putText(frame, name, (box[0], box[1]-10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-
-            cv2.imshow("AI Camera System", frame)
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                self.running = False
+        flags = self.rules.evaluate([t.face for t in tracks], h)
+
+        results = []
+        for t, flag in zip(tracks, flags):
+            box = list(t.box)
+            name = t.name
+
+            if name != "Unknown":
+                self.send_attendance(name)
+
+            violation = ""
+
+            if flag[ASPECT]:
+                violation = "Gian lan (Quay dau)"
+            elif flag[LOW_HEAD]:
+                violation = "Ngu gat"
+            elif name != "Unknown" and not self.check_uniform(coverage, chests[t.id]):
+                violation = "Sai dong phuc"
+
+            if violation:
+                self.send_report(name, violation)
 
+            results.append((box, name, violation))
+        return results
+
+    def render(self, packet):
+        """Tầng hiển thị: vẽ kết quả và imshow."""
+        if not self.running:
+            return False
+        if HEADLESS:
+            return True
+
+        frame = packet.frame
+        for box, name, violation in packet.result:
+            color = (0, 0, 255) if violation else (0, 255, 0)
+            cv2.rectangle(frame, (box[0], box[1]),
+                          (box[0]+box[2], box[1]+box[3]), color, 2)
+            cv2.putText(frame, name, (box[0], box[1]-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+        cv2.imshow("AI Camera System", frame)
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            self.running = False
+            return False
+        return True
+
+    def run(self):
+        FramePipeline(self.cap, self.analyze, self.render, scheduler=self.scheduler,
+                      gate=self.motion, adjust=self.resolution.apply).run()
         self.cleanup()
 
 
@@ -0,0 +1,149 @@
+import os
+import json
+
+import cv2
+
+from detection import ScaledFaceDetector, TiledFaceDetector, DETECT_MAX_SIDE, TILE_OVERVIEW_SIDE
+from uniform import ColorCoverage, chest_below, WHITE_HSV, UNIFORM_RATIO
+from rules import ASPECT, LOW_HEAD
+from metrics import STAGE_SECONDS, FACES_PER_FRAME
+
+# ================= CẤU HÌNH PHÂN TÍCH =================
+# Dùng chung cho iot1 (SmartMonitor) và benchmark.py -> benchmark đo đúng cấu hình chạy thật.
+# Cạnh detect: detection.DETECT_MAX_SIDE, nhịp phân tích: scheduler.ANALYSIS_RATES,
+# ngưỡng luật hành vi: rules.RULE_THRESHOLDS
+
+# Giảng đường lớn / camera 2K-4K: detect theo ô ở độ phân giải gốc (None = thu nhỏ cả frame)
+# vd {"tile": 640, "overlap": 0.25, "rois": [(0, 300, 1920, 780)], "motion_threshold": 0.01}
+DETECT_TILING = None
+
+# Nội dung vi phạm gửi qua report()
+TURN_HEAD = "GIAN LẬN (Quay đầu)"
+SLEEPING = "NGỦ GẬT"
+WRONG_UNIFORM = "SAI ĐỒNG PHỤC"
+
+
+def create_yunet(model):
+    return cv2.FaceDetectorYN.create(model, "", (320, 320), score_threshold=0.7, nms_threshold=0.3)
+
+
+def create_face_detector(model, tiling=DETECT_TILING, max_side=DETECT_MAX_SIDE):
+    """Detector theo cấu hình; detect theo ô có thêm 1 YuNet riêng cho lượt toàn cảnh."""
+    if tiling is not None:
+        overview = create_yunet(model) if tiling.get("overview_side", TILE_OVERVIEW_SIDE) else None
+        return TiledFaceDetector(create_yunet(model), overview_detector=overview, **tiling)
+    return ScaledFaceDetector(create_yunet(model), max_side)
+
+
+def load_uniforms(dataset_dir):
+    """{tên: màu đồng phục} từ metadata.json của dataset (không có -> mặc định áo trắng)."""
+    meta = os.path.join(dataset_dir, "metadata.json")
+    if not os.path.exists(meta):
+        return {}
+    with open(meta, "r", encoding="utf-8") as f:
+        return json.load(f).get("uniforms", {})
+
+
+def _stage_timer(name):
+    return STAGE_SECONDS.labels(name).time()
+
+
+class ClassroomAnalyzer:
+    """
+    Chuỗi phân tích 1 frame: detect -> track -> nhận diện -> luật hành vi / đồng phục.
+    Luật hành vi và đồng phục chạy theo nhịp scheduler (None = mọi frame).
+    Vi phạm được gửi qua report(tên, nội dung); bên gọi lo chống trùng, ESP, dashboard...
+    - recognizer: hàm trả backend hiện tại (đăng ký nóng có thể thay giữa chừng)
+    - timer(tầng): context manager đo thời gian, mặc định ghi vào STAGE_SECONDS
+    """
+
+    def __init__(self, face_detector, tracker, rules, recognizer, report, scheduler=None,
+                 motion=None, resolution=None, uniforms=None, timer=None):
+        self.face_detector = face_detector
+        self.tracker = tracker
+        self.rules = rules
+        self.recognizer = recognizer
+        self.report = report
+        self.scheduler = scheduler
+        self.motion = motion
+        self.resolution = resolution
+        self.uniforms = uniforms or {}
+        self.timer = timer or _stage_timer
+
+    def due(self, name, now=None):
+        return self.scheduler is None or self.scheduler.due(name, now)
+
+    def _observe(self, frame, tracks, now):
+        FACES_PER_FRAME.observe(len(tracks))
+        if self.motion:
+            self.motion.note_faces(len(tracks), now)
+        if self.resolution:
+            self.resolution.observe([t.box[3] for t in tracks], frame.shape[1::-1], now)
+
+    def analyze(self, frame, now=None):
+        """Tầng suy luận đầy đủ (chế độ thread / benchmark)."""
+        with self.timer("detect"):
+            faces = self.face_detector.detect(frame)
+        return self.analyze_faces(frame, faces, now)
+
+    def analyze_faces(self, frame, faces, now=None):
+        """
+        Phần sau detect: track -> nhận diện -> luật. EXECUTION_MODE = "process" gọi thẳng hàm này
+        với mặt do worker detect, nên nhận diện vẫn chỉ chạy cho track mới / đến hạn như chế độ thread.
+        """
+        tracks = self.tracker.update(faces, now)
+        self._observe(frame, tracks, now)
+        # Track mới nhận diện ngay; xác minh lại track cũ theo nhịp "identify"
+        self.tracker.identify(tracks, frame, self.recognizer(), now, reverify=self.due("identify", now))
+        return self.evaluate(frame, tracks, now)
+
+    def check_uniform(self, coverage, chest):
+        ratio = coverage.fraction(chest)
+        if ratio is None:
+            return "unknown"
+        return "white" if ratio > UNIFORM_RATIO else "other"
+
+    def evaluate(self, frame, tracks, now=None):
+        """Kiểm tra vi phạm cho các track đã có tên."""
+        h = frame.shape[0]
+        present = []
+        seen = set()
+        boxes = []
+
+        named = [t for t in tracks if t.name != "Unknown"]
+        # Luật hành vi và đồng phục chỉ chạy khi đến lượt (scheduler), frame khác chỉ cập nhật có mặt
+        behavior_due = bool(named) and self.due("behavior", now)
+        uniform_due = bool(named) and self.due("uniform", now)
+
+        if uniform_due:
+            # Vùng ngực của mọi track có tên -> 1 lần HSV + mask cho cả frame
+            with self.timer("uniform"):
+                chests = {t.id: chest_below(t.box, frame.shape, 60) for t in named}
+                coverage = ColorCoverage(frame, chests.values(), *WHITE_HSV)
+        if behavior_due:
+            with self.timer("rules"):
+                flags = self.rules.evaluate([t.face for t in tracks], h)
+
+        for i, t in enumerate(tracks):
+            x, y, bw, bh = t.box
+            name = t.name
+
+            if name != "Unknown" and name not in seen:
+                seen.add(name)
+                present.append(name)
+
+                if behavior_due and flags[i, ASPECT]:
+                    self.report(name, TURN_HEAD)
+
+                if behavior_due and flags[i, LOW_HEAD]:
+                    self.report(name, SLEEPING)
+
+                if uniform_due:
+                    uniform = self.check_uniform(coverage, chests[t.id])
+                    expected = self.uniforms.get(name, "white")
+                    if uniform != "unknown" and uniform != expected:
+                        self.report(name, WRONG_UNIFORM)
+
+            boxes.append((t.id, x, y, bw, bh, name))
+
+        return {"present": present, "boxes": boxes}
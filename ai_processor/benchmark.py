@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+from pipeline import FramePipeline
+from tracker import FaceTracker
+from recognizers import create_backend
+from rules import BehaviorRules
+from cooldown import CooldownStore
+from scheduler import AnalysisScheduler, DETECT
+from motion import MotionGate
+from sources import open_source
+from detection import DETECT_MAX_SIDE
+from analysis import ClassroomAnalyzer, create_face_detector, load_uniforms, DETECT_TILING
+
+# ================= CẤU HÌNH BENCHMARK =================
+DATASET_DIR = "faces_db"
+YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
+BENCH_TOLERANCE = 0.10        # FPS thấp hơn baseline quá 10% -> coi là regression (exit code 1)
+PERCENTILES = (50, 90, 99)
+
+
+class StageTimes:
+    """Gom thời gian từng tầng (giây) để tính phân vị khi kết thúc."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    def summary(self):
+        out = {}
+        for name, values in self.samples.items():
+            ms = np.asarray(values) * 1000
+            row = {"count": len(values)}
+            row.update({f"p{p}_ms": round(float(np.percentile(ms, p)), 2) for p in PERCENTILES})
+            row["max_ms"] = round(float(ms.max()), 2)
+            out[name] = row
+        return out
+
+
+class CountingBackend:
+    """Bọc backend nhận diện để đếm số lần gọi / số mặt đã nhận diện."""
+
+    def __init__(self, backend, times):
+        self.backend = backend
+        self.times = times
+        self.calls = 0
+        self.faces = 0
+
+    def recognize_many(self, frame, faces, gray=None):
+        self.calls += 1
+        self.faces += len(faces)
+        with self.times.stage("recognize"):
+            return self.backend.recognize_many(frame, faces, gray)
+
+
+class ReplayBenchmark:
+    """
+    Chạy lại đúng ClassroomAnalyzer của SmartMonitor (cùng cấu hình trong analysis.py:
+    detect -> track -> nhận diện -> luật hành vi -> đồng phục) trên 1 FrameSource,
+    không ESP / server / cửa sổ:
+    - sequential (mặc định): xử lý từng frame nối tiếp, nhanh hết mức, lịch theo thời gian video
+      -> kết quả lặp lại được giữa các máy / các lần chạy
+    - pipeline=True: chạy qua FramePipeline thật (thread, bỏ frame) để đo FPS hiển thị
+    Sự kiện được đếm như lúc chạy thật (mỗi (tên, loại) 1 lần) nhưng không gửi đi đâu.
+    """
+
+    def __init__(self, source, backend="lbph", max_side=DETECT_MAX_SIDE, tiling=DETECT_TILING,
+                 gate=True, schedule=True, dataset_dir=DATASET_DIR):
+        self.source = source
+        self.times = StageTimes()
+
+        self.scheduler = AnalysisScheduler() if schedule else None
+        self.motion = MotionGate() if gate else None
+
+        recognizer = create_backend(backend, YUNET_MODEL)
+        if os.path.isdir(dataset_dir):
+            recognizer.train(dataset_dir)
+        self.recognizer = CountingBackend(recognizer, self.times)
+
+        self.analyzer = ClassroomAnalyzer(
+            create_face_detector(YUNET_MODEL, tiling, max_side), FaceTracker(), BehaviorRules(),
+            lambda: self.recognizer, self.emit, scheduler=self.scheduler, motion=self.motion,
+            uniforms=load_uniforms(dataset_dir) if os.path.isdir(dataset_dir) else {},
+            timer=self.times.stage,
+        )
+
+        self.reported = CooldownStore()
+        self.events = Counter()
+        self.frames = 0
+        self.analyzed = 0
+        self.faces = 0
+
+    def emit(self, name, kind):
+        """report() của ClassroomAnalyzer: đếm sự kiện như SmartMonitor (mỗi (tên, loại) 1 lần)."""
+        if self.reported.allow((name, kind)):
+            self.events[kind] += 1
+
+    def analyze(self, frame, now):
+        result = self.analyzer.analyze(frame, now)
+        self.faces += len(result["boxes"])
+        for name in result["present"]:
+            self.emit(name, "attendance")
+        return result
+
+    def _timed_analyze(self, frame, now):
+        started = time.perf_counter()
+        self.analyze(frame, now)
+        elapsed = time.perf_counter() - started
+        self.times.add("analyze", elapsed)
+        if self.scheduler:
+            self.scheduler.record(DETECT, elapsed)
+        self.analyzed += 1
+
+    def run_sequential(self, limit=None):
+        base = time.time()
+        while limit is None or self.frames < limit:
+            with self.times.stage("capture"):
+                ok, frame = self.source.read()
+            if not ok:
+                if getattr(self.source, "finished", True):
+                    break
+                continue
+            self.frames += 1
+            # Thời gian theo video: lịch / cổng chuyển động cho cùng kết quả dù máy nhanh hay chậm
+            ts = getattr(self.source, "timestamp", None)
+            now = base + ts if ts is not None else time.time()
+
+            if self.scheduler and not self.scheduler.due(DETECT, now):
+                continue
+            if self.motion and not self.motion.admit(frame, now):
+                continue
+            self._timed_analyze(frame, now)
+
+    def run_pipeline(self, limit=None):
+        def infer(frame):
+            started = time.perf_counter()
+            result = self.analyze(frame, time.time())
+            self.times.add("analyze", time.perf_counter() - started)
+            self.analyzed += 1
+            return result
+
+        def render(packet):
+            self.frames += 1
+            self.times.add("latency", packet.latency)
+            return limit is None or self.frames < limit
+
+        self.pipeline = FramePipeline(self.source, infer, render, scheduler=self.scheduler, gate=self.motion)
+        self.pipeline.run()
+
+    def run(self, limit=None, pipeline=False):
+        started = time.perf_counter()
+        try:
+            (self.run_pipeline if pipeline else self.run_sequential)(limit)
+        finally:
+            self.source.release()
+        return self.report(time.perf_counter() - started, pipeline)
+
+    def report(self, wall, pipeline=False):
+        analyzed = max(1, self.analyzed)
+        out = {
+            "mode": "pipeline" if pipeline else "sequential",
+            "frames": self.frames,
+            "analyzed": self.analyzed,
+            "seconds": round(wall, 3),
+            "fps": round(self.frames / wall, 2) if wall > 0 else 0.0,
+            "faces_per_frame": round(self.faces / analyzed, 2),
+            "recognizer_calls_per_frame": round(self.recognizer.calls / analyzed, 3),
+            "recognized_faces_per_frame": round(self.recognizer.faces / analyzed, 3),
+            "events": dict(self.events),
+            "stages": self.times.summary(),
+        }
+        if self.motion:
+            out["gated"] = self.motion.skipped
+        if self.scheduler:
+            out["scheduler"] = self.scheduler.stats()
+        if pipeline:
+            out["pipeline"] = self.pipeline.stats()
+        return out
+
+
+def print_report(r):
+    print(f"📊 {r['mode']}: {r['frames']} frame / {r['seconds']}s = {r['fps']} FPS "
+          f"(phân tích {r['analyzed']}, bỏ qua do cổng chuyển động {r.get('gated', 0)})")
+    print(f"   Trên mỗi frame phân tích: {r['faces_per_frame']} mặt | gọi nhận diện: "
+          f"{r['recognizer_calls_per_frame']} ({r['recognized_faces_per_frame']} mặt)")
+    print(f"   Sự kiện: {r['events'] or 'không có'}")
+    print(f"   {'tầng':<10}{'số lần':>8}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'max ms':>10}")
+    for name, row in r["stages"].items():
+        print(f"   {name:<10}{row['count']:>8}"
+              + "".join(f"{row[f'p{p}_ms']:>10}" for p in PERCENTILES) + f"{row['max_ms']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay benchmark cho pipeline phân tích lớp học")
+    parser.add_argument("source", help="video, thư mục ảnh, synthetic[:WxH] hoặc index webcam")
+    parser.add_argument("--frames", type=int, default=None, help="dừng sau N frame")
+    parser.add_argument("--backend", default="lbph", choices=("lbph", "sface"))
+    parser.add_argument("--max-side", type=int, default=DETECT_MAX_SIDE, help="cạnh dài nhất khi detect")
+    # Mặc định theo DETECT_TILING như lúc chạy thật; --tiled / --no-tiled để so sánh 2 cách detect
+    tiled = parser.add_mutually_exclusive_group()
+    tiled.add_argument("--tiled", dest="tiled", action="store_true", default=None,
+                       help="detect theo ô (TiledFaceDetector, cấu hình DETECT_TILING nếu có)")
+    tiled.add_argument("--no-tiled", dest="tiled", action="store_false",
+                       help="thu nhỏ cả frame (ScaledFaceDetector) dù DETECT_TILING được bật")
+    parser.add_argument("--no-gate", action="store_true", help="tắt cổng chuyển động")
+    parser.add_argument("--no-schedule", action="store_true", help="phân tích mọi frame (không AnalysisScheduler)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="chạy qua FramePipeline nhiều thread (nguồn luôn phát đúng nhịp fps)")
+    parser.add_argument("--realtime", action="store_true", help="phát đúng nhịp fps của nguồn")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    parser.add_argument("--baseline", help="file JSON lần chạy trước; FPS giảm quá --tolerance -> exit 1")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    # Pipeline dùng đồng hồ thật cho lịch / cổng -> nguồn phải phát đúng nhịp như camera
+    source = open_source(args.source, realtime=args.realtime or args.pipeline, limit=args.frames)
+    if args.tiled is None:
+        tiling = DETECT_TILING
+    else:
+        tiling = (DETECT_TILING or {}) if args.tiled else None
+    bench = ReplayBenchmark(source, backend=args.backend, max_side=args.max_side, tiling=tiling,
+                            gate=not args.no_gate, schedule=not args.no_schedule)
+    result = bench.run(args.frames, pipeline=args.pipeline)
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã ghi {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        floor = base["fps"] * (1 - args.tolerance)
+        if result["fps"] < floor:
+            print(f"❌ Regression: {result['fps']} FPS < {floor:.2f} (baseline {base['fps']})")
+            return 1
+        print(f"✅ Không regression: {result['fps']} FPS (baseline {base['fps']})")
+    return 0
+
+
+if __name__ == "__main__":
+    # python benchmark.py clip.mp4 --json bench.json
+    # python benchmark.py synthetic:1920x1080 --frames 300 --baseline bench.json
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import heapq
+import threading
+import time
+from datetime import date
+
+# ================= CẤU HÌNH CHỐNG SPAM =================
+COOLDOWN_MAX_KEYS = 10000     # Số khóa tối đa giữ trong bộ nhớ, vượt thì bỏ khóa sắp hết hạn nhất
+FOREVER = float("inf")        # TTL "đến lần reset" (1 lần / ngày hoặc / phiên)
+
+
+class CooldownStore:
+    """
+    Bộ chống spam có TTL theo từng khóa, bộ nhớ có giới hạn:
+    - khóa là tuple, ví dụ ("attendance", name) hoặc (name, loại vi phạm)
+    - allow(key, ttl) -> True nếu khóa đã hết cooldown (đồng thời bắt đầu cooldown mới)
+    - khóa hết hạn được dọn theo heap thời điểm hết hạn, O(log n) mỗi lần đặt, dọn dần mỗi lần gọi
+    - quá max_keys -> bỏ khóa sắp hết hạn nhất; daily_reset=True -> xóa sạch khi sang ngày mới
+    """
+
+    def __init__(self, ttl=FOREVER, max_keys=COOLDOWN_MAX_KEYS, daily_reset=False, on_reset=None):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.daily_reset = daily_reset
+        self.on_reset = on_reset
+        self._expiry = {}             # khóa -> thời điểm hết hạn
+        self._heap = []               # (hết hạn, khóa); bản ghi cũ bị bỏ qua khi pop (xóa lười)
+        self._day = date.today()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def __contains__(self, key):
+        return self.remaining(key) > 0
+
+    def allow(self, key, ttl=None, now=None):
+        now = time.time() if now is None else now
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._maintain(now)
+            if self._expiry.get(key, 0) > now:
+                return False
+            self._set(key, now + ttl)
+            return True
+
+    def remaining(self, key, now=None):
+        """Số giây còn lại của cooldown (0 nếu không còn)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._maintain(now)
+            return max(0.0, self._expiry.get(key, 0) - now)
+
+    def reset(self):
+        """Xóa toàn bộ cooldown (đầu ngày / đầu phiên học)."""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._expiry.clear()
+        self._heap.clear()
+        if self.on_reset:
+            self.on_reset()
+
+    def _set(self, key, expiry):
+        self._expiry[key] = expiry
+        if expiry != FOREVER:
+            heapq.heappush(self._heap, (expiry, key))
+            # Khóa bị đặt lại nhiều lần để lại bản ghi cũ trong heap -> dựng lại khi quá nhiều
+            if len(self._heap) > 2 * len(self._expiry) + 64:
+                self._heap = [(e, k) for k, e in self._expiry.items() if e != FOREVER]
+                heapq.heapify(self._heap)
+
+        while len(self._expiry) > self.max_keys:
+            self._evict()
+
+    def _evict(self):
+        while self._heap:
+            expiry, key = heapq.heappop(self._heap)
+            if self._expiry.get(key) == expiry:
+                del self._expiry[key]
+                return
+        # Chỉ còn khóa FOREVER: bỏ khóa được đặt sớm nhất
+        del self._expiry[next(iter(self._expiry))]
+
+    def _maintain(self, now):
+        if self.daily_reset:
+            today = date.fromtimestamp(now)
+            if today != self._day:
+                self._day = today
+                self._clear()
+                return
+
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            if self._expiry.get(key) == expiry:
+                del self._expiry[key]
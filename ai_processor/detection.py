@@ -0,0 +1,216 @@
+import time
+
+import cv2
+import numpy as np
+
+# ================= CẤU HÌNH DETECT =================
+# Cạnh dài nhất của ảnh đưa vào YuNet (0 = detect trên frame gốc).
+# Nhỏ hơn -> nhanh hơn nhưng dễ sót mặt ở bàn cuối.
+DETECT_MAX_SIDE = 640
+
+# Detect theo ô (giảng đường lớn, camera 2K/4K): mỗi ô chạy ở độ phân giải gốc
+TILE_SIZE = 640               # Cạnh ô (px frame gốc)
+TILE_OVERLAP = 0.25           # Phần chồng giữa 2 ô kề nhau; mặt nhỏ hơn phần chồng luôn nằm trọn trong 1 ô
+TILE_MAX_FACE = 160           # Mặt lớn nhất (px frame gốc) phải bắt trọn trong 1 ô: phần chồng không nhỏ hơn
+TILE_NMS = 0.3                # Ngưỡng IoU khi gộp kết quả các ô
+TILE_OVERVIEW_SIDE = 640      # Thêm 1 lượt toàn cảnh thu nhỏ cho mặt to gần camera (0 = tắt)
+TILE_MOTION_WIDTH = 320       # Ảnh xám thu nhỏ để đo chuyển động từng ô
+TILE_RECHECK = 2.0            # Ô tĩnh vẫn detect lại sau ngần này giây
+
+
+class ScaledFaceDetector:
+    """
+    Bọc cv2.FaceDetectorYN: thu nhỏ frame một lần (giữ tỉ lệ), detect ở độ phân giải nhỏ
+    rồi đổi box + 5 landmarks về tọa độ frame gốc để nhận diện / kiểm tra đồng phục.
+    """
+
+    def __init__(self, detector, max_side=DETECT_MAX_SIDE):
+        self.detector = detector
+        self.max_side = max_side
+        self._input_size = None
+
+    def scale_for(self, w, h):
+        if not self.max_side or max(w, h) <= self.max_side:
+            return 1.0
+        return self.max_side / float(max(w, h))
+
+    def detect(self, frame):
+        """Trả về mảng faces (N x 15) theo tọa độ frame gốc, hoặc None."""
+        h, w = frame.shape[:2]
+        scale = self.scale_for(w, h)
+
+        if scale < 1.0:
+            size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+            small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        else:
+            size = (w, h)
+            small = frame
+
+        faces = self._run(small)
+        if faces is None or scale == 1.0:
+            return faces
+
+        # Cột 0-13: box (x, y, w, h) + 5 landmarks (x, y); cột 14 là score
+        sx, sy = size[0] / float(w), size[1] / float(h)
+        faces[:, 0:14:2] /= sx
+        faces[:, 1:14:2] /= sy
+        return faces
+
+    def _run(self, img):
+        size = (img.shape[1], img.shape[0])
+        # setInputSize chỉ khi kích thước thay đổi
+        if size != self._input_size:
+            self.detector.setInputSize(size)
+            self._input_size = size
+        _, faces = self.detector.detect(img)
+        return faces
+
+
+def tile_grid(x0, y0, w, h, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Chia vùng (x0, y0, w, h) thành các ô chồng nhau cùng kích thước (ô cuối dồn sát mép).
+    Trả về [(x, y, tw, th, inner)], inner = (trái, trên, phải, dưới): cạnh nào giáp ô khác.
+    """
+    def starts(length):
+        if length <= tile:
+            return [0]
+        step = max(1, int(tile * (1 - overlap)))
+        pos = list(range(0, length - tile, step))
+        pos.append(length - tile)
+        return pos
+
+    tw, th = min(tile, w), min(tile, h)
+    tiles = []
+    for y in starts(h):
+        for x in starts(w):
+            inner = (x > 0, y > 0, x + tw < w, y + th < h)
+            tiles.append((x0 + x, y0 + y, tw, th, inner))
+    return tiles
+
+
+def merge_faces(groups, nms_threshold=TILE_NMS):
+    """Gộp faces của nhiều ô / lượt detect, bỏ box trùng bằng NMS theo score (cột 14)."""
+    groups = [g for g in groups if g is not None and len(g)]
+    if not groups:
+        return None
+    faces = np.concatenate(groups)
+    if len(groups) == 1:
+        return faces
+    keep = cv2.dnn.NMSBoxes(faces[:, :4].tolist(), faces[:, 14].tolist(), 0.0, nms_threshold)
+    return faces[np.asarray(keep, dtype=int).reshape(-1)]
+
+
+class TiledFaceDetector(ScaledFaceDetector):
+    """
+    Detect theo ô cho camera độ phân giải cao: mặt 20-30px ở bàn cuối vẫn đủ lớn cho YuNet
+    vì mỗi ô chạy ở độ phân giải gốc, chi phí mỗi frame cố định theo số ô.
+    - rois: [(x, y, w, h)] vùng chỗ ngồi cần quét (None = cả frame), mỗi vùng chia ô riêng
+    - mặt chạm cạnh giáp ô khác bị bỏ (đã nằm trọn trong ô bên cạnh nhờ phần chồng):
+      phần chồng luôn >= max_face px để cả khi tắt lượt toàn cảnh mặt to vẫn không bị mất
+    - motion_threshold: chỉ detect lại ô có chuyển động (hoặc quá TILE_RECHECK), ô tĩnh dùng kết quả cũ
+    - kết quả mọi ô + lượt toàn cảnh gộp bằng NMS, cùng định dạng N x 15 như ScaledFaceDetector
+    - overview_detector: YuNet riêng cho lượt toàn cảnh, để kích thước đầu vào của cả 2 không đổi
+      qua lại mỗi frame (None = dùng chung detector, setInputSize lại mỗi lượt)
+    """
+
+    def __init__(self, detector, tile=TILE_SIZE, overlap=TILE_OVERLAP, rois=None,
+                 overview_side=TILE_OVERVIEW_SIDE, nms_threshold=TILE_NMS,
+                 motion_threshold=None, recheck=TILE_RECHECK, max_face=TILE_MAX_FACE,
+                 overview_detector=None):
+        if max_face >= tile:
+            raise ValueError(f"Ô {tile}px phải lớn hơn mặt lớn nhất {max_face}px")
+        super().__init__(detector, 0)
+        self.overview = ScaledFaceDetector(overview_detector or detector, overview_side)
+        self.tile = tile
+        self.overlap = max(overlap, max_face / float(tile))
+        self.rois = rois
+        self.nms_threshold = nms_threshold
+        self.motion_threshold = motion_threshold
+        self.recheck = recheck
+        self.last_tiles = 0
+        self._frame_size = None
+        self._tiles = []
+        self._cache = {}
+        self._checked = {}
+        self._prev = None
+
+    def tiles_for(self, w, h):
+        if (w, h) != self._frame_size:
+            regions = self.rois or [(0, 0, w, h)]
+            self._tiles = []
+            for x, y, rw, rh in regions:
+                # Vùng cấu hình vượt ra ngoài frame (đổi độ phân giải) -> cắt lại
+                x, y = max(0, int(x)), max(0, int(y))
+                rw, rh = min(int(rw), w - x), min(int(rh), h - y)
+                if rw > 0 and rh > 0:
+                    self._tiles.extend(tile_grid(x, y, rw, rh, self.tile, self.overlap))
+            self._frame_size = (w, h)
+            self._cache.clear()
+            self._checked.clear()
+            self._prev = None
+        return self._tiles
+
+    def _detect_tile(self, frame, rect):
+        x, y, tw, th, (left, top, right, bottom) = rect
+        faces = self._run(frame[y:y + th, x:x + tw])
+        if faces is None or not len(faces):
+            return None
+
+        # Bỏ mặt bị cắt ở cạnh giáp ô khác (margin 2px)
+        bx, by = faces[:, 0], faces[:, 1]
+        bx2, by2 = bx + faces[:, 2], by + faces[:, 3]
+        cut = np.zeros(len(faces), dtype=bool)
+        if left:
+            cut |= bx <= 2
+        if top:
+            cut |= by <= 2
+        if right:
+            cut |= bx2 >= tw - 2
+        if bottom:
+            cut |= by2 >= th - 2
+        faces = faces[~cut]
+
+        # Dời về tọa độ frame: x, y của box + 5 landmarks (không cộng vào w, h)
+        faces[:, 0:1] += x
+        faces[:, 4:14:2] += x
+        faces[:, 1:2] += y
+        faces[:, 5:14:2] += y
+        return faces
+
+    def _moving(self, frame, tiles):
+        """Tỉ lệ pixel đổi trong từng ô so với frame trước (ảnh xám thu nhỏ)."""
+        h, w = frame.shape[:2]
+        scale = min(1.0, TILE_MOTION_WIDTH / float(w))
+        small = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        prev, self._prev = self._prev, gray
+        if prev is None:
+            return [True] * len(tiles)
+
+        _, changed = cv2.threshold(cv2.absdiff(gray, prev), 25, 255, cv2.THRESH_BINARY)
+        moving = []
+        for x, y, tw, th, _ in tiles:
+            cell = changed[int(y * scale):int((y + th) * scale) + 1, int(x * scale):int((x + tw) * scale) + 1]
+            moving.append(cell.size > 0 and cv2.countNonZero(cell) / cell.size >= self.motion_threshold)
+        return moving
+
+    def detect(self, frame, now=None):
+        """Trả về mảng faces (N x 15) theo tọa độ frame gốc, hoặc None."""
+        h, w = frame.shape[:2]
+        tiles = self.tiles_for(w, h)
+        now = time.time() if now is None else now
+        moving = self._moving(frame, tiles) if self.motion_threshold is not None else None
+
+        groups = []
+        self.last_tiles = 0
+        for i, rect in enumerate(tiles):
+            stale = i not in self._cache or now - self._checked.get(i, 0) >= self.recheck
+            if moving is None or moving[i] or stale:
+                self._cache[i] = self._detect_tile(frame, rect)
+                self._checked[i] = now
+                self.last_tiles += 1
+            groups.append(self._cache[i])
+
+        if self.overview.max_side:
+            groups.append(self.overview.detect(frame))
+        return merge_faces(groups, self.nms_threshold)
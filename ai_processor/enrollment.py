@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+
+from recognizers import list_dataset
+
+# ================= CẤU HÌNH ĐĂNG KÝ NÓNG =================
+ENROLL_POLL_INTERVAL = 5.0    # Giây giữa 2 lần quét faces_db
+
+
+def snapshot(people):
+    """{tên: {đường dẫn ảnh: (size, mtime)}} để so sánh giữa 2 lần quét."""
+    snap = {}
+    for name, paths in people:
+        files = {}
+        for p in paths:
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            files[p] = (st.st_size, st.st_mtime_ns)
+        snap[name] = files
+    return snap
+
+
+def diff_snapshots(old, new):
+    """Trả về (ảnh mới theo tên, có ảnh bị sửa/xóa hay không)."""
+    additions = []
+    changed = False
+    for name, files in new.items():
+        before = old.get(name, {})
+        added = sorted(p for p in files if p not in before)
+        if added:
+            additions.append((name, added))
+        if any(p in before and before[p] != files[p] for p in files):
+            changed = True
+    for name, files in old.items():
+        if any(p not in new.get(name, {}) for p in files):
+            changed = True
+    return additions, changed
+
+
+class EnrollmentWatcher:
+    """
+    Quét faces_db ở thread nền. Khi có sinh viên / ảnh mới:
+    - chỉ thêm ảnh: backend.extended() (LBPH update / nối embedding) trên bản sao
+    - có ảnh bị sửa hoặc xóa: train lại toàn bộ một backend mới
+    rồi gọi on_swap(backend) để monitor đổi tham chiếu, vòng lặp frame không phải dừng.
+    """
+
+    def __init__(self, dataset_dir, get_backend, make_backend, on_swap, interval=ENROLL_POLL_INTERVAL):
+        self.dataset_dir = dataset_dir
+        self.get_backend = get_backend
+        self.make_backend = make_backend
+        self.on_swap = on_swap
+        self.interval = interval
+        self.running = False
+        self._lock = threading.Lock()
+        self._snapshot = snapshot(list_dataset(dataset_dir))
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def _loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠ Lỗi cập nhật dữ liệu khuôn mặt: {e}")
+
+    def check(self):
+        """Quét 1 lần; trả về True nếu đã swap recognizer mới."""
+        with self._lock:
+            people = list_dataset(self.dataset_dir)
+            snap = snapshot(people)
+            if snap == self._snapshot:
+                return False
+
+            additions, changed = diff_snapshots(self._snapshot, snap)
+            current = self.get_backend()
+
+            if changed or not hasattr(current, "extended"):
+                print("🔄 Dữ liệu khuôn mặt thay đổi, train lại ở nền...")
+                backend = self.make_backend()
+                backend.train(self.dataset_dir)
+            else:
+                names = ", ".join(name for name, _ in additions)
+                print(f"➕ Đăng ký thêm: {names}")
+                backend = current.extended(additions)
+                backend.save_cache(people)
+
+            self._snapshot = snap
+            self.on_swap(backend)
+            return True
+
+    def check_async(self):
+        threading.Thread(target=self.check, daemon=True).start()
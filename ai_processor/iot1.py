@@ -1,17 +1,34 @@
 import cv2
-import numpy as np
 import time
 import os
-import json
 import threading
 import requests
 from datetime import datetime
-from flask import Flask, jsonify, request, render_template_string, session
+from flask import Flask, Response, jsonify, request, render_template_string, session
 from flask_socketio import SocketIO, emit, disconnect
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 
+from pipeline import FramePipeline
+from tracker import FaceTracker
+from recognizers import create_backend
+from enrollment import EnrollmentWatcher
+from workers import PooledFramePipeline
+from sensors import SensorPoller
+from rules import BehaviorRules
+from cooldown import CooldownStore
+from presence import PresenceTracker
+from snapshots import SnapshotPublisher
+from preview import PreviewStream
+from sources import open_source, FRAME_SOURCE
+from metrics import REGISTRY, STAGE_SECONDS, HTTP_FAILURES
+from scheduler import AnalysisScheduler
+from motion import MotionGate
+from resolution import ResolutionController, capture_size
+from detection import DETECT_MAX_SIDE
+from analysis import ClassroomAnalyzer, create_face_detector, load_uniforms, DETECT_TILING
+
 # ================= CONFIG =================
 DATASET_DIR = "faces_db"
 YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
@@ -19,6 +36,23 @@ YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
 ABSENT_THRESHOLD = 1
 TEMP_THRESHOLD = 30
 
+# Cạnh detect (detection.py), detect theo ô (analysis.py), nhịp phân tích (scheduler.py),
+# ngưỡng luật hành vi (rules.py): dùng chung với benchmark.py để benchmark đo đúng cấu hình chạy thật
+
+# Backend nhận diện: "lbph" hoặc "sface" (embedding, so khớp batch cả frame)
+RECOGNIZER_BACKEND = "lbph"
+
+# "thread": 1 tiến trình, pipeline nhiều thread | "process": pool worker detect qua shared memory
+EXECUTION_MODE = "thread"
+POOL_WORKERS = 3
+
+# Không mở cửa sổ OpenCV (máy không màn hình): HEADLESS=1 python iot1.py; xem qua /video_feed
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"
+
+# /metrics (Prometheus) không đăng nhập được -> token riêng: METRICS_TOKEN=... python iot1.py
+# Không đặt thì /metrics chỉ trả lời request từ chính máy này (localhost)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 
 # Cấu hình bảo mật
 ADMIN_USERNAME = "admin"
@@ -67,44 +101,123 @@ def verify_esp_control(sid):
     username = active_sessions[sid]['username']
     return users_db.get(username, {}).get('esp_control', False)
 
+# ============ METRICS =====================
+ESP_SECONDS = STAGE_SECONDS.labels("esp")
+ESP_FAILURES = HTTP_FAILURES.labels("esp")
+
+# Nhịp gửi lệnh LED tối đa mà ESP8266 chịu được
+LED_MIN_INTERVAL = 0.5     # Giây giữa 2 lệnh LED liên tiếp
+LED_RETRY_INTERVAL = 2.0   # Giây chờ gửi lại khi ESP không phản hồi
+LED_ALERT_SECONDS = 3.0    # Đèn đỏ báo gian lận sáng trong ngần này giây
+
 # ============ ESP =========================
 class ESP8266Controller:
+    """
+    1 thread gửi lệnh LED duy nhất (như aa.py), thread suy luận / SensorPoller / API không chờ HTTP:
+    - led() kiểm tra token rồi chỉ ghi trạng thái mong muốn (O(1)); True = lệnh được nhận
+    - alert() bật trạng thái tạm trong vài giây, hết hạn thread tự trả về trạng thái của led()
+    - thread chỉ gửi trạng thái mới nhất, bỏ qua nếu ESP đã ở đúng trạng thái đó,
+      tối đa 1 lệnh / LED_MIN_INTERVAL giây, ESP lỗi -> thử lại sau LED_RETRY_INTERVAL
+    """
+
     def __init__(self):
         self.auth = (ESP_USER, ESP_PASS)
         self.last_led_state = {"red": False, "yellow": False}
         self.connection_status = False
-        self.lock = threading.Lock()
+        self.session = requests.Session()      # Chỉ thread LED dùng
+        self.session.auth = self.auth
+
+        self.cond = threading.Condition()
+        self.target = (False, False)           # (red, yellow) theo led()
+        self.alert_state = None                # Trạng thái tạm của alert()
+        self.alert_until = 0
+        self.current = None                    # Trạng thái ESP đã xác nhận (None = chưa biết)
+        self.running = True
+        self.worker = threading.Thread(target=self._led_loop, daemon=True)
+        self.worker.start()
 
     def led(self, red=False, yellow=False, token=None):
-        if (red != self.last_led_state["red"] or yellow != self.last_led_state["yellow"]):
-            if token != "auto" and not self._verify_token(token):
-                print("⚠ Lệnh LED bị từ chối: Token không hợp lệ")
-                return False
+        state = (bool(red), bool(yellow))
+        with self.cond:
+            if state != self.target:
+                if token != "auto" and not self._verify_token(token):
+                    print("⚠ Lệnh LED bị từ chối: Token không hợp lệ")
+                    return False
+            self.target = state
+            # Lệnh tay từ dashboard có hiệu lực ngay, không đợi hết đèn báo
+            if token != "auto":
+                self.alert_state = None
+            self.cond.notify()
+        return True
+
+    def alert(self, red=False, yellow=False, seconds=LED_ALERT_SECONDS):
+        with self.cond:
+            self.alert_state = (bool(red), bool(yellow))
+            self.alert_until = time.time() + seconds
+            self.cond.notify()
+
+    def _wanted(self):
+        """Gọi khi đang giữ cond: trạng thái cần có lúc này."""
+        if self.alert_state is not None and time.time() >= self.alert_until:
+            self.alert_state = None
+        return self.alert_state if self.alert_state is not None else self.target
+
+    def _led_loop(self):
+        last_send = 0
+        while True:
+            with self.cond:
+                while self.running and self._wanted() == self.current:
+                    # Đang báo động -> thức dậy khi hết hạn để trả đèn về
+                    self.cond.wait(self.alert_until - time.time() if self.alert_state is not None else None)
+                if not self.running:
+                    return
+
+            # Giới hạn nhịp: các lệnh đến trong lúc chờ chỉ giữ lại lệnh cuối
+            wait = LED_MIN_INTERVAL - (time.time() - last_send)
+            if wait > 0:
+                time.sleep(wait)
+            with self.cond:
+                state = self._wanted()
+            if state == self.current:
+                continue
 
-        with self.lock:
+            red, yellow = state
+            last_send = time.time()
             try:
-                r = requests.post(
-                    f"http://{ESP_IP}/led",
-                    json={"red": red, "yellow": yellow},
-                    auth=self.auth,
-                    timeout=2
-                )
-                if r.status_code == 200:
-                    self.last_led_state = {"red": red, "yellow": yellow}
-                    self.connection_status = True
-                    return True
-            except Exception as e:
+                with ESP_SECONDS.time():
+                    r = self.session.post(f"http://{ESP_IP}/led", json={"red": red, "yellow": yellow}, timeout=2)
+            except Exception:
+                ESP_FAILURES.inc()
                 self.connection_status = False
-        return False
+                time.sleep(LED_RETRY_INTERVAL)
+                continue
+            # ESP trả lỗi (401, 500...) -> đèn chưa đổi, giữ current cũ để gửi lại
+            self.connection_status = r.ok
+            if r.ok:
+                self.current = state
+                self.last_led_state = {"red": red, "yellow": yellow}
+            else:
+                ESP_FAILURES.inc()
+                time.sleep(LED_RETRY_INTERVAL)
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.worker.join(timeout=3)
+        self.session.close()
 
     def temp_humidity(self):
         try:
-            r = requests.get(f"http://{ESP_IP}/dht11", auth=self.auth, timeout=2)
+            with ESP_SECONDS.time():
+                r = requests.get(f"http://{ESP_IP}/dht11", auth=self.auth, timeout=2)
             if r.status_code == 200:
                 j = r.json()
                 self.connection_status = True
                 return j.get("temp"), j.get("humidity")
+            ESP_FAILURES.inc()
         except:
+            ESP_FAILURES.inc()
             self.connection_status = False
         return None, None
 
@@ -124,31 +237,40 @@ class ESP8266Controller:
 
 # ============ SMART CLASS =================
 class SmartMonitor:
-    def __init__(self):
+    def __init__(self, source=None):
         print("▶ SMART CLASSROOM – ENHANCED VERSION")
 
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Webcam hoặc FrameSource (video / thư mục ảnh / synthetic), xem sources.open_source
+        self.cap = source if source is not None else open_source(FRAME_SOURCE, size=(1280, 720), fps=30)
 
         if not self.cap.isOpened():
             print("⚠ Không thể mở camera!")
             return
 
-        cv2.namedWindow("Smart Classroom", cv2.WINDOW_NORMAL)
-        cv2.resizeWindow("Smart Classroom", 1280, 720)
-
-        self.detector = cv2.FaceDetectorYN.create(
-            YUNET_MODEL, "", (320, 320),
-            score_threshold=0.7,
-            nms_threshold=0.3
-        )
-
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        if not HEADLESS:
+            cv2.namedWindow("Smart Classroom", cv2.WINDOW_NORMAL)
+            cv2.resizeWindow("Smart Classroom", 1280, 720)
+        # /video_feed: chỉ vẽ + nén JPEG khi có người đang xem
+        self.preview = PreviewStream()
+
+        self.face_detector = create_face_detector(YUNET_MODEL)
+        # Nhận diện 1 lần khi track sinh ra, xác minh lại định kỳ
+        self.tracker = FaceTracker()
+        self.rules = BehaviorRules()
+        # Mỗi phép phân tích chạy theo nhịp riêng thay vì cùng bỏ 1/2 số frame
+        self.scheduler = AnalysisScheduler()
+        # Phòng trống / cảnh tĩnh: bỏ detect, hết giờ học thì đọc camera chậm lại
+        self.motion = MotionGate()
+        # Tăng / giảm độ phân giải camera theo kích thước mặt thực tế, không cần restart
+        self.resolution = ResolutionController(start=capture_size(self.cap) or (1280, 720),
+                                               detector=None if DETECT_TILING is not None else self.face_detector)
+
+        self.recognizer = create_backend(RECOGNIZER_BACKEND, YUNET_MODEL)
         self.labels = {}
-        self.uniforms = {}
+        # Detect -> track -> nhận diện -> luật hành vi / đồng phục (dùng chung với benchmark.py)
+        self.analyzer = ClassroomAnalyzer(self.face_detector, self.tracker, self.rules, lambda: self.recognizer,
+                                          self.report, scheduler=self.scheduler, motion=self.motion,
+                                          resolution=self.resolution)
 
         # Khởi tạo stats TRƯỚC khi load_faces
         self.stats = {
@@ -157,109 +279,81 @@ class SmartMonitor:
             "violations": {},
             "temp": None,
             "humidity": None,
+            "env_stale": True,
             "time": "",
             "fps": 0,
             "esp_status": "disconnected",
             "total_students": 0
         }
+        # Dashboard chỉ đọc snapshot bất biến, không đọc self.stats đang bị ghi;
+        # mỗi snapshot mới đẩy delta qua Socket.IO thay cho polling
+        self.stats_pub = SnapshotPublisher(on_publish=self.push_stats)
 
         self.esp = ESP8266Controller()
         self.violations = {}
+        # Mỗi (tên, vi phạm) báo 1 lần mỗi ngày; sang ngày mới xóa luôn danh sách vi phạm
+        self.reported = CooldownStore(daily_reset=True, on_reset=self.violations.clear)
         self.absent_warned = False
+        self.presence_version = -1
         self.frame_count = 0
         self.fps = 0
         self.last_fps_time = time.time()
+        self.pipeline = None
         self.running = True
 
         # Load faces SAU khi khởi tạo stats
         self.load_faces()
+        # Có mặt / vắng có trễ, chỉ cập nhật người thấy trong frame
+        self.presence = PresenceTracker(self.labels)
+
+        # Đăng ký nóng: thêm ảnh vào faces_db là nhận diện được ngay, không cần restart
+        # (cả 2 chế độ: nhận diện luôn chạy ở tiến trình chính với self.recognizer)
+        self.enrollment = EnrollmentWatcher(
+            DATASET_DIR, lambda: self.recognizer,
+            lambda: create_backend(RECOGNIZER_BACKEND, YUNET_MODEL), self.swap_recognizer
+        ).start()
+
+        # DHT11 đọc ở thread nền mỗi 5s; render chỉ lấy bản đọc mới nhất
+        self.sensors = SensorPoller(self.esp.temp_humidity, interval=5, on_reading=self.on_env).start()
+
+        # /metrics: bộ đếm sẵn có của pipeline / scheduler chỉ được đọc lúc scrape
+        REGISTRY.collect("smart_pipeline_frames_total", "Số frame theo trạng thái trong pipeline",
+                         self.pipeline_counts, kind="counter", labelname="state")
+        REGISTRY.collect("smart_queue_depth", "Số phần tử đang chờ trong hàng đợi",
+                         self.queue_depths, labelname="queue")
+        REGISTRY.collect("smart_fps", "FPS hiển thị", lambda: self.fps)
+        REGISTRY.collect("smart_detect_rate_hz", "Nhịp detect hiện tại của AnalysisScheduler",
+                         lambda: self.scheduler.rates["detect"])
+        REGISTRY.collect("smart_idle", "1 = đang ở chế độ chờ (phòng trống)", lambda: int(self.motion.idle))
+        REGISTRY.collect("smart_present_students", "Số sinh viên đang có mặt", lambda: self.presence.present_count)
 
     def load_faces(self):
-        faces, ids = [], []
-        idx = 0
-
-        meta = os.path.join(DATASET_DIR, "metadata.json")
-        if os.path.exists(meta):
-            with open(meta, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                self.uniforms = data.get("uniforms", {})
-
-        for name in os.listdir(DATASET_DIR):
-            p = os.path.join(DATASET_DIR, name)
-            if not os.path.isdir(p):
-                continue
+        self.analyzer.uniforms = load_uniforms(DATASET_DIR)
+
+        self.labels = self.recognizer.train(DATASET_DIR)
 
-            self.labels[idx] = name
-            count = 0
-            for img in os.listdir(p):
-                g = cv2.imread(os.path.join(p, img), cv2.IMREAD_GRAYSCALE)
-                if g is not None:
-                    faces.append(g)
-                    ids.append(idx)
-                    count += 1
-            
-            if count > 0:
-                print(f"  - {name}: {count} ảnh")
-            idx += 1
-
-        if faces:
-            self.recognizer.train(faces, np.array(ids))
-            print(f"✓ Đã load {len(self.labels)} sinh viên")
+        if self.labels:
+            print(f"✓ Đã load {len(self.labels)} sinh viên ({self.recognizer.name})")
             self.stats["total_students"] = len(self.labels)
         else:
             print("⚠ Không có dữ liệu khuôn mặt!")
 
-    def recognize(self, gray, box):
-        x, y, w, h = box
-        if y < 0 or x < 0 or y+h > gray.shape[0] or x+w > gray.shape[1]:
-            return "Unknown"
-        
-        roi = gray[y:y+h, x:x+w]
-        if roi.size == 0:
-            return "Unknown"
-        
-        try:
-            label, conf = self.recognizer.predict(roi)
-            if conf < 85:
-                return self.labels.get(label, "Unknown")
-        except:
-            pass
-        return "Unknown"
-
-    def check_uniform(self, frame, box):
-        x, y, w, h = box
-        roi_y = min(y+h, frame.shape[0])
-        roi_y_end = min(y+h+60, frame.shape[0])
-        
-        if roi_y >= roi_y_end:
-            return "unknown"
-        
-        roi = frame[roi_y:roi_y_end, max(0, x):min(x+w, frame.shape[1])]
-        if roi.size == 0:
-            return "unknown"
-
-        hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-        white = cv2.inRange(hsv, (0, 0, 200), (180, 40, 255))
-
-        return "white" if cv2.countNonZero(white) / white.size > 0.3 else "other"
-
-    def turning_head(self, w, h):
-        r = w / h if h > 0 else 1
-        return r < 0.75 or r > 1.3
-
-    def sleeping(self, y, frame_h):
-        return y > frame_h * 0.6
+    def swap_recognizer(self, backend):
+        # Gán tham chiếu là nguyên tử: frame đang xử lý dùng model cũ, frame sau dùng model mới
+        self.recognizer = backend
+        self.labels = backend.labels
+        self.stats["total_students"] = len(self.labels)
+        # Sinh viên vừa đăng ký có thể đang là track "Unknown": không đợi lịch thử lại
+        self.tracker.forget_unknown()
+        print(f"✅ Đã cập nhật dữ liệu: {len(self.labels)} sinh viên")
 
     def report(self, name, msg):
         if name == "Unknown":
             return
 
-        if name not in self.violations:
-            self.violations[name] = []
-
-        if msg not in self.violations[name]:
+        if self.reported.allow((name, msg)):
             t = datetime.now().strftime("%H:%M:%S")
-            self.violations[name].append(msg)
+            self.violations.setdefault(name, []).append(msg)
             print(f"⚠ [{t}] {name} - {msg}")
 
             socketio.emit("violation", {
@@ -269,101 +363,135 @@ class SmartMonitor:
             })
 
             if "GIAN LẬN" in msg:
-                self.esp.led(red=True, yellow=False, token="auto")
-                threading.Timer(3, lambda: self.esp.led(red=False, yellow=False, token="auto")).start()
-
-    def run(self):
-        last_temp = 0
-        skip_frames = 2
-
-        while self.running:
-            ret, frame = self.cap.read()
-            if not ret:
-                time.sleep(0.1)
-                continue
+                # Không chặn thread suy luận: thread LED bật đỏ rồi tự trả về sau LED_ALERT_SECONDS
+                self.esp.alert(red=True)
 
-            self.frame_count += 1
-            
-            if time.time() - self.last_fps_time >= 1.0:
-                self.fps = self.frame_count
-                self.frame_count = 0
-                self.last_fps_time = time.time()
-
-            if self.frame_count % skip_frames != 0:
-                continue
-
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            h, w = frame.shape[:2]
-
-            self.detector.setInputSize((w, h))
-            _, faces = self.detector.detect(frame)
-
-            present = []
-
-            if faces is not None:
-                for f in faces:
-                    x, y, bw, bh = map(int, f[:4])
-                    name = self.recognize(gray, (x, y, bw, bh))
+    def on_env(self, reading):
+        """Chạy trên thread SensorPoller: bật LED vàng khi nóng quá TEMP_THRESHOLD."""
+        if reading.temp > TEMP_THRESHOLD:
+            self.esp.led(red=False, yellow=True, token="auto")
+        else:
+            self.esp.led(red=False, yellow=False, token="auto")
 
-                    if name != "Unknown" and name not in present:
-                        present.append(name)
+    def render(self, packet):
+        """Tầng hiển thị/publish: cập nhật stats, ESP và vẽ kết quả lên frame."""
+        if not self.running:
+            return False
 
-                        if self.turning_head(bw, bh):
-                            self.report(name, "GIAN LẬN (Quay đầu)")
+        frame = packet.frame
 
-                        if self.sleeping(y, h):
-                            self.report(name, "NGỦ GẬT")
+        self.frame_count += 1
+        if time.time() - self.last_fps_time >= 1.0:
+            self.fps = self.frame_count
+            self.frame_count = 0
+            self.last_fps_time = time.time()
 
-                        uniform = self.check_uniform(frame, (x, y, bw, bh))
-                        expected = self.uniforms.get(name, "white")
-                        if uniform != "unknown" and uniform != expected:
-                            self.report(name, "SAI ĐỒNG PHỤC")
+        # Danh sách lớp đổi (đăng ký nóng) -> đồng bộ trên thread này
+        if self.presence.labels is not self.labels:
+            self.presence.set_roster(self.labels)
+        self.presence.update(packet.result["present"], packet.ts)
 
-                    color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-                    cv2.rectangle(frame, (x, y), (x+bw, y+bh), color, 2)
-                    cv2.putText(frame, name, (x, y-10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        # Chỉ dựng lại danh sách tên khi có người vào / ra
+        if self.presence.version != self.presence_version:
+            self.presence_version = self.presence.version
+            self.stats["present"] = self.presence.present_names()
+            self.stats["absent"] = self.presence.absent_names()
 
-            absent = list(set(self.labels.values()) - set(present))
+            absent = self.stats["absent"]
             if len(absent) >= ABSENT_THRESHOLD and not self.absent_warned:
                 print(f"⚠ VẮNG MẶT ({len(absent)}): {', '.join(absent)}")
                 self.absent_warned = True
 
-            if time.time() - last_temp > 5:
-                t, hmd = self.esp.temp_humidity()
-                self.stats["temp"] = t
-                self.stats["humidity"] = hmd
-                
-                if t and t > TEMP_THRESHOLD:
-                    self.esp.led(red=False, yellow=True, token="auto")
-                elif t:
-                    self.esp.led(red=False, yellow=False, token="auto")
-                    
-                last_temp = time.time()
-
-            self.stats.update({
-                "present": present,
-                "absent": absent,
-                "violations": self.violations,
-                "time": datetime.now().isoformat(),
-                "fps": self.fps,
-                "esp_status": "connected" if self.esp.connection_status else "disconnected"
-            })
-
-            cv2.putText(frame, f"FPS: {self.fps}", (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            cv2.putText(frame, f"Present: {len(present)}/{len(self.labels)}", (10, 60),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
+        env = self.sensors.latest
+        self.stats.update({
+            "temp": env.temp,
+            "humidity": env.humidity,
+            "env_stale": self.sensors.stale,
+            "time": datetime.now().isoformat(),
+            "fps": self.fps,
+            "esp_status": "connected" if self.esp.connection_status else "disconnected"
+        })
+        self.stats_pub.publish(self.stats_view)
+
+        # Headless và không ai xem preview -> bỏ qua toàn bộ phần vẽ
+        preview = self.preview.wanted()
+        if HEADLESS and not preview:
+            return self.running
+
+        self.draw(frame, packet.result["boxes"])
+        if preview:
+            self.preview.offer(frame)
+
+        if not HEADLESS:
             cv2.imshow("Smart Classroom", frame)
             if cv2.waitKey(1) & 0xFF == ord("q"):
-                break
+                return False
+        return True
+
+    def draw(self, frame, boxes):
+        for track_id, x, y, bw, bh, name in boxes:
+            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+            cv2.rectangle(frame, (x, y), (x+bw, y+bh), color, 2)
+            cv2.putText(frame, name, (x, y-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+        cv2.putText(frame, f"FPS: {self.fps}", (10, 30),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        cv2.putText(frame, f"Present: {self.presence.present_count}/{len(self.presence.names)}", (10, 60),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+    def stats_view(self):
+        """Bản sao stats cho snapshot: list/dict mới, không dùng chung với buffer đang ghi."""
+        view = dict(self.stats)
+        view["present"] = list(view["present"])
+        view["absent"] = list(view["absent"])
+        # report() ghi violations trên thread suy luận; list(dict.items()) chụp 1 lần trong C
+        view["violations"] = {name: list(msgs) for name, msgs in list(self.violations.items())}
+        return view
+
+    def pipeline_counts(self):
+        if not self.pipeline:
+            return None
+        s = self.pipeline.stats()
+        return {k: s[k] for k in ("captured", "dropped_infer", "dropped_render", "gated")}
+
+    def queue_depths(self):
+        if not self.pipeline:
+            return None
+        s = self.pipeline.stats()
+        return {"infer": s["infer_queue"], "render": s["render_queue"]}
+
+    def push_stats(self, snap):
+        """Gửi delta (có seq) tới mọi dashboard; client lệch seq sẽ tự xin snapshot đầy đủ."""
+        socketio.emit("stats_delta", dict(snap.delta, seq=snap.version))
+
+    def run(self):
+        # capture -> analyze -> render chạy song song, frame cũ bị bỏ khi tầng sau chậm
+        if EXECUTION_MODE == "process":
+            # Worker chỉ detect; track + nhận diện chạy ở tiến trình chính với self.recognizer như chế độ thread
+            self.pipeline = PooledFramePipeline(self.cap, self.analyzer.analyze_faces, self.render,
+                                                workers=POOL_WORKERS, scheduler=self.scheduler, gate=self.motion,
+                                                adjust=self.resolution.apply,
+                                                max_frame=self.resolution.largest,
+                                                detect_max_side=DETECT_MAX_SIDE, detector=self.resolution.detector,
+                                                tiling=DETECT_TILING)
+            self.pipeline.run()
+        else:
+            self.pipeline = FramePipeline(self.cap, self.analyzer.analyze, self.render,
+                                          scheduler=self.scheduler, gate=self.motion, adjust=self.resolution.apply)
+            self.pipeline.run()
 
         self.cap.release()
-        cv2.destroyAllWindows()
+        if not HEADLESS:
+            cv2.destroyAllWindows()
 
     def stop(self):
         self.running = False
+        self.enrollment.stop()
+        self.sensors.stop()
+        self.esp.close()
+        if self.pipeline:
+            self.pipeline.stop()
 
 # ============ WEB DASHBOARD ===============
 DASHBOARD_HTML = """
@@ -647,6 +775,12 @@ DASHBOARD_HTML = """
                         <button class="led-btn off" onclick="controlLED('off')">⚫ Tắt</button>
                     </div>
                 </div>
+
+                <div class="card">
+                    <h3>🎥 Camera</h3>
+                    <button class="btn" id="previewBtn" onclick="togglePreview()">Xem camera</button>
+                    <img id="preview" style="display: none; width: 100%; margin-top: 10px; border-radius: 8px;">
+                </div>
             </div>
 
             <div class="grid">
@@ -675,6 +809,8 @@ DASHBOARD_HTML = """
         let sessionId = null;
         let espToken = null;
         let socket = null;
+        let stats = null;
+        let lastSeq = -1;
 
         document.getElementById('loginForm').addEventListener('submit', async (e) => {
             e.preventDefault();
@@ -749,51 +885,112 @@ DASHBOARD_HTML = """
                 addViolation(data);
             });
 
-            setInterval(updateStats, 1000);
-        }
-
-        async function updateStats() {
-            try {
-                const res = await fetch('/api/stats', {
-                    headers: { 'X-Session-ID': sessionId }
-                });
-                const data = await res.json();
+            // Server gửi bản đầy đủ khi kết nối, sau đó chỉ gửi delta khi có thay đổi
+            socket.on('stats_snapshot', (data) => {
+                stats = data;
+                lastSeq = data.seq;
+                renderStats(stats);
+                updateStudentLists(stats.present, stats.absent);
+            });
 
-                document.getElementById('totalStudents').textContent = data.total_students || 0;
-                document.getElementById('presentCount').textContent = data.present?.length || 0;
-                document.getElementById('presentCount2').textContent = data.present?.length || 0;
-                document.getElementById('absentCount').textContent = data.absent?.length || 0;
-                document.getElementById('absentCount2').textContent = data.absent?.length || 0;
-                document.getElementById('fps').textContent = data.fps || 0;
+            socket.on('stats_delta', (delta) => {
+                if (!stats || delta.seq !== lastSeq + 1) {
+                    // Lỡ mất delta -> xin lại bản đầy đủ
+                    if (delta.seq > lastSeq) socket.emit('stats_resync');
+                    return;
+                }
+                applyDelta(delta);
+                lastSeq = delta.seq;
+            });
+        }
 
-                document.getElementById('temperature').textContent = data.temp ? data.temp + '°C' : '--';
-                document.getElementById('humidity').textContent = data.humidity ? data.humidity + '%' : '--';
+        // Chỉ mở /video_feed khi bấm xem: không ai xem thì server không vẽ / nén JPEG
+        function togglePreview() {
+            const img = document.getElementById('preview');
+            const btn = document.getElementById('previewBtn');
+            if (img.src) {
+                img.removeAttribute('src');
+                img.style.display = 'none';
+                btn.textContent = 'Xem camera';
+            } else {
+                img.src = `/video_feed?session_id=${encodeURIComponent(sessionId)}`;
+                img.style.display = 'block';
+                btn.textContent = 'Tắt xem';
+            }
+        }
 
-                const espStatus = document.getElementById('espStatus');
-                if (data.esp_status === 'connected') {
-                    espStatus.textContent = 'Online';
-                    espStatus.className = 'status online';
+        function applyDelta(delta) {
+            for (const [key, change] of Object.entries(delta)) {
+                if (key === 'seq') continue;
+                if (key === 'present' || key === 'absent') {
+                    stats[key] = (stats[key] || [])
+                        .filter(name => !change.remove.includes(name))
+                        .concat(change.add);
+                    patchStudentList(key, change);
+                } else if (key === 'violations') {
+                    for (const [name, msgs] of Object.entries(change)) {
+                        if (msgs === null) delete stats.violations[name];
+                        else stats.violations[name] = msgs;
+                    }
                 } else {
-                    espStatus.textContent = 'Offline';
-                    espStatus.className = 'status offline';
+                    stats[key] = change;
                 }
+            }
+            renderStats(stats);
+        }
 
-                updateStudentLists(data.present, data.absent);
-            } catch (err) {
-                console.error('Error updating stats:', err);
+        function renderStats(data) {
+            document.getElementById('totalStudents').textContent = data.total_students || 0;
+            document.getElementById('presentCount').textContent = data.present?.length || 0;
+            document.getElementById('presentCount2').textContent = data.present?.length || 0;
+            document.getElementById('absentCount').textContent = data.absent?.length || 0;
+            document.getElementById('absentCount2').textContent = data.absent?.length || 0;
+            document.getElementById('fps').textContent = data.fps || 0;
+
+            const stale = data.env_stale && data.temp ? ' (cũ)' : '';
+            document.getElementById('temperature').textContent = data.temp ? data.temp + '°C' + stale : '--';
+            document.getElementById('humidity').textContent = data.humidity ? data.humidity + '%' + stale : '--';
+
+            const espStatus = document.getElementById('espStatus');
+            if (data.esp_status === 'connected') {
+                espStatus.textContent = 'Online';
+                espStatus.className = 'status online';
+            } else {
+                espStatus.textContent = 'Offline';
+                espStatus.className = 'status offline';
             }
         }
 
+        // Chỉ thêm / xóa đúng thẻ tên thay đổi, không dựng lại cả danh sách
+        function patchStudentList(key, change) {
+            const list = document.getElementById(key === 'present' ? 'presentList' : 'absentList');
+            const cls = key === 'present' ? 'student-tag' : 'student-tag absent';
+
+            change.remove.forEach(name => {
+                const tag = list.querySelector(`[data-name="${CSS.escape(name)}"]`);
+                if (tag) tag.remove();
+            });
+            if (change.add.length && list.querySelector('p')) list.innerHTML = '';
+            change.add.forEach(name => {
+                const tag = document.createElement('div');
+                tag.className = cls;
+                tag.dataset.name = name;
+                tag.textContent = name;
+                list.appendChild(tag);
+            });
+            if (!list.children.length) list.innerHTML = '<p style="color: #999;">Không có</p>';
+        }
+
         function updateStudentLists(present, absent) {
             const presentList = document.getElementById('presentList');
             const absentList = document.getElementById('absentList');
 
             presentList.innerHTML = present?.map(name => 
-                `<div class="student-tag">${name}</div>`
+                `<div class="student-tag" data-name="${name}">${name}</div>`
             ).join('') || '<p style="color: #999;">Không có</p>';
 
             absentList.innerHTML = absent?.map(name => 
-                `<div class="student-tag absent">${name}</div>`
+                `<div class="student-tag absent" data-name="${name}">${name}</div>`
             ).join('') || '<p style="color: #999;">Không có</p>';
         }
 
@@ -870,7 +1067,38 @@ def api_stats():
     if not verify_session(session_id):
         return jsonify({"error": "Unauthorized"}), 401
     
-    return jsonify(monitor.stats if monitor else {})
+    if not monitor:
+        return jsonify({})
+
+    # Body đã serialize sẵn theo version; dashboard gửi If-None-Match -> 304 nếu chưa đổi
+    snap = monitor.stats_pub.current
+    resp = Response(snap.body, mimetype="application/json")
+    resp.set_etag(snap.etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+@app.route("/metrics")
+def metrics():
+    if METRICS_TOKEN:
+        token = request.args.get("token") or request.headers.get("Authorization", "").replace("Bearer ", "", 1)
+        # So sánh bytes: compare_digest với str không phải ASCII sẽ raise TypeError
+        if not secrets.compare_digest(token.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    elif request.remote_addr not in ("127.0.0.1", "::1"):
+        return Response("Forbidden: đặt METRICS_TOKEN để scrape từ máy khác\n", status=403, mimetype="text/plain")
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/video_feed")
+def video_feed():
+    # <img src="/video_feed?session_id=..."> không gửi được header -> nhận session qua query
+    session_id = request.headers.get("X-Session-ID") or request.args.get("session_id")
+
+    if not verify_session(session_id):
+        return jsonify({"error": "Unauthorized"}), 401
+    if not monitor:
+        return jsonify({"error": "Monitor chưa sẵn sàng"}), 503
+
+    return Response(monitor.preview.stream(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 @app.route("/api/violations")
 def api_violations():
@@ -879,7 +1107,18 @@ def api_violations():
     if not verify_session(session_id):
         return jsonify({"error": "Unauthorized"}), 401
     
-    return jsonify(monitor.violations if monitor else {})
+    return jsonify(monitor.stats_pub.current.data.get("violations", {}) if monitor else {})
+
+@app.route("/api/enroll/reload", methods=["POST"])
+def api_enroll_reload():
+    session_id = request.headers.get("X-Session-ID")
+    
+    if not verify_session(session_id):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    # Quét faces_db ngay (train ở nền, không chặn request)
+    monitor.enrollment.check_async()
+    return jsonify({"success": True})
 
 @app.route("/api/esp/led", methods=["POST"])
 def api_esp_led():
@@ -893,10 +1132,12 @@ def api_esp_led():
     yellow = data.get("yellow", False)
     
     token = active_sessions[session_id].get("esp_token")
-    success = monitor.esp.led(red=red, yellow=yellow, token=token)
+    # Lệnh được xếp cho thread LED, không chờ ESP; state = trạng thái ESP đã xác nhận gần nhất
+    queued = monitor.esp.led(red=red, yellow=yellow, token=token)
     
     return jsonify({
-        "success": success,
+        "success": queued and monitor.esp.connection_status,
+        "queued": queued,
         "state": monitor.esp.last_led_state
     })
 
@@ -919,6 +1160,16 @@ def handle_connect():
     
     print(f"✓ Client kết nối: {session_id[:8]}...")
     emit("connected", {"message": "Connected to Smart Classroom"})
+    send_stats_snapshot()
+
+@socketio.on("stats_resync")
+def handle_stats_resync():
+    # Client thấy lệch seq (mất gói / kết nối lại) -> gửi lại bản đầy đủ
+    send_stats_snapshot()
+
+def send_stats_snapshot():
+    if monitor:
+        emit("stats_snapshot", dict(monitor.stats_pub.current.data))
 
 @socketio.on("disconnect")
 def handle_disconnect():
@@ -949,8 +1200,13 @@ if __name__ == "__main__":
     print(f"📡 Dashboard: http://0.0.0.0:5000")
     print(f"🔐 Login: {ADMIN_USERNAME} / admin123")
     print(f"⚠️  ĐỔI MẬT KHẨU MẶC ĐỊNH NGAY!")
-    print(f"🎥 Camera window: 'Smart Classroom'")
+    if HEADLESS:
+        print("🎥 Headless: xem camera tại http://0.0.0.0:5000/video_feed")
+    else:
+        print(f"🎥 Camera window: 'Smart Classroom'")
     print(f"🛑 Nhấn 'q' trong cửa sổ camera để thoát")
+    if not METRICS_TOKEN:
+        print("⚠️  METRICS_TOKEN chưa đặt: /metrics chỉ mở cho localhost")
     print("=" * 60)
     
     socketio.run(app, host="0.0.0.0", port=5000, debug=False, log_output=False)
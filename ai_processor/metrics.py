@@ -0,0 +1,228 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ================= CẤU HÌNH METRICS =================
+# Biên bucket (giây) cho độ trễ từng tầng, từ 0.5ms đến 2.5s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Family:
+    """1 metric có thể có nhãn: labels("detect") -> metric con, tạo lần đầu rồi dùng lại."""
+
+    kind = None
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Metric không nhãn luôn xuất hiện (giá trị 0) ngay cả khi chưa đo lần nào
+            self._children[()] = self._new()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new())
+        return child
+
+    def _new(self):
+        raise NotImplementedError
+
+    def __getattr__(self, attr):
+        # Metric không nhãn: gọi inc() / observe() trực tiếp trên family
+        if self.labelnames or attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.labels(), attr)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_labels(labelnames, key)} {_num(self.value)}"]
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labelnames, key, [('le', _num(bound))])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labelnames, key)} {_num(total)}")
+        lines.append(f"{name}_count{_labels(labelnames, key)} {count}")
+        return lines
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new(self):
+        return _CounterValue()
+
+
+class Gauge(_Family):
+    kind = "gauge"
+
+    def _new(self):
+        return _GaugeValue()
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labelnames)
+
+    def _new(self):
+        return _HistogramValue(self.buckets)
+
+
+class Collected:
+    """Giá trị đọc lúc scrape từ fn() -> số hoặc {nhãn: số} (vd: bộ đếm sẵn có của pipeline, độ dài queue)."""
+
+    def __init__(self, name, doc, fn, kind="gauge", labelname=None):
+        self.name = name
+        self.doc = doc
+        self.fn = fn
+        self.kind = kind
+        self.labelname = labelname
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.labelname,), (label,))} {_num(v)}")
+        else:
+            lines.append(f"{self.name} {_num(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Bộ metric dùng chung cả tiến trình, xuất theo định dạng text của Prometheus.
+    Đo ở đường nóng chỉ tốn 1 bisect + 1 lock (~1µs); việc định dạng text chỉ làm khi bị scrape.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and type(existing) is type(metric) and not isinstance(metric, Collected):
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, doc, labelnames=()):
+        return self._register(Counter(name, doc, labelnames))
+
+    def gauge(self, name, doc, labelnames=()):
+        return self._register(Gauge(name, doc, labelnames))
+
+    def histogram(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, doc, labelnames, buckets))
+
+    def collect(self, name, doc, fn, kind="gauge", labelname=None):
+        """Đăng ký (hoặc thay) metric đọc từ fn() khi scrape."""
+        return self._register(Collected(name, doc, fn, kind, labelname))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Metric dùng chung giữa các module (pipeline, uploader, các client)
+STAGE_SECONDS = REGISTRY.histogram(
+    "smart_stage_seconds", "Thời gian xử lý từng tầng (giây)", ("stage",))
+FACES_PER_FRAME = REGISTRY.histogram(
+    "smart_faces_per_frame", "Số khuôn mặt mỗi frame được phân tích", buckets=COUNT_BUCKETS)
+RECOGNIZER_CALLS = REGISTRY.counter(
+    "smart_recognizer_calls_total", "Số lần gọi backend nhận diện (mỗi lần 1 batch)")
+RECOGNIZED_FACES = REGISTRY.counter(
+    "smart_recognized_faces_total", "Số khuôn mặt đã đưa qua nhận diện")
+HTTP_FAILURES = REGISTRY.counter(
+    "smart_http_failures_total", "Số request HTTP thất bại (lỗi mạng / 5xx)", ("target",))
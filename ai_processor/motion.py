@@ -0,0 +1,91 @@
+import time
+
+import cv2
+
+# ================= CẤU HÌNH CỔNG CHUYỂN ĐỘNG =================
+MOTION_WIDTH = 160            # So sánh trên ảnh xám thu nhỏ còn cạnh ngang này
+MOTION_PIXEL_DELTA = 25       # Chênh lệch độ sáng (0-255) để 1 pixel tính là "đổi"
+MOTION_THRESHOLD = 0.01       # Tỉ lệ pixel đổi tối thiểu để coi là có chuyển động
+MOTION_RECHECK = 5.0          # Phòng tĩnh vẫn detect lại sau ngần này giây (ánh sáng đổi chậm...)
+IDLE_AFTER = 120.0            # Không thấy mặt quá ngần này giây -> chế độ chờ
+IDLE_CAPTURE_FPS = 2.0        # Nhịp đọc camera khi chờ
+IDLE_RECHECK = 30.0           # Nhịp detect lại khi chờ (nếu không có chuyển động)
+
+
+class MotionGate:
+    """
+    Cổng rẻ tiền đặt trước tầng detect:
+    - admit(frame) so ảnh xám thu nhỏ với frame được detect gần nhất (absdiff + ngưỡng)
+      -> chỉ cho detect khi cảnh đổi, khi frame trước còn thấy mặt, hoặc đã quá MOTION_RECHECK
+    - note_faces(n) do tầng suy luận gọi sau mỗi lần detect
+    - không thấy mặt IDLE_AFTER giây -> idle: capture_delay() làm grabber đọc chậm lại
+      (IDLE_CAPTURE_FPS), có chuyển động là thoát chờ ngay ở frame kế tiếp
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, pixel_delta=MOTION_PIXEL_DELTA,
+                 width=MOTION_WIDTH, recheck=MOTION_RECHECK, idle_after=IDLE_AFTER,
+                 idle_fps=IDLE_CAPTURE_FPS, idle_recheck=IDLE_RECHECK):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.recheck = recheck
+        self.idle_after = idle_after
+        self.idle_delay = 1.0 / idle_fps if idle_fps else 0
+        self.idle_recheck = idle_recheck
+
+        self.idle = False
+        self.score = 0.0
+        self.faces = 0
+        self.admitted = 0
+        self.skipped = 0
+        self.last_face = time.time()
+        self._last_admit = 0
+        self._reference = None
+
+    def _prepare(self, frame):
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, max(1, int(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _moved(self, small):
+        ref = self._reference
+        if ref is None or ref.shape != small.shape:
+            return True
+        _, changed = cv2.threshold(cv2.absdiff(small, ref), self.pixel_delta, 255, cv2.THRESH_BINARY)
+        self.score = cv2.countNonZero(changed) / changed.size
+        return self.score >= self.threshold
+
+    def admit(self, frame, now=None):
+        """True nếu frame này cần detect; False = cảnh không đổi, dùng lại kết quả trước."""
+        now = time.time() if now is None else now
+        small = self._prepare(frame)
+        moved = self._moved(small)
+
+        if moved and self.idle:
+            self.idle = False
+            print("⏰ Có chuyển động – thoát chế độ chờ")
+        elif not self.idle and not self.faces and now - self.last_face >= self.idle_after:
+            self.idle = True
+            print(f"💤 Không có ai {int(self.idle_after)}s – chuyển chế độ chờ")
+
+        recheck = self.idle_recheck if self.idle else self.recheck
+        if not (moved or self.faces or now - self._last_admit >= recheck):
+            self.skipped += 1
+            return False
+
+        self._reference = small
+        self._last_admit = now
+        self.admitted += 1
+        return True
+
+    def note_faces(self, count, now=None):
+        self.faces = count
+        if count:
+            self.last_face = time.time() if now is None else now
+            self.idle = False
+
+    def capture_delay(self):
+        """Số giây grabber nghỉ giữa 2 lần đọc camera (0 khi đang hoạt động bình thường)."""
+        return self.idle_delay if self.idle else 0
@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+
+from scheduler import DETECT
+from metrics import STAGE_SECONDS
+
+# ================= CẤU HÌNH PIPELINE =================
+INFER_QUEUE_SIZE = 2     # Số frame tối đa chờ suy luận (cũ nhất bị bỏ)
+RENDER_QUEUE_SIZE = 2    # Số kết quả tối đa chờ hiển thị
+
+CAPTURE_SECONDS = STAGE_SECONDS.labels("capture")
+ANALYZE_SECONDS = STAGE_SECONDS.labels("analyze")
+RENDER_SECONDS = STAGE_SECONDS.labels("render")
+
+
+class FramePacket:
+    """Một frame đi qua pipeline: capture -> inference -> render."""
+    __slots__ = ("seq", "ts", "frame", "result")
+
+    def __init__(self, seq, ts, frame):
+        self.seq = seq
+        self.ts = ts          # Thời điểm chụp (time.time())
+        self.frame = frame
+        self.result = None
+
+    @property
+    def latency(self):
+        return time.time() - self.ts
+
+
+class DropOldestQueue:
+    """Hàng đợi có giới hạn: khi đầy thì bỏ phần tử cũ nhất, không bao giờ chặn bên ghi."""
+
+    def __init__(self, maxsize=2):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class LatestFrameGrabber:
+    """
+    Thread riêng đọc camera liên tục, chỉ giữ frame mới nhất để driver không dồn frame.
+    pace() -> số giây nghỉ giữa 2 lần đọc (chế độ chờ của MotionGate), None = đọc hết tốc độ.
+    adjust(cap) chạy trước mỗi lần đọc: nơi duy nhất được cap.set khi đang chạy (ResolutionController).
+    Nguồn hữu hạn (FrameSource: video, thư mục ảnh) đọc hết -> ended = True, thread dừng.
+    """
+
+    def __init__(self, cap, on_frame=None, pace=None, adjust=None):
+        self.cap = cap
+        self.on_frame = on_frame
+        self.pace = pace
+        self.adjust = adjust
+        self.running = False
+        self.ended = False
+        self.seq = 0
+        self.failed_reads = 0
+        self._latest = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while self.running:
+            if self.adjust:
+                self.adjust(self.cap)
+            started = time.perf_counter()
+            ret, frame = self.cap.read()
+            CAPTURE_SECONDS.observe(time.perf_counter() - started)
+            if not ret:
+                if getattr(self.cap, "finished", False):
+                    self.ended = True
+                    break
+                self.failed_reads += 1
+                time.sleep(0.05)
+                continue
+
+            with self._cond:
+                self.seq += 1
+                packet = FramePacket(self.seq, time.time(), frame)
+                self._latest = packet
+                self._cond.notify_all()
+
+            if self.on_frame:
+                self.on_frame(packet)
+
+            delay = self.pace() if self.pace else 0
+            if delay:
+                time.sleep(delay)
+
+    def read(self, last_seq=0, timeout=1.0):
+        """Trả về frame mới hơn last_seq (hoặc None nếu hết timeout)."""
+        with self._cond:
+            if self._latest is None or self._latest.seq <= last_seq:
+                self._cond.wait(timeout)
+            if self._latest is None or self._latest.seq <= last_seq:
+                return None
+            return self._latest
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=2)
+
+
+class FramePipeline:
+    """
+    Pipeline 3 tầng chạy song song:
+    - capture: LatestFrameGrabber (thread riêng)
+    - inference: infer(frame) -> result, nhận frame qua DropOldestQueue
+    - render/publish: render(packet) chạy trên thread gọi run(), trả về False để dừng
+    FPS bị giới hạn bởi tầng chậm nhất thay vì tổng các tầng.
+    scheduler (AnalysisScheduler) quyết định frame nào được suy luận theo nhịp "detect"
+    và nhận độ trễ đo được để tự chỉnh nhịp; None = suy luận mọi frame. Frame chưa đến lượt
+    vẫn được hiển thị với kết quả gần nhất, FPS hiển thị không tụt theo nhịp detect.
+    gate (MotionGate) bỏ qua suy luận khi cảnh không đổi: frame đó đi thẳng sang render
+    với kết quả suy luận gần nhất (cổng chỉ đóng khi lần detect trước không thấy ai).
+    adjust(cap) được chuyển cho LatestFrameGrabber (đổi độ phân giải khi đang chạy).
+    """
+
+    def __init__(self, cap, infer, render, scheduler=None, gate=None, adjust=None,
+                 infer_queue_size=INFER_QUEUE_SIZE, render_queue_size=RENDER_QUEUE_SIZE):
+        self.infer = infer
+        self.render = render
+        self.scheduler = scheduler
+        self.gate = gate
+        self.infer_queue = DropOldestQueue(infer_queue_size)
+        self.render_queue = DropOldestQueue(render_queue_size)
+        self.grabber = LatestFrameGrabber(cap, on_frame=self._feed, pace=gate.capture_delay if gate else None,
+                                          adjust=adjust)
+        self.running = False
+        self.gated = 0
+        self.queued = 0
+        self.inferred = 0
+        self._last_result = None
+        self._infer_thread = None
+
+    def _feed(self, packet):
+        if self.scheduler and not self.scheduler.due(DETECT, packet.ts):
+            self._reuse_last(packet)
+            return
+        if self.gate and not self.gate.admit(packet.frame, packet.ts):
+            self.gated += 1
+            self._reuse_last(packet)
+            return
+        self.queued += 1
+        self.infer_queue.put(packet)
+
+    def _reuse_last(self, packet):
+        """Frame không suy luận: sang render với kết quả gần nhất (khi không còn frame chờ suy luận)."""
+        if self._last_result is not None and not len(self.infer_queue):
+            packet.result = self._last_result
+            self.render_queue.put(packet)
+
+    def _infer_loop(self):
+        while self.running:
+            packet = self.infer_queue.get(timeout=0.5)
+            if packet is None:
+                continue
+            started = time.perf_counter()
+            try:
+                packet.result = self.infer(packet.frame)
+            except Exception as e:
+                print(f"⚠ Lỗi tầng suy luận: {e}")
+                self.inferred += 1
+                continue
+            elapsed = time.perf_counter() - started
+            ANALYZE_SECONDS.observe(elapsed)
+            if self.scheduler:
+                self.scheduler.record(DETECT, elapsed)
+            self._last_result = packet.result
+            self.render_queue.put(packet)
+            self.inferred += 1
+
+    def drained(self):
+        """Nguồn đã hết và không còn frame nào đang chờ / đang suy luận / chờ hiển thị."""
+        return (self.grabber.ended and self.queued == self.inferred + self.infer_queue.dropped
+                and not len(self.render_queue))
+
+    def stats(self):
+        return {
+            "captured": self.grabber.seq,
+            "dropped_infer": self.infer_queue.dropped,
+            "dropped_render": self.render_queue.dropped,
+            "gated": self.gated,
+            "infer_queue": len(self.infer_queue),
+            "render_queue": len(self.render_queue),
+        }
+
+    def run(self):
+        self.running = True
+        self._infer_thread = threading.Thread(target=self._infer_loop, daemon=True)
+        self._infer_thread.start()
+        self.grabber.start()
+
+        try:
+            while self.running:
+                packet = self.render_queue.get(timeout=0.1)
+                if packet is None:
+                    if self.drained():
+                        break
+                    continue
+                with RENDER_SECONDS.time():
+                    keep = self.render(packet)
+                if keep is False:
+                    break
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        self.grabber.stop()
+        if self._infer_thread and self._infer_thread is not threading.current_thread():
+            self._infer_thread.join(timeout=2)
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# ================= CẤU HÌNH ĐIỂM DANH LIÊN TỤC =================
+PRESENCE_ENTER_HITS = 3       # Số lần thấy liên tiếp mới tính là có mặt (lọc nhận nhầm 1 frame)
+PRESENCE_LEAVE_AFTER = 5.0    # Giây không thấy mới tính là vắng (lọc mất detect vài frame)
+
+
+class PresenceTracker:
+    """
+    Trạng thái có mặt của cả danh sách lớp, cập nhật tăng dần:
+    - mảng NumPy last_seen / hits / present đánh chỉ số theo vị trí sinh viên
+    - update() chỉ chạm vào sinh viên thấy trong frame + những người vừa quá hạn,
+      thứ tự quá hạn giữ bằng OrderedDict (thấy lại -> đẩy xuống cuối), không quét cả lớp
+    - có trễ 2 chiều: vào sau PRESENCE_ENTER_HITS lần thấy, ra sau PRESENCE_LEAVE_AFTER giây
+    version tăng mỗi khi danh sách đổi, bên đọc chỉ dựng lại list tên khi version khác.
+    """
+
+    def __init__(self, labels, enter_hits=PRESENCE_ENTER_HITS, leave_after=PRESENCE_LEAVE_AFTER):
+        self.enter_hits = enter_hits
+        self.leave_after = leave_after
+        self.version = 0
+        self.labels = None
+        self.set_roster(labels)
+
+    def set_roster(self, labels):
+        """Đổi danh sách lớp (đăng ký nóng), giữ trạng thái của người đã có."""
+        old = {}
+        if self.labels is not None:
+            old = {name: (self.last_seen[i], self.hits[i], self.present[i]) for name, i in self.index.items()}
+
+        self.labels = labels
+        self.names = sorted(set(labels.values()))
+        self.index = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        self.last_seen = np.full(n, -np.inf)
+        self.hits = np.zeros(n, dtype=np.int32)
+        self.present = np.zeros(n, dtype=bool)
+        self._active = OrderedDict()      # chỉ số đang được theo dõi, cũ nhất đứng đầu
+
+        for name, (seen, hits, present) in sorted(old.items(), key=lambda x: x[1][0]):
+            i = self.index.get(name)
+            if i is None or seen == -np.inf:
+                continue
+            self.last_seen[i], self.hits[i], self.present[i] = seen, hits, present
+            self._active[i] = None
+
+        self.present_count = int(self.present.sum())
+        self.version += 1
+
+    @property
+    def absent_count(self):
+        return len(self.names) - self.present_count
+
+    def update(self, names, now):
+        """names: tên thấy trong frame (không trùng). Trả về True nếu danh sách có mặt thay đổi."""
+        changed = False
+        for name in names:
+            i = self.index.get(name)
+            if i is None:
+                continue
+            if now - self.last_seen[i] > self.leave_after:
+                self.hits[i] = 0
+            self.last_seen[i] = now
+            self.hits[i] += 1
+            self._active[i] = None
+            self._active.move_to_end(i)
+            if not self.present[i] and self.hits[i] >= self.enter_hits:
+                self.present[i] = True
+                self.present_count += 1
+                changed = True
+
+        cutoff = now - self.leave_after
+        while self._active:
+            i = next(iter(self._active))
+            if self.last_seen[i] >= cutoff:
+                break
+            del self._active[i]
+            self.hits[i] = 0
+            if self.present[i]:
+                self.present[i] = False
+                self.present_count -= 1
+                changed = True
+
+        if changed:
+            self.version += 1
+        return changed
+
+    def present_names(self):
+        return [self.names[i] for i in np.flatnonzero(self.present)]
+
+    def absent_names(self):
+        return [self.names[i] for i in np.flatnonzero(~self.present)]
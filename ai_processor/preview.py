@@ -0,0 +1,77 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# ================= CẤU HÌNH XEM TRƯỚC QUA WEB =================
+PREVIEW_FPS = 5               # Số frame MJPEG tối đa mỗi giây
+PREVIEW_MAX_WIDTH = 640       # Thu nhỏ trước khi nén JPEG
+PREVIEW_QUALITY = 70          # Chất lượng JPEG (0-100)
+
+
+class PreviewStream:
+    """
+    Luồng MJPEG theo yêu cầu cho /video_feed:
+    - wanted() chỉ True khi có ít nhất 1 người đang xem và đã đến lượt (PREVIEW_FPS)
+      -> không ai xem thì monitor không vẽ, không resize, không nén JPEG
+    - offer(frame) nén frame đã vẽ 1 lần, mọi người xem dùng chung bytes JPEG đó
+    """
+
+    def __init__(self, fps=PREVIEW_FPS, max_width=PREVIEW_MAX_WIDTH, quality=PREVIEW_QUALITY):
+        self.interval = 1.0 / fps
+        self.max_width = max_width
+        self.quality = quality
+        self.viewers = 0
+        self.encoded = 0
+        self._jpeg = None
+        self._placeholder = None
+        self._seq = 0
+        self._last = 0
+        self._cond = threading.Condition()
+
+    def wanted(self, now=None):
+        now = time.time() if now is None else now
+        return self.viewers > 0 and now - self._last >= self.interval
+
+    def offer(self, frame):
+        self._last = time.time()
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        with self._cond:
+            self._jpeg = buf.tobytes()
+            self._seq += 1
+            self.encoded += 1
+            self._cond.notify_all()
+
+    def placeholder(self):
+        """Ảnh chờ (nén 1 lần) gửi khi monitor chưa có frame nào."""
+        if self._placeholder is None:
+            img = np.zeros((180, 320, 3), np.uint8)
+            cv2.putText(img, "Dang cho camera...", (40, 95), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 2)
+            self._placeholder = cv2.imencode(".jpg", img)[1].tobytes()
+        return self._placeholder
+
+    def stream(self):
+        """Generator multipart/x-mixed-replace cho Flask Response; đếm người xem khi mở / đóng."""
+        with self._cond:
+            self.viewers += 1
+        try:
+            seq = 0
+            while True:
+                with self._cond:
+                    # Chờ frame mới; hết 2s thì gửi lại frame cũ để phát hiện client đã ngắt
+                    self._cond.wait_for(lambda: self._seq != seq, timeout=2.0)
+                    seq, jpeg = self._seq, self._jpeg
+                if jpeg is None:
+                    # Chưa có frame: vẫn phải ghi gì đó ra socket, nếu không người xem đã ngắt không bao giờ được trừ
+                    jpeg = self.placeholder()
+                yield (b"--frame\r\nContent-Type: image/jpeg\r\n"
+                       b"Content-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+        finally:
+            with self._cond:
+                self.viewers -= 1
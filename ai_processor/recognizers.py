@@ -0,0 +1,468 @@
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import requests
+
+# ================= CẤU HÌNH NHẬN DIỆN =================
+RECOGNIZER_BACKEND = "lbph"   # "lbph" (mặc định) | "sface" (embedding, batch theo frame)
+
+LBPH_SIZE = (200, 200)
+LBPH_THRESHOLD = 85           # Khoảng cách LBPH: nhỏ hơn là khớp
+
+SFACE_MODEL = "face_recognition_sface_2021dec.onnx"
+SFACE_URL = "https://github.com/opencv/opencv_zoo/raw/main/models/face_recognition_sface/face_recognition_sface_2021dec.onnx"
+SFACE_THRESHOLD = 0.363       # Cosine similarity: lớn hơn là khớp (ngưỡng chuẩn của SFace)
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+# Cache model đã train, khóa theo hash của dataset (đường dẫn, kích thước, mtime)
+CACHE_DIR = "recognizer_cache"
+DECODE_WORKERS = min(8, (os.cpu_count() or 2))
+
+# 5 điểm chuẩn (mắt phải, mắt trái, mũi, mép phải, mép trái) của ảnh 112x112 cho SFace
+SFACE_REFERENCE = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], dtype=np.float32)
+
+
+def download_model(path, url):
+    if not os.path.exists(path):
+        print(f"⬇️ Đang tải model {os.path.basename(path)}...")
+        r = requests.get(url, timeout=30)
+        with open(path, "wb") as f:
+            f.write(r.content)
+
+
+def list_dataset(dataset_dir):
+    """Danh sách (tên sinh viên, [đường dẫn ảnh]) theo thứ tự cố định, bỏ thư mục rỗng."""
+    if not os.path.exists(dataset_dir):
+        os.makedirs(dataset_dir)
+        return []
+
+    people = []
+    for name in sorted(os.listdir(dataset_dir)):
+        p = os.path.join(dataset_dir, name)
+        if name.startswith(".") or not os.path.isdir(p):
+            continue
+        imgs = [os.path.join(p, f) for f in sorted(os.listdir(p)) if f.lower().endswith(IMAGE_EXTS)]
+        if imgs:
+            people.append((name, imgs))
+    return people
+
+
+def dataset_hash(people, tag=""):
+    """Hash manifest của dataset: đổi/thêm/xóa ảnh nào cũng đổi hash."""
+    h = hashlib.sha1(tag.encode("utf-8"))
+    for name, paths in people:
+        h.update(name.encode("utf-8"))
+        for path in paths:
+            st = os.stat(path)
+            h.update(f"{path}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def read_images(paths, flags, fn=None, workers=DECODE_WORKERS):
+    """Giải mã ảnh song song (cv2.imread nhả GIL), giữ nguyên thứ tự; ảnh lỗi trả về None."""
+    def _load(path):
+        img = cv2.imread(path, flags)
+        if img is None or fn is None:
+            return img
+        return fn(img)
+
+    if len(paths) < 2 or workers <= 1:
+        return [_load(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_load, paths))
+
+
+def _cache_paths(backend, key):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    base = os.path.join(CACHE_DIR, backend)
+    return base + ".json", base + "." + key[:12]
+
+
+def _load_cache_meta(backend, key):
+    meta_path, _ = _cache_paths(backend, key)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("hash") != key:
+        return None
+    return {int(k): v for k, v in meta.get("labels", {}).items()}
+
+
+def _save_cache_meta(backend, key, labels):
+    meta_path, data_path = _cache_paths(backend, key)
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"hash": key, "data": os.path.basename(data_path), "labels": labels}, f, ensure_ascii=False)
+    os.replace(tmp, meta_path)
+
+    # Xóa file dữ liệu của các phiên bản dataset cũ
+    prefix = backend + "."
+    keep = os.path.basename(data_path)
+    for fname in os.listdir(CACHE_DIR):
+        if fname.startswith(prefix) and not fname.startswith(keep) and not fname.endswith(".json"):
+            try:
+                os.remove(os.path.join(CACHE_DIR, fname))
+            except OSError:
+                pass
+
+
+def extend_labels(labels, additions):
+    """Gán id cho ảnh mới: tên đã có giữ id cũ, tên mới nhận id tiếp theo."""
+    labels = dict(labels)
+    index = {name: idx for idx, name in labels.items()}
+    next_id = max(labels) + 1 if labels else 0
+    paths, ids = [], []
+    for name, imgs in additions:
+        if name not in index:
+            index[name] = next_id
+            labels[next_id] = name
+            next_id += 1
+        paths.extend(imgs)
+        ids.extend([index[name]] * len(imgs))
+    return labels, paths, ids
+
+
+def crop_box(img, face):
+    x, y, w, h = map(int, face[:4])
+    x, y = max(0, x), max(0, y)
+    return img[y:y+h, x:x+w]
+
+
+class LBPHBackend:
+    """LBPH truyền thống: predict từng khuôn mặt một."""
+    name = "lbph"
+
+    def __init__(self, threshold=LBPH_THRESHOLD, size=LBPH_SIZE):
+        self.threshold = threshold
+        self.size = size
+        self.model = cv2.face.LBPHFaceRecognizer_create()
+        self.labels = {}
+        self.trained = False
+
+    def cache_key(self, people):
+        return dataset_hash(people, f"{self.name}|{self.size}")
+
+    @classmethod
+    def from_model_file(cls, path, labels, threshold=LBPH_THRESHOLD, size=LBPH_SIZE):
+        """Load model đã train sẵn (vd: cache do tiến trình giám sát ghi) thay vì train lại."""
+        backend = cls(threshold, size)
+        backend.model.read(path)
+        backend.labels = dict(labels)
+        backend.trained = True
+        return backend
+
+    @classmethod
+    def from_model_bytes(cls, data, labels, threshold=LBPH_THRESHOLD, size=LBPH_SIZE):
+        """Load model từ bytes do model_bytes() tạo (vd: tiến trình giám sát gửi qua shared memory)."""
+        fd, tmp = tempfile.mkstemp(suffix=".yml")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            return cls.from_model_file(tmp, labels, threshold, size)
+        finally:
+            os.remove(tmp)
+
+    def model_bytes(self):
+        """Model đang chạy dạng bytes (YAML của OpenCV), đúng với bản trong bộ nhớ kể cả khi chưa ghi cache."""
+        fd, tmp = tempfile.mkstemp(suffix=".yml")
+        os.close(fd)
+        try:
+            self.model.write(tmp)
+            with open(tmp, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(tmp)
+
+    def train(self, dataset_dir, use_cache=True):
+        people = list_dataset(dataset_dir)
+        key = self.cache_key(people)
+
+        if use_cache and self._load_cache(key):
+            print(f"⚡ Dùng model LBPH từ cache ({len(self.labels)} sinh viên)")
+            return self.labels
+
+        paths, ids, labels = [], [], {}
+        for idx, (name, imgs) in enumerate(people):
+            labels[idx] = name
+            paths.extend(imgs)
+            ids.extend([idx] * len(imgs))
+
+        decoded = read_images(paths, cv2.IMREAD_GRAYSCALE, lambda g: cv2.resize(g, self.size))
+        faces = [g for g in decoded if g is not None]
+        ids = [i for g, i in zip(decoded, ids) if g is not None]
+
+        if faces:
+            self.model.train(faces, np.array(ids))
+            self.trained = True
+        self.labels = labels
+
+        if use_cache and faces:
+            self._save_cache(key)
+        return labels
+
+    def extended(self, additions):
+        """
+        Bản sao model + ảnh mới (copy-on-write): model đang chạy không bị đụng tới,
+        người gọi tự swap tham chiếu khi bản mới sẵn sàng.
+        """
+        new = LBPHBackend(self.threshold, self.size)
+        labels, paths, ids = extend_labels(self.labels, additions)
+
+        if self.trained:
+            fd, tmp = tempfile.mkstemp(suffix=".yml")
+            os.close(fd)
+            try:
+                self.model.write(tmp)
+                new.model.read(tmp)
+                new.trained = True
+            finally:
+                os.remove(tmp)
+
+        decoded = read_images(paths, cv2.IMREAD_GRAYSCALE, lambda g: cv2.resize(g, self.size))
+        faces = [g for g in decoded if g is not None]
+        ids = [i for g, i in zip(decoded, ids) if g is not None]
+        if faces:
+            new.model.update(faces, np.array(ids))
+            new.trained = True
+        new.labels = labels
+        return new
+
+    def save_cache(self, people):
+        self._save_cache(self.cache_key(people))
+
+    def _load_cache(self, key):
+        labels = _load_cache_meta(self.name, key)
+        _, data_path = _cache_paths(self.name, key)
+        if labels is None or not os.path.exists(data_path + ".yml"):
+            return False
+        try:
+            self.model.read(data_path + ".yml")
+        except cv2.error:
+            return False
+        self.labels = labels
+        self.trained = True
+        return True
+
+    def _save_cache(self, key):
+        _, data_path = _cache_paths(self.name, key)
+        try:
+            self.model.write(data_path + ".yml")
+            _save_cache_meta(self.name, key, self.labels)
+        except (OSError, cv2.error) as e:
+            print(f"⚠ Không ghi được cache LBPH: {e}")
+
+    def recognize_many(self, frame, faces, gray=None):
+        """Trả về list (tên, độ tin cậy) tương ứng từng hàng của faces."""
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        results = []
+        for f in faces:
+            roi = crop_box(gray, f)
+            if roi.size == 0 or not self.trained:
+                results.append(("Unknown", None))
+                continue
+            try:
+                label, conf = self.model.predict(cv2.resize(roi, self.size))
+                if conf < self.threshold:
+                    results.append((self.labels.get(label, "Unknown"), conf))
+                    continue
+            except cv2.error:
+                pass
+            results.append(("Unknown", None))
+        return results
+
+
+class SFaceBackend:
+    """
+    SFace (ONNX): căn chỉnh mặt theo 5 landmarks của YuNet, tính embedding cho
+    toàn bộ mặt trong frame bằng 1 lần forward, so khớp gallery bằng 1 phép nhân ma trận.
+    """
+    name = "sface"
+
+    def __init__(self, model=SFACE_MODEL, detector_model=None, threshold=SFACE_THRESHOLD):
+        download_model(model, SFACE_URL)
+        self.model = model
+        self.net = cv2.dnn.readNetFromONNX(model)
+        self._enroll_net = None     # Net riêng cho thread đăng ký nền (cv2.dnn.Net không thread-safe)
+        self.threshold = threshold
+        self.detector_model = detector_model
+        self.labels = {}
+        self.gallery = np.empty((0, 128), dtype=np.float32)   # Embedding đã chuẩn hóa
+        self.gallery_ids = np.empty((0,), dtype=np.int32)
+        self._batched = True
+
+    @staticmethod
+    def align(img, face):
+        """Warp khuôn mặt về 112x112 theo 5 landmarks (f[4:14])."""
+        src = np.asarray(face[4:14], dtype=np.float32).reshape(5, 2)
+        M, _ = cv2.estimateAffinePartial2D(src, SFACE_REFERENCE, method=cv2.LMEDS)
+        if M is None:
+            roi = crop_box(img, face)
+            return cv2.resize(roi, (112, 112)) if roi.size else np.zeros((112, 112, 3), np.uint8)
+        return cv2.warpAffine(img, M, (112, 112))
+
+    def embed(self, crops, net=None):
+        """Embedding chuẩn hóa L2 (N x 128) cho list ảnh 112x112 BGR."""
+        if not crops:
+            return np.empty((0, 128), dtype=np.float32)
+
+        net = self.net if net is None else net
+        if self._batched:
+            try:
+                blob = cv2.dnn.blobFromImages(crops, 1.0, (112, 112), (0, 0, 0), swapRB=True, crop=False)
+                net.setInput(blob)
+                feats = net.forward().reshape(len(crops), -1)
+            except cv2.error:
+                # Model không hỗ trợ batch động -> forward từng ảnh
+                self._batched = False
+        if not self._batched:
+            rows = []
+            for c in crops:
+                net.setInput(cv2.dnn.blobFromImage(c, 1.0, (112, 112), (0, 0, 0), swapRB=True, crop=False))
+                rows.append(net.forward().reshape(-1))
+            feats = np.stack(rows)
+
+        feats = feats.astype(np.float32)
+        feats /= np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-6)
+        return feats
+
+    def _enroll_crop(self, img, detector):
+        """Ảnh đăng ký: tìm mặt bằng YuNet để căn chỉnh, không thấy thì dùng cả ảnh."""
+        if detector is not None:
+            h, w = img.shape[:2]
+            detector.setInputSize((w, h))
+            _, faces = detector.detect(img)
+            if faces is not None and len(faces):
+                return self.align(img, faces[np.argmax(faces[:, 14])])
+        return cv2.resize(img, (112, 112))
+
+    def cache_key(self, people):
+        return dataset_hash(people, f"{self.name}|{self.threshold}")
+
+    @classmethod
+    def from_gallery(cls, gallery, gallery_ids, labels, model=SFACE_MODEL, threshold=SFACE_THRESHOLD):
+        """Dùng gallery có sẵn (vd: view vào shared memory) thay vì train lại."""
+        backend = cls(model=model, threshold=threshold)
+        backend.gallery = gallery
+        backend.gallery_ids = gallery_ids
+        backend.labels = dict(labels)
+        return backend
+
+    def _detector(self):
+        if self.detector_model and os.path.exists(self.detector_model):
+            return cv2.FaceDetectorYN.create(self.detector_model, "", (320, 320), 0.7, 0.3)
+        return None
+
+    def train(self, dataset_dir, use_cache=True):
+        people = list_dataset(dataset_dir)
+        key = self.cache_key(people)
+
+        if use_cache and self._load_cache(key):
+            print(f"⚡ Dùng gallery SFace từ cache ({len(self.labels)} sinh viên)")
+            return self.labels
+
+        detector = self._detector()
+
+        paths, ids, labels = [], [], {}
+        for idx, (name, imgs) in enumerate(people):
+            labels[idx] = name
+            paths.extend(imgs)
+            ids.extend([idx] * len(imgs))
+
+        decoded = read_images(paths, cv2.IMREAD_COLOR)
+        crops = [self._enroll_crop(img, detector) for img in decoded if img is not None]
+        ids = [i for img, i in zip(decoded, ids) if img is not None]
+
+        self.gallery = self.embed(crops)
+        self.gallery_ids = np.array(ids, dtype=np.int32)
+        self.labels = labels
+
+        if use_cache and crops:
+            self._save_cache(key)
+        return labels
+
+    def extended(self, additions):
+        """Bản sao gallery + embedding của ảnh mới (copy-on-write, chạy được ở thread nền)."""
+        if self._enroll_net is None:
+            self._enroll_net = cv2.dnn.readNetFromONNX(self.model)
+
+        labels, paths, ids = extend_labels(self.labels, additions)
+        detector = self._detector()
+        decoded = read_images(paths, cv2.IMREAD_COLOR)
+        crops = [self._enroll_crop(img, detector) for img in decoded if img is not None]
+        ids = [i for img, i in zip(decoded, ids) if img is not None]
+
+        new = object.__new__(SFaceBackend)
+        new.__dict__.update(self.__dict__)
+        new.gallery = np.vstack([self.gallery, self.embed(crops, self._enroll_net)])
+        new.gallery_ids = np.concatenate([self.gallery_ids, np.array(ids, dtype=np.int32)])
+        new.labels = labels
+        return new
+
+    def save_cache(self, people):
+        self._save_cache(self.cache_key(people))
+
+    def _load_cache(self, key):
+        labels = _load_cache_meta(self.name, key)
+        _, data_path = _cache_paths(self.name, key)
+        if labels is None or not os.path.exists(data_path + ".npz"):
+            return False
+        try:
+            data = np.load(data_path + ".npz")
+            self.gallery = data["gallery"]
+            self.gallery_ids = data["ids"]
+        except (OSError, ValueError, KeyError):
+            return False
+        self.labels = labels
+        return True
+
+    def _save_cache(self, key):
+        _, data_path = _cache_paths(self.name, key)
+        try:
+            np.savez(data_path + ".npz", gallery=self.gallery, ids=self.gallery_ids)
+            _save_cache_meta(self.name, key, self.labels)
+        except OSError as e:
+            print(f"⚠ Không ghi được cache SFace: {e}")
+
+    def recognize_many(self, frame, faces, gray=None):
+        if len(faces) == 0:
+            return []
+        if len(self.gallery) == 0:
+            return [("Unknown", None)] * len(faces)
+
+        feats = self.embed([self.align(frame, f) for f in faces])
+        sims = feats @ self.gallery.T                  # (N mặt) x (M ảnh gallery)
+        best = np.argmax(sims, axis=1)
+        scores = sims[np.arange(len(faces)), best]
+
+        results = []
+        for b, s in zip(best, scores):
+            if s >= self.threshold:
+                results.append((self.labels.get(int(self.gallery_ids[b]), "Unknown"), float(s)))
+            else:
+                results.append(("Unknown", float(s)))
+        return results
+
+
+def create_backend(backend=RECOGNIZER_BACKEND, detector_model=None):
+    if backend == "sface":
+        try:
+            return SFaceBackend(detector_model=detector_model)
+        except Exception as e:
+            print(f"⚠ Không khởi tạo được SFace ({e}), dùng LBPH")
+    return LBPHBackend()
@@ -0,0 +1,137 @@
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# ================= CẤU HÌNH ĐỘ PHÂN GIẢI ĐỘNG =================
+# Các mức (rộng, cao); controller chỉ nhảy 1 mức mỗi lần.
+# Cạnh detect đổi cùng tỉ lệ với chiều rộng, tính từ max_side cấu hình sẵn của detector ở mức ban đầu
+RESOLUTION_LADDER = [
+    (640, 480),
+    (1280, 720),
+    (1920, 1080),
+]
+FACE_MIN_PX = 48              # Chiều cao mặt (px frame) dưới mức này LBPH nhận diện kém -> tăng mức
+DOWN_MARGIN = 1.5             # Chỉ hạ mức khi mặt ở mức thấp hơn vẫn >= FACE_MIN_PX x DOWN_MARGIN
+FACE_PERCENTILE = 20          # Xét mặt nhỏ (phân vị 20) thay vì trung bình: bàn cuối mới là vấn đề
+RESOLUTION_WINDOW = 60.0      # Giây mẫu kích thước mặt được giữ
+RESOLUTION_MIN_SAMPLES = 30   # Số mặt tối thiểu trước khi quyết định
+RESOLUTION_HOLD = 30.0        # Giây tối thiểu giữa 2 lần đổi mức (chống nhảy qua lại)
+
+
+class ResolutionController:
+    """
+    Đổi độ phân giải camera (và cạnh detect) theo kích thước mặt quan sát được, không restart:
+    - observe() chạy trên thread suy luận: gom chiều cao mặt trong RESOLUTION_WINDOW giây,
+      phân vị FACE_PERCENTILE < FACE_MIN_PX -> xin tăng 1 mức, đủ lớn ở mức thấp hơn -> xin hạ
+    - apply(cap) chạy trên thread capture trước mỗi lần đọc: chỉ thread đó gọi cap.set
+    - camera không nhận độ phân giải (đọc lại khác) -> đánh dấu mức đó không hỗ trợ, giữ mức cũ
+    detector: ScaledFaceDetector cần đổi max_side theo mức (None = giữ nguyên); max_side lúc khởi tạo
+    (DETECT_MAX_SIDE) ứng với mức start, các mức khác nhân theo tỉ lệ chiều rộng. max_side = 0
+    (detect full frame) đã tự theo độ phân giải nên không bị đổi.
+    """
+
+    def __init__(self, ladder=RESOLUTION_LADDER, start=None, detector=None, min_face=FACE_MIN_PX,
+                 percentile=FACE_PERCENTILE, window=RESOLUTION_WINDOW,
+                 min_samples=RESOLUTION_MIN_SAMPLES, hold=RESOLUTION_HOLD):
+        self.ladder = list(ladder)
+        self.detector = detector
+        self.min_face = min_face
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.hold = hold
+
+        self.level = 0
+        if start:
+            widths = [abs(w - start[0]) for w, _ in self.ladder]
+            self.level = widths.index(min(widths))
+        self.base_width = self.ladder[self.level][0]
+        self.base_side = detector.max_side if detector is not None else None
+        self.pending = None
+        self.switches = 0
+        self.switched_at = time.time()
+        self.unsupported = set()
+        self.frame_size = None
+        self._samples = deque()       # (thời điểm, chiều cao mặt)
+
+    @property
+    def size(self):
+        return self.ladder[self.level]
+
+    @property
+    def largest(self):
+        """Độ phân giải lớn nhất có thể chuyển tới (để cấp bộ đệm frame đủ lớn)."""
+        return max(self.ladder)
+
+    def detect_side(self, level):
+        """max_side của detector ở 1 mức: giữ tỉ lệ so với cấu hình ban đầu (0 = full frame, giữ nguyên)."""
+        if not self.base_side:
+            return self.base_side
+        return max(1, round(self.base_side * self.ladder[level][0] / self.base_width))
+
+    def _next_level(self, step):
+        level = self.level + step
+        while 0 <= level < len(self.ladder) and level in self.unsupported:
+            level += step
+        return level if 0 <= level < len(self.ladder) else None
+
+    def observe(self, heights, frame_size, now=None):
+        """heights: chiều cao các mặt trong frame (px); frame_size: (rộng, cao) của frame đó."""
+        now = time.time() if now is None else now
+        # Mẫu đo ở độ phân giải khác không so được -> bỏ
+        if frame_size != self.frame_size:
+            self.frame_size = frame_size
+            self._samples.clear()
+        for h in heights:
+            self._samples.append((now, h))
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+
+        if self.pending is not None or len(self._samples) < self.min_samples or now - self.switched_at < self.hold:
+            return
+        small = np.percentile([h for _, h in self._samples], self.percentile)
+
+        target = None
+        if small < self.min_face:
+            target = self._next_level(1)
+        else:
+            lower = self._next_level(-1)
+            if lower is not None:
+                ratio = self.ladder[lower][1] / float(frame_size[1])
+                if small * ratio >= self.min_face * DOWN_MARGIN:
+                    target = lower
+        if target is not None:
+            print(f"📐 Mặt nhỏ nhất ~{small:.0f}px -> đổi độ phân giải {self.ladder[target][0]}x{self.ladder[target][1]}")
+            self.pending = target
+
+    def apply(self, cap):
+        """Gọi trên thread capture: thực hiện lệnh đổi mức đang chờ (nếu có)."""
+        if self.pending is None:
+            return
+        level, self.pending = self.pending, None
+        w, h = self.ladder[level]
+        old = self.ladder[self.level]
+
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
+        actual = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        if actual != (w, h):
+            print(f"⚠ Camera không hỗ trợ {w}x{h} (nhận {actual[0]}x{actual[1]}), giữ {old[0]}x{old[1]}")
+            self.unsupported.add(level)
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, old[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, old[1])
+            return
+
+        self.level = level
+        self.switches += 1
+        self.switched_at = time.time()
+        if self.detector is not None and self.base_side:
+            self.detector.max_side = self.detect_side(level)
+
+
+def capture_size(cap):
+    """(rộng, cao) camera đang chạy, None nếu nguồn không cho biết."""
+    w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+    return (w, h) if w and h else None
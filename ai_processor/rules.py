@@ -0,0 +1,58 @@
+import numpy as np
+
+# ================= CẤU HÌNH LUẬT HÀNH VI =================
+# Ngưỡng mặc định; từng script chỉ ghi đè ngưỡng khác mặc định
+RULE_THRESHOLDS = {
+    "nose_offset": 0.45,    # |mũi - trung điểm 2 mắt| / khoảng cách 2 mắt -> quay đầu / mất tập trung
+    "aspect_min": 0.75,     # w/h khung mặt nhỏ hơn -> quay nghiêng
+    "aspect_max": 1.3,      # w/h lớn hơn -> quay nghiêng
+    "low_head": 0.6,        # Đỉnh khung mặt thấp hơn tỉ lệ này của chiều cao frame -> ngủ gật
+}
+
+# Ngưỡng riêng từng script (chỉ phần khác RULE_THRESHOLDS), giữ đúng hành vi vốn có của script đó.
+# iot1 / benchmark / aa.py dùng mặc định
+RULE_PROFILES = {
+    "a": {"nose_offset": 0.5},
+    "ai_camera": {"aspect_min": 0.65, "aspect_max": float("inf"), "low_head": 0.65},
+}
+
+# Cột của ma trận vi phạm
+NOSE_OFFSET, ASPECT, LOW_HEAD = range(3)
+RULE_NAMES = ("nose_offset", "aspect", "low_head")
+
+
+class BehaviorRules:
+    """
+    Đánh giá mọi luật hành vi trên cả ma trận faces của YuNet (N x 15) bằng phép toán mảng:
+    evaluate() -> ma trận bool (N x len(RULE_NAMES)), hàng = khuôn mặt, cột = luật.
+    Cột 0-3: box (x, y, w, h); 4-5 mắt phải, 6-7 mắt trái, 8-9 mũi.
+    """
+
+    def __init__(self, **thresholds):
+        unknown = set(thresholds) - set(RULE_THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Ngưỡng không hợp lệ: {', '.join(sorted(unknown))}")
+        self.thresholds = dict(RULE_THRESHOLDS, **thresholds)
+
+    def evaluate(self, faces, frame_h):
+        faces = np.asarray(faces, dtype=np.float32).reshape(-1, 15)
+        t = self.thresholds
+        flags = np.zeros((len(faces), len(RULE_NAMES)), dtype=bool)
+        if not len(faces):
+            return flags
+
+        y, w, h = faces[:, 1], faces[:, 2], faces[:, 3]
+        x_re, x_le, x_nose = faces[:, 4], faces[:, 6], faces[:, 8]
+
+        # Mũi lệch khỏi trung điểm 2 mắt (bình thường offset gần 0); 2 mắt trùng nhau -> bỏ qua
+        eye_dist = np.abs(x_le - x_re)
+        offset = np.abs(x_nose - (x_re + x_le) / 2)
+        flags[:, NOSE_OFFSET] = offset > t["nose_offset"] * eye_dist
+        flags[:, NOSE_OFFSET] &= eye_dist > 0
+
+        # Tỉ lệ khung mặt; h = 0 coi như tỉ lệ 1 (không vi phạm)
+        aspect = np.divide(w, h, out=np.ones_like(w), where=h > 0)
+        flags[:, ASPECT] = (aspect < t["aspect_min"]) | (aspect > t["aspect_max"])
+
+        flags[:, LOW_HEAD] = y > frame_h * t["low_head"]
+        return flags
@@ -0,0 +1,69 @@
+import threading
+import time
+
+# ================= CẤU HÌNH LỊCH PHÂN TÍCH =================
+# Tần số mục tiêu (Hz) của từng phép phân tích, độc lập với FPS camera
+ANALYSIS_RATES = {
+    "detect": 10.0,       # Frame đưa vào tầng suy luận (detect + track)
+    "identify": 1.0,      # Xác minh lại danh tính track cũ (track mới luôn nhận diện ngay)
+    "behavior": 5.0,      # Luật hành vi (quay đầu, ngủ gật)
+    "uniform": 0.2,       # Kiểm tra đồng phục
+}
+DETECT = "detect"
+DETECT_RATE_MIN = 2.0         # Không hạ nhịp detect dưới mức này dù máy quá tải
+DETECT_RATE_MAX = 15.0        # Không tăng quá mức này dù máy rảnh
+CPU_BUDGET = 0.7              # Tỉ lệ thời gian 1 luồng suy luận được phép bận (nhịp x độ trễ)
+LATENCY_SMOOTHING = 0.2       # Hệ số EWMA cho độ trễ đo được
+
+
+class AnalysisScheduler:
+    """
+    Lịch chạy nhiều nhịp thay cho skip_frames cố định:
+    - due(name) -> True khi phép phân tích đó đến lượt theo tần số riêng (tính theo giây, không theo frame)
+    - record(name, giây) cập nhật độ trễ EWMA; riêng "detect" tự chỉnh nhịp
+      = CPU_BUDGET x capacity / độ trễ, kẹp trong [DETECT_RATE_MIN, DETECT_RATE_MAX]
+    capacity = số luồng / tiến trình suy luận chạy song song (pool worker).
+    """
+
+    def __init__(self, rates=None, budget=CPU_BUDGET, min_rate=DETECT_RATE_MIN,
+                 max_rate=DETECT_RATE_MAX, capacity=1):
+        self.rates = dict(ANALYSIS_RATES, **(rates or {}))
+        self.budget = budget
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.capacity = capacity
+        self.latency = {}
+        self.runs = dict.fromkeys(self.rates, 0)
+        self._next = dict.fromkeys(self.rates, 0.0)
+        self._lock = threading.Lock()
+
+    def due(self, name, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            rate = self.rates[name]
+            if rate <= 0 or now < self._next[name]:
+                return False
+            # Giữ nhịp đều; trễ quá 1 chu kỳ (máy bận, không có frame) thì bắt nhịp lại từ bây giờ
+            period = 1.0 / rate
+            nxt = self._next[name] + period
+            self._next[name] = nxt if nxt > now else now + period
+            self.runs[name] += 1
+            return True
+
+    def record(self, name, seconds):
+        """Ghi độ trễ thực đo của 1 lần chạy (giây)."""
+        with self._lock:
+            old = self.latency.get(name)
+            ewma = seconds if old is None else old + LATENCY_SMOOTHING * (seconds - old)
+            self.latency[name] = ewma
+            if name == DETECT and ewma > 0:
+                target = self.budget * self.capacity / ewma
+                self.rates[DETECT] = min(self.max_rate, max(self.min_rate, target))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rates": {k: round(v, 2) for k, v in self.rates.items()},
+                "latency_ms": {k: round(v * 1000, 1) for k, v in self.latency.items()},
+                "runs": dict(self.runs),
+            }
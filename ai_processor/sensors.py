@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import namedtuple
+
+# ================= CẤU HÌNH ĐỌC CẢM BIẾN =================
+SENSOR_POLL_INTERVAL = 5.0    # Giây giữa 2 lần đọc DHT11 trên ESP
+SENSOR_STALE_AFTER = 15.0     # Giây không đọc được -> coi số liệu là cũ
+
+# Bản ghi bất biến: thread đọc chỉ thay cả object, frame loop đọc không cần khóa
+SensorReading = namedtuple("SensorReading", ["temp", "humidity", "ts"])
+
+
+class SensorPoller:
+    """
+    Thread nền đọc cảm biến theo lịch cố định, giữ bản đọc mới nhất kèm thời điểm.
+    - read() -> (temp, humidity), trả None / ném lỗi khi ESP không phản hồi
+    - on_reading(reading) chạy ngay trên thread này (logic ngưỡng nhiệt, gửi API...)
+    Frame loop chỉ đọc poller.latest / poller.stale, không bao giờ chờ mạng.
+    """
+
+    def __init__(self, read, interval=SENSOR_POLL_INTERVAL, stale_after=SENSOR_STALE_AFTER, on_reading=None):
+        self.read = read
+        self.interval = interval
+        self.stale_after = stale_after
+        self.on_reading = on_reading
+        self.latest = SensorReading(None, None, 0.0)
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def stale(self):
+        return time.time() - self.latest.ts > self.stale_after
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self):
+        """Đọc 1 lần; trả về bản đọc mới hoặc None nếu thất bại."""
+        try:
+            temp, humidity = self.read()
+        except Exception:
+            temp = humidity = None
+
+        if temp is None:
+            self.failures += 1
+            return None
+
+        self.failures = 0
+        reading = SensorReading(temp, humidity, time.time())
+        self.latest = reading
+        if self.on_reading:
+            try:
+                self.on_reading(reading)
+            except Exception as e:
+                print(f"⚠ Lỗi xử lý dữ liệu cảm biến: {e}")
+        return reading
+
+    def _loop(self):
+        next_poll = time.time()
+        while not self._stop.is_set():
+            self.poll()
+            # Lịch cố định: ESP chậm không làm dồn lịch đọc
+            next_poll = max(next_poll + self.interval, time.time())
+            self._stop.wait(next_poll - time.time())
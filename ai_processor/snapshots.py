@@ -0,0 +1,107 @@
+import json
+import secrets
+import threading
+import time
+from types import MappingProxyType
+
+# ================= CẤU HÌNH PUBLISH STATS =================
+STATS_PUBLISH_HZ = 4          # Số snapshot tối đa mỗi giây
+DELTA_IGNORE = ("seq", "time")  # Trường đổi liên tục, không tính là "có thay đổi"
+
+
+def diff_stats(old, new):
+    """
+    Delta gọn giữa 2 bản stats:
+    - list (present/absent): {"add": [...], "remove": [...]}
+    - dict (violations): chỉ các khóa đổi, khóa bị xóa -> None
+    - giá trị đơn: giá trị mới
+    Trả về {} nếu không có gì đổi.
+    """
+    delta = {}
+    for key, value in new.items():
+        if key in DELTA_IGNORE:
+            continue
+        before = old.get(key)
+        if value == before:
+            continue
+        # Trường chưa có ở bản cũ coi như rỗng để delta luôn cùng dạng
+        if before is None and isinstance(value, (list, dict)):
+            before = type(value)()
+        if isinstance(value, list) and isinstance(before, list):
+            was, now = set(before), set(value)
+            delta[key] = {
+                "add": [x for x in value if x not in was],
+                "remove": [x for x in before if x not in now],
+            }
+        elif isinstance(value, dict) and isinstance(before, dict):
+            changed = {k: v for k, v in value.items() if before.get(k) != v}
+            changed.update({k: None for k in before if k not in value})
+            delta[key] = changed
+        else:
+            delta[key] = value
+    return delta
+
+
+class Snapshot:
+    """Bản stats bất biến: dữ liệu chỉ đọc + JSON đã serialize sẵn + ETag theo version."""
+
+    __slots__ = ("version", "ts", "data", "body", "etag", "delta")
+
+    def __init__(self, version, ts, data, body, etag, delta=None):
+        self.version = version
+        self.ts = ts
+        self.data = data
+        self.body = body
+        self.etag = etag
+        self.delta = delta
+
+
+class SnapshotPublisher:
+    """
+    Monitor ghi vào buffer riêng của nó (self.stats), publisher chụp lại thành Snapshot mới
+    tối đa max_rate lần/giây rồi đổi con trỏ `current` (gán tham chiếu là nguyên tử).
+    Handler Flask chỉ đọc `current`: không khóa, không đọc dở, không serialize lại mỗi request.
+    Version (= data["seq"]) chỉ tăng khi nội dung thực sự đổi, liên tục 1, 2, 3...
+    nên bên nhận delta qua on_publish(snapshot) phát hiện được khi bị lỡ bản nào.
+    """
+
+    def __init__(self, max_rate=STATS_PUBLISH_HZ, on_publish=None):
+        self.interval = 1.0 / max_rate if max_rate else 0
+        # Tiền tố ngẫu nhiên mỗi lần chạy: ETag cũ từ trước khi khởi động lại không khớp nhầm
+        self.boot = secrets.token_hex(4)
+        self.version = 0
+        self.last_publish = 0
+        self.on_publish = on_publish
+        self._lock = threading.Lock()
+        self.current = self._make({}, time.time())
+
+    def _make(self, data, now, delta=None):
+        data["seq"] = self.version
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        return Snapshot(self.version, now, MappingProxyType(data), body, f"{self.boot}-{self.version}", delta)
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return now - self.last_publish >= self.interval
+
+    def publish(self, build, force=False):
+        """
+        build() -> dict mới (không dùng chung list/dict với buffer của monitor).
+        Chỉ gọi build khi đến lượt publish; trả về Snapshot mới hoặc None nếu bỏ qua / không đổi.
+        """
+        now = time.time()
+        if not force and not self.due(now):
+            return None
+        with self._lock:
+            self.last_publish = now
+            data = build()
+            delta = diff_stats(self.current.data, data)
+            if not delta and not force:
+                return None
+            self.version += 1
+            snap = self._make(data, now, delta)
+            self.current = snap
+
+        if self.on_publish:
+            self.on_publish(snap)
+        return snap
@@ -0,0 +1,233 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from recognizers import IMAGE_EXTS
+
+# ================= CẤU HÌNH NGUỒN FRAME =================
+# "0" / "1" = webcam, "rtsp://..." / "clip.mp4" = video, thư mục = ảnh, "synthetic[:1280x720]" = ảnh giả
+FRAME_SOURCE = os.environ.get("FRAME_SOURCE", "0")
+SYNTHETIC_FACES = 6           # Số "khuôn mặt" di chuyển trong ảnh giả
+SYNTHETIC_FACE_PX = 80        # Cạnh mỗi khuôn mặt giả (px)
+
+
+class FrameSource:
+    """
+    Nguồn frame không phải camera, cùng giao diện với cv2.VideoCapture
+    (read / set / get / isOpened / release) nên pipeline và SmartMonitor dùng được ngay.
+    - realtime=True: phát đúng nhịp fps như camera thật; False: nhanh hết mức (benchmark)
+    - set(CAP_PROP_FRAME_WIDTH/HEIGHT) -> resize frame đầu ra (ResolutionController vẫn hoạt động)
+    - hết dữ liệu -> read() trả (False, None) và finished = True
+    timestamp = thời điểm của frame cuối theo thời gian video (frames / fps), không theo đồng hồ.
+    """
+
+    def __init__(self, fps=30.0, realtime=True, limit=None, size=None):
+        self.fps = fps
+        self.realtime = realtime
+        self.limit = limit
+        self.size = size
+        self.frames = 0
+        self.finished = False
+        self.timestamp = 0.0
+        self._native = None
+        self._next_due = None
+
+    def _next(self):
+        """Frame BGR tiếp theo hoặc None khi hết."""
+        raise NotImplementedError
+
+    def read(self):
+        if self.finished or (self.limit and self.frames >= self.limit):
+            self.finished = True
+            return False, None
+        frame = self._next()
+        if frame is None:
+            self.finished = True
+            return False, None
+
+        self._native = (frame.shape[1], frame.shape[0])
+        if self.size and self.size != self._native:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+        if self.realtime and self.fps:
+            now = time.monotonic()
+            if self._next_due is None:
+                self._next_due = now
+            if self._next_due > now:
+                time.sleep(self._next_due - now)
+            self._next_due = max(self._next_due + 1.0 / self.fps, now - 1.0)
+
+        self.frames += 1
+        self.timestamp = self.frames / self.fps if self.fps else float(self.frames)
+        return True, frame
+
+    def set(self, prop, value):
+        w, h = self.size or self._native or (0, 0)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.size = (int(value), h or int(value * 9 / 16))
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.size = (w or int(value * 16 / 9), int(value))
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = float(value)
+        else:
+            return False
+        return True
+
+    def get(self, prop):
+        w, h = self.size or self._native or (0, 0)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(w)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(h)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frames)
+        return 0.0
+
+    def isOpened(self):
+        return not self.finished
+
+    def release(self):
+        self.finished = True
+
+
+class VideoFileSource(FrameSource):
+    """Phát lại video đã ghi (mp4, avi...); loop=True phát lặp vô hạn."""
+
+    def __init__(self, path, loop=False, realtime=True, limit=None, size=None):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Không mở được video: {path}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        super().__init__(fps, realtime, limit, size)
+        # Biết độ phân giải ngay từ đầu (trước lần read() đầu) để bên dùng cấp bộ đệm đúng cỡ
+        self._native = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.path = path
+        self.loop = loop
+
+    def _next(self):
+        ok, frame = self.cap.read()
+        if not ok and self.loop and self.frames:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.cap.get(prop)
+        return super().get(prop)
+
+    def release(self):
+        super().release()
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    """Đọc lần lượt ảnh trong 1 thư mục (sắp theo tên), mỗi ảnh là 1 frame."""
+
+    def __init__(self, path, fps=10.0, loop=False, realtime=True, limit=None, size=None):
+        super().__init__(fps, realtime, limit, size)
+        self.paths = sorted(
+            os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTS)
+        )
+        if not self.paths:
+            raise IOError(f"Thư mục không có ảnh: {path}")
+        self.loop = loop
+        self._index = 0
+
+    def _next(self):
+        while True:
+            if self._index >= len(self.paths):
+                if not self.loop:
+                    return None
+                self._index = 0
+            img = cv2.imread(self.paths[self._index])
+            self._index += 1
+            if img is not None:
+                return img
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.paths))
+        return super().get(prop)
+
+
+class SyntheticSource(FrameSource):
+    """
+    Ảnh giả có thể tái lập (seed cố định): nền + SYNTHETIC_FACES ô di chuyển.
+    faces_dir (vd faces_db) có ảnh -> dán ảnh khuôn mặt thật để detect / nhận diện chạy thật,
+    không có -> ô xám (chỉ đo được capture, cổng chuyển động và tầng detect rỗng).
+    """
+
+    def __init__(self, size=(1280, 720), faces=SYNTHETIC_FACES, face_px=SYNTHETIC_FACE_PX,
+                 faces_dir=None, fps=30.0, realtime=False, limit=None, seed=0):
+        super().__init__(fps, realtime, limit, size)
+        rng = np.random.default_rng(seed)
+        w, h = size
+        self.face_px = face_px
+        self.pos = rng.uniform((0, 0), (w - face_px, h - face_px), (faces, 2))
+        self.vel = rng.uniform(-4, 4, (faces, 2))
+        self.background = np.zeros((h, w, 3), np.uint8)
+        self.background[:] = np.linspace(40, 120, w, dtype=np.uint8)[None, :, None]
+
+        self.sprites = []
+        if faces_dir and os.path.isdir(faces_dir):
+            for root, _, files in sorted(os.walk(faces_dir)):
+                for f in sorted(files):
+                    if f.lower().endswith(IMAGE_EXTS) and len(self.sprites) < faces:
+                        img = cv2.imread(os.path.join(root, f))
+                        if img is not None:
+                            self.sprites.append(cv2.resize(img, (face_px, face_px)))
+        if not self.sprites:
+            gray = np.full((face_px, face_px, 3), 180, np.uint8)
+            cv2.circle(gray, (face_px // 2, face_px // 2), face_px // 3, (90, 90, 90), -1)
+            self.sprites.append(gray)
+
+    def _next(self):
+        h, w = self.background.shape[:2]
+        frame = self.background.copy()
+        self.pos += self.vel
+        # Chạm mép thì bật lại
+        limit = np.array([w - self.face_px, h - self.face_px], dtype=float)
+        over = (self.pos < 0) | (self.pos > limit)
+        self.vel[over] *= -1
+        np.clip(self.pos, 0, limit, out=self.pos)
+        for i, (x, y) in enumerate(self.pos.astype(int)):
+            frame[y:y + self.face_px, x:x + self.face_px] = self.sprites[i % len(self.sprites)]
+        return frame
+
+
+def open_camera(index, size=None, fps=None):
+    """Webcam / RTSP: chính cv2.VideoCapture (đã có read/set/get), cấu hình như trước đây."""
+    cap = cv2.VideoCapture(index)
+    if size:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+    if fps:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+def open_source(spec=FRAME_SOURCE, size=None, fps=None, realtime=True, loop=False, limit=None):
+    """
+    Tạo nguồn frame từ chuỗi cấu hình:
+    số -> webcam, "synthetic[:WxH]" -> SyntheticSource, thư mục -> ImageDirSource,
+    URL (rtsp://, http://) -> camera IP, còn lại -> VideoFileSource.
+    """
+    spec = str(spec)
+    if spec.isdigit():
+        return open_camera(int(spec), size, fps)
+    if spec.startswith("synthetic"):
+        _, _, dims = spec.partition(":")
+        synth_size = tuple(int(v) for v in dims.split("x")) if dims else (size or (1280, 720))
+        return SyntheticSource(synth_size, fps=fps or 30.0, realtime=realtime, limit=limit,
+                               faces_dir=os.environ.get("SYNTHETIC_FACES_DIR"))
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, fps=fps or 10.0, loop=loop, realtime=realtime, limit=limit, size=size)
+    if "://" in spec:
+        return open_camera(spec, size, fps)
+    return VideoFileSource(spec, loop=loop, realtime=realtime, limit=limit, size=size)
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+import threading
+
+# ================= CẤU HÌNH SPOOL SỰ KIỆN =================
+SPOOL_PATH = "event_spool.db"   # File SQLite cạnh script, giữ sự kiện chưa gửi được
+SPOOL_PAGE_LIMIT = 500          # Số trang trống tối đa trả lại cho hệ điều hành mỗi lần compact
+
+
+class EventSpool:
+    """
+    Hàng đợi sự kiện bền vững trên đĩa (SQLite WAL, chỉ append + xóa theo thứ tự):
+    - append() ghi cả batch trong 1 transaction, synchronous=NORMAL -> không fsync mỗi sự kiện
+    - pending() đọc các sự kiện chưa được server xác nhận theo đúng thứ tự ghi
+    - ack() xóa các sự kiện đã xác nhận, compact() thu hồi trang trống + cắt file WAL
+    Chỉ thread nền của EventUploader dùng, vòng lặp camera không bao giờ chạm vào đĩa.
+    """
+
+    def __init__(self, path=SPOOL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # auto_vacuum phải đặt trước khi tạo bảng mới có tác dụng
+        self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " id TEXT UNIQUE NOT NULL,"
+            " type TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " ts REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def append(self, events):
+        rows = [(e["id"], e["type"], json.dumps(e["data"], ensure_ascii=False), e["ts"]) for e in events]
+        with self._lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT OR IGNORE INTO events (id, type, data, ts) VALUES (?, ?, ?, ?)", rows)
+            self.db.execute("COMMIT")
+
+    def pending(self, limit):
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT id, type, data, ts, attempts FROM events ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [{"id": i, "type": t, "data": json.loads(d), "ts": ts, "attempts": a} for i, t, d, ts, a in rows]
+
+    def ack(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in ids])
+            self.db.execute("COMMIT")
+
+    def mark_attempt(self, ids):
+        with self._lock:
+            self.db.execute("BEGIN")
+            self.db.executemany("UPDATE events SET attempts = attempts + 1 WHERE id = ?", [(i,) for i in ids])
+            self.db.execute("COMMIT")
+
+    def count(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def compact(self):
+        """Trả trang của sự kiện đã ack về hệ điều hành và cắt WAL về 0."""
+        with self._lock:
+            self.db.execute(f"PRAGMA incremental_vacuum({SPOOL_PAGE_LIMIT})")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self.db.close()
@@ -0,0 +1,262 @@
+import sys
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from pipeline import FramePipeline
+from sources import open_source
+from detection import ScaledFaceDetector, DETECT_MAX_SIDE
+from tracker import FaceTracker
+from recognizers import RECOGNIZER_BACKEND, LBPHBackend, SFaceBackend, create_backend
+
+# ================= CẤU HÌNH GIÁM SÁT NHIỀU CAMERA =================
+DATASET_DIR = "faces_db"
+YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
+
+CAMERA_SOURCES = [0, 1, 2]   # Index webcam hoặc URL RTSP cho từng camera trong phòng
+PRESENCE_TTL = 5.0           # Giây: không camera nào thấy quá lâu -> coi là vắng
+PUBLISH_INTERVAL = 0.5       # Giây giữa 2 lần worker gửi danh sách có mặt
+
+
+class SharedGallery:
+    """Gallery embedding (float32 M x 128) + id (int32 M) trong 1 block shared memory, chỉ đọc."""
+
+    def __init__(self, shm, gallery, ids, owner=False):
+        self.shm = shm
+        self.gallery = gallery
+        self.ids = ids
+        self.owner = owner
+
+    @classmethod
+    def create(cls, gallery, ids):
+        g = np.ascontiguousarray(gallery, dtype=np.float32)
+        i = np.ascontiguousarray(ids, dtype=np.int32)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, g.nbytes + i.nbytes))
+        view_g = np.ndarray(g.shape, dtype=np.float32, buffer=shm.buf)
+        view_i = np.ndarray(i.shape, dtype=np.int32, buffer=shm.buf, offset=g.nbytes)
+        view_g[:] = g
+        view_i[:] = i
+        return cls(shm, view_g, view_i, owner=True)
+
+    def descriptor(self):
+        return {"name": self.shm.name, "shape": self.gallery.shape}
+
+    @classmethod
+    def attach(cls, desc):
+        # Worker dùng chung resource_tracker với tiến trình giám sát, chỉ bên tạo mới unlink
+        shm = shared_memory.SharedMemory(name=desc["name"])
+
+        shape = tuple(desc["shape"])
+        gallery = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        ids = np.ndarray((shape[0],), dtype=np.int32, buffer=shm.buf, offset=gallery.nbytes)
+        gallery.flags.writeable = False
+        ids.flags.writeable = False
+        return cls(shm, gallery, ids)
+
+    def close(self):
+        self.gallery = self.ids = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedModel:
+    """Model LBPH đã serialize (bytes YAML) trong 1 block shared memory, chỉ đọc."""
+
+    def __init__(self, shm, size, owner=False):
+        self.shm = shm
+        self.size = size
+        self.owner = owner
+
+    @classmethod
+    def create(cls, data):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        return cls(shm, len(data), owner=True)
+
+    def descriptor(self):
+        return {"name": self.shm.name, "size": self.size}
+
+    @classmethod
+    def attach(cls, desc):
+        return cls(shared_memory.SharedMemory(name=desc["name"]), desc["size"])
+
+    def data(self):
+        return bytes(self.shm.buf[:self.size])
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def share_backend(backend):
+    """
+    Spec gửi sang tiến trình con + block shared memory (SharedGallery / SharedModel) mà bên gọi phải close().
+    LBPH gửi chính model đang chạy (không phụ thuộc file cache / dataset trên đĩa); OpenCV chỉ đọc được
+    model từ file nên mỗi worker vẫn giữ 1 bản trong RAM, nhưng không train hay đọc cache lại.
+    """
+    spec = {"backend": backend.name, "labels": backend.labels}
+    shared = None
+    if backend.name == "sface":
+        shared = SharedGallery.create(backend.gallery, backend.gallery_ids)
+        spec["gallery"] = shared.descriptor()
+    elif backend.trained:
+        shared = SharedModel.create(backend.model_bytes())
+        spec["model"] = shared.descriptor()
+    return spec, shared
+
+
+def build_backend(spec):
+    """Dựng recognizer trong worker từ spec mà tiến trình giám sát đã chuẩn bị."""
+    if spec["backend"] == "sface":
+        shared = SharedGallery.attach(spec["gallery"])
+        return SFaceBackend.from_gallery(shared.gallery, shared.ids, spec["labels"]), shared
+    if spec.get("model"):
+        shared = SharedModel.attach(spec["model"])
+        try:
+            return LBPHBackend.from_model_bytes(shared.data(), spec["labels"]), None
+        finally:
+            shared.close()
+    return LBPHBackend(), None
+
+
+def camera_worker(cam_id, source, spec, out_queue, stop_event):
+    """Tiến trình 1 camera: detect + track + nhận diện, gửi danh sách tên thấy được về giám sát."""
+    backend, shared = build_backend(spec)
+
+    cap = open_source(source, size=(1280, 720))
+
+    detector = ScaledFaceDetector(
+        cv2.FaceDetectorYN.create(YUNET_MODEL, "", (320, 320), 0.7, 0.3), DETECT_MAX_SIDE
+    )
+    tracker = FaceTracker()
+    seen = set()
+    last_publish = [0.0]
+
+    def analyze(frame):
+        tracks = tracker.update(detector.detect(frame))
+        tracker.identify(tracks, frame, backend)
+        return [t.name for t in tracks if t.name != "Unknown"]
+
+    def render(packet):
+        if stop_event.is_set():
+            return False
+        seen.update(packet.result)
+        if packet.ts - last_publish[0] >= PUBLISH_INTERVAL:
+            out_queue.put((cam_id, packet.ts, sorted(seen)))
+            seen.clear()
+            last_publish[0] = packet.ts
+        return True
+
+    print(f"📷 Camera {cam_id} ({source}) đang chạy")
+    try:
+        FramePipeline(cap, analyze, render).run()
+    finally:
+        cap.release()
+        if shared:
+            shared.close()
+
+
+class CameraSupervisor:
+    """
+    Chạy N camera trong N tiến trình con; gallery được load 1 lần ở đây:
+    - SFace: ma trận embedding đặt trong shared memory, worker chỉ map vào (không copy)
+    - LBPH: model train 1 lần, bytes model đặt trong shared memory, worker load từ đó (không train lại)
+    Kết quả từng camera được gộp thành 1 danh sách có mặt cho cả phòng.
+    """
+
+    def __init__(self, sources=CAMERA_SOURCES, backend=RECOGNIZER_BACKEND):
+        self.sources = list(sources)
+        self.backend_name = backend
+        self.labels = {}
+        self.shared = None
+        self.spec = None
+        self.processes = []
+        self.last_seen = {}        # {tên: {cam_id: thời điểm}}
+        self.present = set()
+        ctx = mp.get_context("spawn")
+        self.ctx = ctx
+        self.queue = ctx.Queue()
+        self.stop_event = ctx.Event()
+
+    def load_gallery(self):
+        backend = create_backend(self.backend_name, YUNET_MODEL)
+        self.labels = backend.train(DATASET_DIR)
+        self.spec, self.shared = share_backend(backend)
+        print(f"✅ Gallery chung: {len(self.labels)} sinh viên ({backend.name})")
+
+    def start(self):
+        if self.spec is None:
+            self.load_gallery()
+        for cam_id, source in enumerate(self.sources):
+            p = self.ctx.Process(
+                target=camera_worker,
+                args=(cam_id, source, self.spec, self.queue, self.stop_event),
+                daemon=True,
+            )
+            p.start()
+            self.processes.append(p)
+
+    def roster(self, now=None):
+        """{tên: [camera đang thấy]} cho các sinh viên còn trong PRESENCE_TTL."""
+        now = time.time() if now is None else now
+        result = {}
+        for name, cams in self.last_seen.items():
+            live = sorted(c for c, ts in cams.items() if now - ts <= PRESENCE_TTL)
+            if live:
+                result[name] = live
+        return result
+
+    def absent(self, now=None):
+        present = self.roster(now)
+        return sorted(n for n in self.labels.values() if n not in present)
+
+    def _merge(self, cam_id, ts, names):
+        for name in names:
+            self.last_seen.setdefault(name, {})[cam_id] = ts
+
+    def run(self):
+        self.start()
+        last_report = 0
+        try:
+            while any(p.is_alive() for p in self.processes):
+                try:
+                    self._merge(*self.queue.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+
+                now = time.time()
+                if now - last_report >= 1.0:
+                    present = set(self.roster(now))
+                    for name in sorted(present - self.present):
+                        print(f"✅ Có mặt: {name}")
+                    for name in sorted(self.present - present):
+                        print(f"⚠ Rời khỏi phòng: {name}")
+                    self.present = present
+                    last_report = now
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        for p in self.processes:
+            p.join(timeout=3)
+            if p.is_alive():
+                p.terminate()
+        if self.shared:
+            self.shared.close()
+            self.shared = None
+
+
+if __name__ == "__main__":
+    # python supervisor.py 0 1 rtsp://... clip.mp4  (mặc định CAMERA_SOURCES)
+    args = [int(a) if a.isdigit() else a for a in sys.argv[1:]]
+    print("▶ SMART CLASSROOM – GIÁM SÁT NHIỀU CAMERA")
+    CameraSupervisor(args or CAMERA_SOURCES).run()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các module trong ai_processor/ import lẫn nhau dạng "from spool import EventSpool"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from cooldown import CooldownStore
+
+
+def test_allow_blocks_until_ttl_expires():
+    store = CooldownStore()
+    assert store.allow(("An", "NGỦ GẬT"), ttl=3, now=100)
+    assert not store.allow(("An", "NGỦ GẬT"), ttl=3, now=102.9)
+    assert store.allow(("An", "SAI ĐỒNG PHỤC"), ttl=3, now=102.9)
+    assert store.allow(("An", "NGỦ GẬT"), ttl=3, now=103)
+
+
+def test_remaining_and_expired_keys_are_dropped():
+    store = CooldownStore(ttl=10)
+    store.allow("a", now=0)
+    store.allow("b", ttl=20, now=0)
+    assert store.remaining("a", now=4) == 6
+    assert len(store) == 2
+
+    assert store.remaining("a", now=10) == 0
+    assert len(store) == 1
+
+
+def test_default_ttl_lasts_until_reset():
+    resets = []
+    store = CooldownStore(on_reset=lambda: resets.append(True))
+    assert store.allow(("attendance", "An"), now=0)
+    assert not store.allow(("attendance", "An"), now=1e9)
+
+    store.reset()
+    assert resets == [True]
+    assert store.allow(("attendance", "An"), now=1e9)
+
+
+def test_max_keys_evicts_soonest_expiry():
+    store = CooldownStore(max_keys=2)
+    store.allow("long", ttl=100, now=0)
+    store.allow("short", ttl=5, now=0)
+    store.allow("mid", ttl=50, now=0)
+
+    assert len(store) == 2
+    assert store.remaining("short", now=1) == 0
+    assert store.remaining("long", now=1) == 99
+
+
+def test_repeated_keys_keep_heap_bounded():
+    store = CooldownStore()
+    for i in range(1000):
+        store.allow("same", ttl=1, now=float(i))
+    assert len(store) == 1
+    assert len(store._heap) <= 2 * len(store) + 64
+
+
+def test_daily_reset_clears_on_new_day():
+    store = CooldownStore(daily_reset=True)
+    today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    store._day = today.date()
+    assert store.allow(("attendance", "An"), now=today.timestamp())
+    assert not store.allow(("attendance", "An"), now=today.timestamp() + 60)
+    assert store.allow(("attendance", "An"), now=(today + timedelta(days=1)).timestamp())
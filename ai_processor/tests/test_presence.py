@@ -0,0 +1,56 @@
+from presence import PresenceTracker
+
+
+def tracker(names=("An", "Bình", "Chi"), **kw):
+    return PresenceTracker({i: name for i, name in enumerate(names)}, **kw)
+
+
+def test_present_only_after_enter_hits():
+    p = tracker(enter_hits=3, leave_after=5)
+    assert not p.update(["An"], 0)
+    assert not p.update(["An"], 1)
+    assert p.update(["An"], 2)
+    assert p.present_names() == ["An"]
+    assert p.absent_names() == ["Bình", "Chi"]
+    assert (p.present_count, p.absent_count) == (1, 2)
+
+
+def test_absent_after_leave_timeout():
+    p = tracker(enter_hits=1, leave_after=5)
+    p.update(["An", "Bình"], 0)
+    p.update(["Bình"], 4)
+
+    assert not p.update([], 5)
+    assert p.update([], 5.1)
+    assert p.present_names() == ["Bình"]
+    assert p.update([], 9.1)
+    assert p.present_count == 0
+
+
+def test_gap_longer_than_leave_after_restarts_hit_count():
+    p = tracker(enter_hits=2, leave_after=5)
+    p.update(["An"], 0)
+    p.update(["An"], 10)
+    assert p.present_count == 0
+    assert p.update(["An"], 11)
+
+
+def test_unknown_names_are_ignored_and_version_tracks_changes():
+    p = tracker(enter_hits=1)
+    version = p.version
+    assert not p.update(["Unknown", "Dũng"], 0)
+    assert p.version == version
+    assert p.update(["Chi"], 0)
+    assert p.version == version + 1
+
+
+def test_set_roster_keeps_existing_state():
+    p = tracker(("An", "Bình"), enter_hits=1, leave_after=5)
+    p.update(["An"], 0)
+
+    p.set_roster({0: "An", 1: "Bình", 2: "Chi"})
+    assert p.present_names() == ["An"]
+    assert p.absent_names() == ["Bình", "Chi"]
+    # An vẫn được theo dõi để hết hạn như bình thường
+    assert p.update([], 6)
+    assert p.present_count == 0
@@ -0,0 +1,109 @@
+import cv2
+
+from resolution import ResolutionController, capture_size
+
+LADDER = [(640, 480), (1280, 720), (1920, 1080)]
+
+
+class FakeDetector:
+    def __init__(self, max_side):
+        self.max_side = max_side
+
+
+class FakeCapture:
+    """Camera giả: chỉ nhận các độ phân giải trong `supported`."""
+
+    def __init__(self, size, supported=LADDER):
+        self.size = list(size)
+        self.supported = supported
+        self.requested = list(size)
+
+    def set(self, prop, value):
+        self.requested[0 if prop == cv2.CAP_PROP_FRAME_WIDTH else 1] = int(value)
+        if tuple(self.requested) in self.supported:
+            self.size = list(self.requested)
+
+    def get(self, prop):
+        return self.size[0 if prop == cv2.CAP_PROP_FRAME_WIDTH else 1]
+
+
+def controller(**kw):
+    kw.setdefault("min_samples", 5)
+    kw.setdefault("hold", 10)
+    return ResolutionController(LADDER, **kw)
+
+
+def test_start_level_and_largest():
+    c = controller(start=(1280, 720))
+    assert c.level == 1 and c.size == (1280, 720)
+    assert c.largest == (1920, 1080)
+
+
+def test_small_faces_step_up_one_level():
+    det = FakeDetector(640)
+    c = controller(start=(640, 480), detector=det)
+    c.switched_at = 0
+    c.observe([30] * 5, (640, 480), now=20)
+    assert c.pending == 1
+
+    cap = FakeCapture((640, 480))
+    c.apply(cap)
+    assert c.level == 1 and tuple(cap.size) == (1280, 720)
+    assert det.max_side == 1280
+    assert c.switches == 1
+
+
+def test_large_faces_step_down_with_margin():
+    # 100px ở 1080p -> ~67px ở 720p: chưa đủ 48 x 1.5; 120px -> 80px thì đủ
+    for height, expected in ((100, None), (120, 1)):
+        c = controller(start=(1920, 1080))
+        c.switched_at = 0
+        c.observe([height] * 5, (1920, 1080), now=20)
+        assert c.pending == expected
+
+
+def test_hold_and_min_samples_delay_decisions():
+    c = controller(start=(640, 480))
+    c.switched_at = 15
+    c.observe([30] * 4, (640, 480), now=20)
+    assert c.pending is None
+    c.observe([30], (640, 480), now=20)
+    assert c.pending is None
+    c.observe([30], (640, 480), now=25)
+    assert c.pending == 1
+
+
+def test_samples_from_other_frame_size_are_discarded():
+    c = controller(start=(640, 480))
+    c.switched_at = 0
+    c.observe([30] * 4, (640, 480), now=20)
+    c.observe([30], (1280, 720), now=20)
+    assert c.pending is None
+
+
+def test_unsupported_level_is_remembered_and_skipped():
+    det = FakeDetector(640)
+    c = controller(start=(640, 480), detector=det)
+    cap = FakeCapture((640, 480), supported=[(640, 480), (1920, 1080)])
+    c.pending = 1
+    c.apply(cap)
+    assert c.level == 0 and tuple(cap.size) == (640, 480)
+    assert c.unsupported == {1} and det.max_side == 640
+
+    c.switched_at = 0
+    c.observe([30] * 5, (640, 480), now=20)
+    assert c.pending == 2
+
+
+def test_full_frame_detect_side_is_left_alone():
+    det = FakeDetector(0)
+    c = controller(start=(640, 480), detector=det)
+    assert c.detect_side(2) == 0
+    c.pending = 2
+    c.apply(FakeCapture((640, 480)))
+    assert c.level == 2 and det.max_side == 0
+
+
+def test_capture_size():
+    assert capture_size(FakeCapture((1280, 720))) == (1280, 720)
+    assert capture_size(FakeCapture((0, 0))) is None
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from snapshots import SnapshotPublisher, diff_stats
+
+
+def test_diff_stats_shapes():
+    old = {"present": ["An", "Bình"], "violations": {"An": 1, "Chi": 2}, "fps": 10, "seq": 3, "time": "a"}
+    new = {"present": ["Bình", "Dũng"], "violations": {"An": 2}, "fps": 10, "seq": 4, "time": "b",
+           "absent": ["Em"]}
+    assert diff_stats(old, new) == {
+        "present": {"add": ["Dũng"], "remove": ["An"]},
+        "violations": {"An": 2, "Chi": None},
+        "absent": {"add": ["Em"], "remove": []},
+    }
+    assert diff_stats(new, dict(new, seq=9, time="c")) == {}
+
+
+def test_publish_only_when_content_changes():
+    published = []
+    pub = SnapshotPublisher(max_rate=0, on_publish=published.append)
+    first = pub.publish(lambda: {"present": ["An"], "fps": 10})
+    assert first.version == 1 and first.data["seq"] == 1
+    assert json.loads(first.body) == {"present": ["An"], "fps": 10, "seq": 1}
+
+    assert pub.publish(lambda: {"present": ["An"], "fps": 10}) is None
+    second = pub.publish(lambda: {"present": ["An", "Bình"], "fps": 10})
+    assert second.version == 2
+    assert second.delta == {"present": {"add": ["Bình"], "remove": []}}
+    assert pub.current is second
+    assert published == [first, second]
+
+
+def test_rate_limit_skips_build_and_force_bypasses_it():
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"fps": len(calls)}
+
+    pub = SnapshotPublisher(max_rate=1)
+    assert pub.publish(build) is not None
+    assert pub.publish(build) is None
+    assert len(calls) == 1
+
+    forced = pub.publish(lambda: {"fps": 1}, force=True)
+    assert forced is not None and forced.delta == {}
+
+
+def test_snapshot_is_read_only_and_etag_follows_version():
+    pub = SnapshotPublisher(max_rate=0)
+    snap = pub.publish(lambda: {"fps": 1})
+    with pytest.raises(TypeError):
+        snap.data["fps"] = 2
+    assert snap.etag == f"{pub.boot}-1"
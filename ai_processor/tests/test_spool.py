@@ -0,0 +1,50 @@
+from spool import EventSpool
+
+
+def event(i, kind="report"):
+    return {"id": f"e{i}", "type": kind, "data": {"name": f"SV{i}", "type": "NGỦ GẬT"}, "ts": 1000.0 + i}
+
+
+def test_pending_keeps_append_order(tmp_path):
+    spool = EventSpool(str(tmp_path / "spool.db"))
+    spool.append([event(i) for i in range(3)])
+    spool.append([event(3)])
+
+    rows = spool.pending(10)
+    assert [r["id"] for r in rows] == ["e0", "e1", "e2", "e3"]
+    assert rows[0]["data"] == {"name": "SV0", "type": "NGỦ GẬT"}
+    assert rows[0]["attempts"] == 0
+    assert [r["id"] for r in spool.pending(2)] == ["e0", "e1"]
+
+
+def test_duplicate_id_is_ignored(tmp_path):
+    spool = EventSpool(str(tmp_path / "spool.db"))
+    spool.append([event(0), event(1)])
+    spool.append([event(1)])
+    assert spool.count() == 2
+
+
+def test_ack_and_mark_attempt(tmp_path):
+    spool = EventSpool(str(tmp_path / "spool.db"))
+    spool.append([event(i) for i in range(3)])
+
+    spool.ack({"e0", "e2"})
+    spool.ack(set())
+    spool.mark_attempt(["e1"])
+    spool.mark_attempt(["e1"])
+
+    rows = spool.pending(10)
+    assert [(r["id"], r["attempts"]) for r in rows] == [("e1", 2)]
+
+
+def test_events_survive_reopen(tmp_path):
+    path = str(tmp_path / "spool.db")
+    spool = EventSpool(path)
+    spool.append([event(0), event(1, "env")])
+    spool.ack(["e0"])
+    spool.compact()
+    spool.close()
+
+    spool = EventSpool(path)
+    assert spool.count() == 1
+    assert spool.pending(10)[0]["type"] == "env"
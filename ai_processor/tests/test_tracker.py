@@ -0,0 +1,105 @@
+import numpy as np
+
+from tracker import FaceTracker, iou_matrix
+
+
+def faces(*boxes):
+    rows = np.zeros((len(boxes), 15), dtype=np.float32)
+    for i, box in enumerate(boxes):
+        rows[i, :4] = box
+        rows[i, 14] = 0.9
+    return rows
+
+
+class FakeBackend:
+    def __init__(self, names):
+        self.names = names
+        self.calls = []
+
+    def recognize_many(self, frame, rows):
+        self.calls.append(len(rows))
+        return [(self.names.get(int(r[0]), "Unknown"), 0.0) for r in rows]
+
+
+FRAME = np.zeros((480, 640, 3), dtype=np.uint8)
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]], dtype=np.float32)
+    np.testing.assert_allclose(iou_matrix(a, b), [[1.0, 50 / 150, 0.0]], rtol=1e-6)
+
+
+def test_tracks_follow_moving_boxes():
+    t = FaceTracker()
+    first = t.update(faces((0, 0, 50, 50), (200, 0, 50, 50)), now=0)
+    ids = [tr.id for tr in first]
+
+    second = t.update(faces((205, 2, 50, 50), (4, 3, 50, 50)), now=1)
+    assert sorted(tr.id for tr in second) == sorted(ids)
+    moved = {tr.id: (tr.box, tr.index, tr.hits) for tr in second}
+    assert moved[ids[0]] == ((4, 3, 50, 50), 1, 2)
+    assert moved[ids[1]] == ((205, 2, 50, 50), 0, 2)
+
+
+def test_unmatched_box_starts_new_track_and_lost_tracks_expire():
+    t = FaceTracker(max_misses=2)
+    old = t.update(faces((0, 0, 50, 50)), now=0)[0]
+    new = t.update(faces((300, 300, 50, 50)), now=1)[0]
+    assert new.id != old.id
+    assert old.misses == 1 and old.index == -1
+
+    t.update(None, now=2)
+    assert old in t.tracks
+    t.update(None, now=3)
+    assert old not in t.tracks and new in t.tracks
+    t.reset()
+    assert t.tracks == []
+
+
+def test_recognition_schedule():
+    t = FaceTracker(reverify_interval=10, unknown_retry=1)
+    tr = t.update(faces((0, 0, 50, 50)), now=0)[0]
+    assert t.needs_recognition(tr, now=0)
+
+    t.set_identity(tr, "An", now=0)
+    assert not t.needs_recognition(tr, now=9)
+    assert t.needs_recognition(tr, now=10)
+
+    # Một lần xác minh thất bại không xóa tên đã biết
+    t.set_identity(tr, "Unknown", now=10)
+    assert tr.name == "An" and tr.last_verified == 10
+
+
+def test_identify_batches_only_due_tracks():
+    t = FaceTracker(reverify_interval=10, unknown_retry=1)
+    backend = FakeBackend({0: "An"})
+    tracks = t.update(faces((0, 0, 50, 50), (200, 0, 50, 50)), now=0)
+
+    assert t.identify(tracks, FRAME, backend, now=0) == 2
+    assert [tr.name for tr in tracks] == ["An", "Unknown"]
+
+    tracks = t.update(faces((0, 0, 50, 50), (200, 0, 50, 50)), now=0.5)
+    assert t.identify(tracks, FRAME, backend, now=0.5) == 0
+
+    # Track Unknown thử lại sau unknown_retry, nhưng chỉ khi lịch "identify" đến lượt
+    tracks = t.update(faces((0, 0, 50, 50), (200, 0, 50, 50)), now=2)
+    assert t.identify(tracks, FRAME, backend, now=2, reverify=False) == 0
+    assert t.identify(tracks, FRAME, backend, now=2) == 1
+
+    # Track mới luôn được nhận diện ngay
+    tracks = t.update(faces((0, 0, 50, 50), (200, 0, 50, 50), (400, 0, 50, 50)), now=2.1)
+    assert t.identify(tracks, FRAME, backend, now=2.1, reverify=False) == 1
+    assert backend.calls == [2, 1, 1]
+
+
+def test_forget_unknown_after_enrollment():
+    t = FaceTracker(unknown_retry=100)
+    backend = FakeBackend({0: "An"})
+    tracks = t.update(faces((0, 0, 50, 50), (200, 0, 50, 50)), now=0)
+    t.identify(tracks, FRAME, backend, now=0)
+
+    backend.names[200] = "Bình"
+    t.forget_unknown()
+    assert t.identify(tracks, FRAME, backend, now=1, reverify=False) == 1
+    assert [tr.name for tr in tracks] == ["An", "Bình"]
@@ -0,0 +1,151 @@
+import pytest
+import requests
+
+from uploader import EventUploader
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.ok = 200 <= status_code < 300
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("không có JSON")
+        return self._body
+
+
+class FakeSession:
+    """Ghi lại mọi request, trả lời bằng handler(url, json)."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+
+    def post(self, url, json=None, timeout=None):
+        self.calls.append((url, json))
+        return self.handler(url, json)
+
+    def close(self):
+        pass
+
+
+def batch_ok(url, body):
+    return FakeResponse(200, {"status": "ok", "results": [{"id": e["id"], "status": "ok"} for e in body["events"]]})
+
+
+@pytest.fixture
+def uploader(tmp_path):
+    u = EventUploader("http://server/api/", spool_path=str(tmp_path / "spool.db"))
+    # Dừng thread nền: test gọi thẳng _deliver / _drain
+    u.running = False
+    u._thread.join(timeout=5)
+    yield u
+    u.spool.close()
+
+
+def use(uploader, handler):
+    uploader.session = FakeSession(handler)
+    return uploader.session
+
+
+def make_events(n):
+    return [{"id": f"e{i}", "type": "report", "data": {"i": i}, "ts": 1000.0 + i} for i in range(n)]
+
+
+def test_batch_marks_only_rejected_events_failed(uploader):
+    use(uploader, lambda url, body: FakeResponse(200, {"results": [{"id": "e1", "status": "error"}]}))
+    events = make_events(3)
+
+    assert uploader._deliver(events) == {"e0", "e1", "e2"}
+    assert [uploader.status(e["id"]) for e in events] == ["sent", "failed", "sent"]
+
+
+@pytest.mark.parametrize("code", [401, 403, 408, 429, 500, 503])
+def test_transient_errors_keep_events(uploader, code):
+    use(uploader, lambda url, body: FakeResponse(code, headers={"Retry-After": "7"}))
+    events = make_events(2)
+
+    assert uploader._deliver(events) == set()
+    assert uploader.status("e0") is None
+    assert uploader._retry_after == 7.0
+
+
+def test_network_error_keeps_events(uploader):
+    def fail(url, body):
+        raise requests.ConnectionError("mất mạng")
+    use(uploader, fail)
+    assert uploader._deliver(make_events(2)) == set()
+
+
+def test_too_large_splits_batch_in_order(uploader):
+    def handler(url, body):
+        return FakeResponse(413) if len(body["events"]) > 2 else batch_ok(url, body)
+    session = use(uploader, handler)
+    events = make_events(8)
+
+    assert uploader._deliver(events) == {e["id"] for e in events}
+    sent = [e["id"] for url, body in session.calls if len(body["events"]) <= 2 for e in body["events"]]
+    assert sent == [e["id"] for e in events]
+    assert uploader.batch_size == 2
+
+
+def test_too_large_stops_after_failed_first_half(uploader):
+    def handler(url, body):
+        if len(body["events"]) > 2:
+            return FakeResponse(413)
+        return FakeResponse(503) if body["events"][0]["id"] == "e0" else batch_ok(url, body)
+    session = use(uploader, handler)
+
+    assert uploader._deliver(make_events(4)) == set()
+    assert all(body["events"][0]["id"] != "e2" for url, body in session.calls)
+
+
+def test_missing_batch_endpoint_falls_back_to_single_events(uploader):
+    def handler(url, body):
+        return FakeResponse(404) if url.endswith("/events/batch") else FakeResponse(200)
+    session = use(uploader, handler)
+
+    assert uploader._deliver(make_events(2)) == {"e0", "e1"}
+    assert not uploader.batch_supported
+    assert [url for url, _ in session.calls] == ["http://server/api/events/batch",
+                                                 "http://server/api/report", "http://server/api/report"]
+
+
+def test_rejected_batch_isolates_invalid_event(uploader):
+    def handler(url, body):
+        if url.endswith("/events/batch"):
+            return FakeResponse(400)
+        return FakeResponse(422) if body["i"] == 1 else FakeResponse(200)
+    use(uploader, handler)
+    events = make_events(3)
+
+    assert uploader._deliver(events) == {"e0", "e1", "e2"}
+    assert [uploader.status(e["id"]) for e in events] == ["sent", "failed", "sent"]
+    assert uploader.batch_supported
+
+
+def test_single_events_stop_at_first_transient_error(uploader):
+    uploader.batch_supported = False
+    use(uploader, lambda url, body: FakeResponse(429) if body["i"] == 1 else FakeResponse(200))
+
+    assert uploader._deliver(make_events(3)) == {"e0"}
+    assert uploader.status("e2") is None
+
+
+def test_drain_keeps_spool_and_backs_off_until_server_accepts(uploader):
+    uploader.spool.append(make_events(3))
+    use(uploader, lambda url, body: FakeResponse(401))
+
+    uploader._drain()
+    assert uploader.spool.count() == 3
+    assert uploader._backoff >= 1.0
+    assert [e["attempts"] for e in uploader.spool.pending(3)] == [1, 1, 1]
+
+    use(uploader, batch_ok)
+    uploader._drain()
+    assert uploader.spool.count() == 0
+    assert uploader._backoff == 0
+    assert uploader.stats()["sent"] == 3
@@ -0,0 +1,82 @@
+import queue
+
+import numpy as np
+
+from pipeline import FramePacket
+from workers import FrameRing, PooledFramePipeline
+
+
+class FakeCapture:
+    def get(self, prop):
+        return 0
+
+
+def frame(value):
+    return np.full((48, 64, 3), value, dtype=np.uint8)
+
+
+def coordinator(slots=2):
+    """Bộ điều phối không có tiến trình worker: task chỉ được xếp vào hàng đợi."""
+    pool = PooledFramePipeline(FakeCapture(), lambda f, faces, now=None: faces, lambda p: True,
+                               workers=1, max_frame=(64, 48))
+    pool._ring = FrameRing.create(slots, pool.max_frame)
+    pool._free.extend(range(slots))
+    pool._tasks = queue.Queue()
+    return pool
+
+
+def test_ring_roundtrip_through_attach():
+    ring = FrameRing.create(2, (64, 48))
+    try:
+        ring.write(1, frame(7))
+        other = FrameRing.attach(ring.descriptor())
+        assert (other.view(1, (48, 64, 3)) == 7).all()
+        assert not other.view(0, (48, 64, 3)).any()
+        other.close()
+    finally:
+        ring.close()
+
+
+def test_slots_are_handed_out_until_ring_is_full():
+    pool = coordinator()
+    try:
+        for seq in (1, 2, 3):
+            pool._feed(FramePacket(seq, 0.0, frame(seq)))
+        assert pool.sent == 2 and pool.dropped == 1
+        assert [pool._tasks.get_nowait()[:2] for _ in range(2)] == [(1, 0), (2, 1)]
+        assert (pool._ring.view(1, (48, 64, 3)) == 2).all()
+    finally:
+        pool._ring.close()
+
+
+def test_expired_frame_quarantines_slot_until_worker_is_gone():
+    pool = coordinator()
+    try:
+        pool._feed(FramePacket(1, 0.0, frame(1)))
+        sent_at = pool._inflight[1][1]
+
+        done = pool._release(sent_at + pool.task_timeout + 1)
+        assert [(p.seq, result) for p, result in done] == [(1, None)]
+        # Worker treo có thể vẫn đọc slot 0 -> không được cấp lại
+        assert pool._abandoned == {1: 0} and list(pool._free) == [1]
+        assert pool.expired == 1
+
+        pool._reclaim(1)
+        assert pool._abandoned == {} and sorted(pool._free) == [0, 1]
+    finally:
+        pool._ring.close()
+
+
+def test_reclaim_of_in_flight_frame_frees_slot_and_keeps_order():
+    pool = coordinator()
+    try:
+        pool._feed(FramePacket(1, 0.0, frame(1)))
+        pool._feed(FramePacket(2, 0.0, frame(2)))
+        pool._ready[2] = "faces-2"
+
+        pool._reclaim(1)
+        assert list(pool._free) == [0]
+        done = pool._release(pool._inflight[2][1])
+        assert [(p.seq, result) for p, result in done] == [(1, None), (2, "faces-2")]
+    finally:
+        pool._ring.close()
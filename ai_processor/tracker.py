@@ -0,0 +1,153 @@
+import time
+import numpy as np
+
+from metrics import STAGE_SECONDS, RECOGNIZER_CALLS, RECOGNIZED_FACES
+
+# ================= CẤU HÌNH TRACKER =================
+IOU_THRESHOLD = 0.3           # IoU tối thiểu để ghép box mới với track cũ
+MAX_MISSES = 10               # Số frame mất dấu trước khi xóa track
+REVERIFY_INTERVAL = 10.0      # Giây: nhận diện lại track đã biết tên
+UNKNOWN_RETRY_INTERVAL = 1.0  # Giây: thử nhận diện lại track "Unknown"
+
+RECOGNIZE_SECONDS = STAGE_SECONDS.labels("recognize")
+
+
+class Track:
+    """Một khuôn mặt được theo dõi qua nhiều frame."""
+    __slots__ = ("id", "face", "index", "name", "hits", "misses", "last_seen", "last_verified")
+
+    def __init__(self, track_id, face, now, index=-1):
+        self.id = track_id
+        self.face = face              # Hàng YuNet mới nhất (box + landmarks + score)
+        self.index = index            # Vị trí trong mảng faces của frame hiện tại (-1 = mất dấu)
+        self.name = "Unknown"
+        self.hits = 1
+        self.misses = 0
+        self.last_seen = now
+        self.last_verified = None     # None = chưa nhận diện lần nào
+
+    @property
+    def box(self):
+        return tuple(map(int, self.face[:4]))
+
+
+def iou_matrix(a, b):
+    """IoU giữa mọi cặp box (x, y, w, h): a (N x 4), b (M x 4) -> (N x M)."""
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+
+    iw = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    ih = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = iw * ih
+    union = (a[:, 2:3] * a[:, 3:4]) + (b[:, 2] * b[:, 3]) - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class FaceTracker:
+    """
+    Tracker IoU đơn giản giữa detect và nhận diện:
+    - ghép tham lam theo IoU giảm dần, mỗi track / mỗi box dùng tối đa 1 lần
+    - track mới sinh ra cho box không ghép được, track mất dấu quá MAX_MISSES bị xóa
+    - nhận diện chỉ chạy khi track mới sinh hoặc đến hạn xác minh lại
+    """
+
+    def __init__(self, iou_threshold=IOU_THRESHOLD, max_misses=MAX_MISSES,
+                 reverify_interval=REVERIFY_INTERVAL, unknown_retry=UNKNOWN_RETRY_INTERVAL):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reverify_interval = reverify_interval
+        self.unknown_retry = unknown_retry
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, faces, now=None):
+        """Cập nhật với mảng faces của YuNet, trả về các track có mặt trong frame này."""
+        now = time.time() if now is None else now
+        if faces is None or len(faces) == 0:
+            faces = np.empty((0, 15), dtype=np.float32)
+
+        matched_tracks = set()
+        matched_faces = set()
+        visible = []
+
+        if self.tracks and len(faces):
+            old = np.array([t.face[:4] for t in self.tracks], dtype=np.float32)
+            ious = iou_matrix(old, faces[:, :4].astype(np.float32))
+            order = np.argsort(-ious, axis=None)
+            for flat in order:
+                ti, fi = divmod(int(flat), ious.shape[1])
+                if ious[ti, fi] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or fi in matched_faces:
+                    continue
+                matched_tracks.add(ti)
+                matched_faces.add(fi)
+
+                t = self.tracks[ti]
+                t.face = faces[fi]
+                t.index = fi
+                t.hits += 1
+                t.misses = 0
+                t.last_seen = now
+                visible.append(t)
+
+        survivors = []
+        for i, t in enumerate(self.tracks):
+            if i not in matched_tracks:
+                t.misses += 1
+                t.index = -1
+                if t.misses > self.max_misses:
+                    continue
+            survivors.append(t)
+
+        for fi in range(len(faces)):
+            if fi in matched_faces:
+                continue
+            t = Track(self._next_id, faces[fi], now, fi)
+            self._next_id += 1
+            survivors.append(t)
+            visible.append(t)
+
+        self.tracks = survivors
+        return visible
+
+    def needs_recognition(self, track, now=None):
+        if track.last_verified is None:
+            return True
+        now = time.time() if now is None else now
+        interval = self.unknown_retry if track.name == "Unknown" else self.reverify_interval
+        return now - track.last_verified >= interval
+
+    def set_identity(self, track, name, now=None):
+        # Một lần xác minh lại thất bại (mặt nghiêng, mờ) không xóa tên đã biết
+        if name != "Unknown" or track.name == "Unknown":
+            track.name = name
+        track.last_verified = time.time() if now is None else now
+
+    def identify(self, tracks, frame, backend, now=None, reverify=True):
+        """
+        Nhận diện 1 batch các track đến hạn bằng backend.recognize_many, trả về số mặt đã xử lý.
+        reverify=False: chỉ nhận diện track chưa từng được nhận diện (lịch xác minh lại chưa đến lượt).
+        """
+        pending = [t for t in tracks
+                   if t.last_verified is None or (reverify and self.needs_recognition(t, now))]
+        if pending:
+            faces = np.stack([t.face for t in pending])
+            RECOGNIZER_CALLS.inc()
+            RECOGNIZED_FACES.inc(len(pending))
+            with RECOGNIZE_SECONDS.time():
+                results = backend.recognize_many(frame, faces)
+            for t, (name, _) in zip(pending, results):
+                self.set_identity(t, name, now)
+        return len(pending)
+
+    def forget_unknown(self):
+        """Model vừa đổi (đăng ký nóng): track "Unknown" được nhận diện lại ngay ở frame sau."""
+        for t in self.tracks:
+            if t.name == "Unknown":
+                t.last_verified = None
+
+    def reset(self):
+        self.tracks = []
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+# ================= CẤU HÌNH KIỂM TRA ĐỒNG PHỤC =================
+WHITE_HSV = ((0, 0, 200), (180, 40, 255))     # Áo trắng (H, S, V)
+WHITE_HSV_WIDE = ((0, 0, 168), (172, 111, 255))  # Áo trắng, dải rộng hơn (a.py, aa.py)
+BLUE_HSV = ((90, 50, 50), (130, 255, 255))    # Áo xanh (ai_camera.py)
+UNIFORM_RATIO = 0.3                           # Tỉ lệ pixel đúng màu tối thiểu trong vùng ngực
+
+
+def clip_rect(x0, y0, x1, y1, shape):
+    """Cắt (x0, y0, x1, y1) vào trong frame; None nếu vùng rỗng."""
+    h, w = shape[:2]
+    x0, y0 = max(0, int(x0)), max(0, int(y0))
+    x1, y1 = min(w, int(x1)), min(h, int(y1))
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+
+def chest_below(box, shape, height):
+    """Vùng ngực ngay dưới khuôn mặt, cao `height` pixel, rộng bằng khuôn mặt."""
+    x, y, w, h = box
+    return clip_rect(x, y + h, x + w, y + h + height, shape)
+
+
+class ColorCoverage:
+    """
+    Tỉ lệ pixel nằm trong dải màu HSV cho nhiều vùng của cùng 1 frame:
+    chỉ đổi HSV + inRange + integral image 1 lần trên khung bao tất cả vùng,
+    sau đó fraction(rect) của mỗi khuôn mặt là O(1) (4 phép tra bảng).
+    """
+
+    def __init__(self, frame, rects, lower, upper):
+        rects = [r for r in rects if r]
+        self.origin = (0, 0)
+        self.integral = None
+        if not rects:
+            return
+
+        x0 = min(r[0] for r in rects)
+        y0 = min(r[1] for r in rects)
+        x1 = max(r[2] for r in rects)
+        y1 = max(r[3] for r in rects)
+
+        hsv = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
+        # mask 0/255 -> 0/1 để integral đếm đúng số pixel
+        self.integral = cv2.integral(mask // 255, sdepth=cv2.CV_32S)
+        self.origin = (x0, y0)
+
+    def fraction(self, rect):
+        """Tỉ lệ pixel đúng màu trong rect (toạ độ frame, là 1 trong các vùng đã truyền vào); None nếu rỗng."""
+        if rect is None or self.integral is None:
+            return None
+        ox, oy = self.origin
+        x0, y0, x1, y1 = rect[0] - ox, rect[1] - oy, rect[2] - ox, rect[3] - oy
+        ii = self.integral
+        count = int(ii[y1, x1]) - int(ii[y0, x1]) - int(ii[y1, x0]) + int(ii[y0, x0])
+        return count / ((x1 - x0) * (y1 - y0))
@@ -0,0 +1,253 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+
+from spool import EventSpool, SPOOL_PATH
+from metrics import STAGE_SECONDS, HTTP_FAILURES
+
+# ================= CẤU HÌNH GỬI SỰ KIỆN =================
+UPLOAD_BATCH_SIZE = 50          # Số sự kiện tối đa trong 1 request
+UPLOAD_FLUSH_INTERVAL = 0.5     # Giây: gom sự kiện tối đa bao lâu trước khi gửi
+UPLOAD_QUEUE_SIZE = 1000        # Hàng đợi đầy -> sự kiện mới bị bỏ (status "dropped")
+UPLOAD_TIMEOUT = 3
+STATUS_HISTORY = 2000           # Số sự kiện gần nhất giữ trạng thái để tra cứu
+REPLAY_RATE = 50                # Sự kiện/giây tối đa khi gửi lại tồn đọng trong spool
+REPLAY_BACKOFF_MAX = 30.0       # Giây chờ tối đa giữa 2 lần thử khi server không phản hồi
+SPOOL_COMPACT_INTERVAL = 60.0   # Giây giữa 2 lần dọn file spool
+# Mã lỗi tạm thời (sai / đổi x-api-key, timeout, quá tải): giữ sự kiện trong spool, thử lại với backoff
+RETRY_STATUSES = (401, 403, 408, 429)
+
+UPLOAD_SECONDS = STAGE_SECONDS.labels("upload")
+UPLOAD_FAILURES = HTTP_FAILURES.labels("backend")
+
+
+class EventUploader:
+    """
+    1 thread nền gửi sự kiện (attendance / report / env) lên server Node.js:
+    - 1 requests.Session dùng chung (keep-alive, không mở TCP mới mỗi sự kiện)
+    - gom batch theo kích thước hoặc thời gian rồi POST /api/events/batch
+    - server cũ chưa có endpoint batch (404) -> gửi lần lượt từng sự kiện, vẫn trên cùng session
+    - 5xx / RETRY_STATUSES: giữ nguyên sự kiện; 413: chia đôi batch; 4xx khác: gửi lẻ để chỉ
+      sự kiện bị server từ chối (kiểm tra dữ liệu) mới bị đánh dấu failed
+    - mọi sự kiện được ghi vào EventSpool trước khi gửi; server không phản hồi thì giữ lại,
+      thử lại với backoff và gửi bù theo đúng thứ tự (kể cả sau khi khởi động lại)
+    Trạng thái từng sự kiện: queued -> spooled -> sent | failed (server từ chối) | dropped (hàng đợi đầy).
+    Id sự kiện là chuỗi duy nhất toàn cục để server bỏ qua bản gửi trùng khi gửi lại.
+    """
+
+    def __init__(self, api_base, batch_size=UPLOAD_BATCH_SIZE, flush_interval=UPLOAD_FLUSH_INTERVAL,
+                 queue_size=UPLOAD_QUEUE_SIZE, headers=None, spool_path=SPOOL_PATH):
+        self.api_base = api_base.rstrip("/")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_supported = True
+        self.running = True
+        self.counters = {"queued": 0, "sent": 0, "failed": 0, "dropped": 0, "batches": 0, "retries": 0}
+        self.spool = EventSpool(spool_path)
+        self._backlog = True            # Kiểm tra spool ngay lần đầu (có thể còn sự kiện cũ)
+        self._backoff = 0
+        self._retry_after = 0
+        self._next_attempt = 0
+        self._status = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    # --- API cho vòng lặp camera (O(1), không chặn) ---
+    def send(self, kind, data):
+        """Đưa sự kiện vào hàng đợi, trả về id để tra trạng thái."""
+        event = {"id": uuid.uuid4().hex, "type": kind, "data": data, "ts": time.time()}
+        self._set_status(event["id"], "queued")
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.counters["queued"] -= 1
+            self._set_status(event["id"], "dropped")
+        return event["id"]
+
+    def status(self, event_id):
+        return self._status.get(event_id)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.counters)
+        data["pending"] = self.queue.qsize()
+        data["spooled"] = self.spool.count()
+        return data
+
+    def _set_status(self, event_id, status, count=True):
+        with self._lock:
+            self._status[event_id] = status
+            self._status.move_to_end(event_id)
+            while len(self._status) > STATUS_HISTORY:
+                self._status.popitem(last=False)
+            if count:
+                self.counters[status] = self.counters.get(status, 0) + 1
+
+    # --- Thread nền ---
+    def _collect(self, wait):
+        """Chờ sự kiện đầu tiên tối đa `wait` giây, rồi gom thêm đến khi đủ batch hoặc hết cửa sổ thời gian."""
+        try:
+            batch = [self.queue.get(timeout=wait)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        backlog = self.spool.count()
+        if backlog:
+            print(f"📼 Còn {backlog} sự kiện chưa gửi từ lần chạy trước, sẽ gửi lại")
+        last_compact = time.time()
+
+        while self.running or not self.queue.empty():
+            # Còn tồn đọng thì chỉ chờ đến lượt gửi kế tiếp, không chờ sự kiện mới
+            wait = max(0.05, min(0.5, self._next_attempt - time.time())) if self._backlog else 0.5
+            batch = self._collect(wait)
+            if batch:
+                # Ghi spool trước khi gửi: mất mạng / tắt máy vẫn còn trên đĩa
+                self.spool.append(batch)
+                for e in batch:
+                    self._set_status(e["id"], "spooled", count=False)
+                self._backlog = True
+
+            if self._backlog and time.time() >= self._next_attempt:
+                self._drain()
+
+            if time.time() - last_compact >= SPOOL_COMPACT_INTERVAL:
+                self.spool.compact()
+                last_compact = time.time()
+
+    def _drain(self):
+        """Gửi 1 batch cũ nhất trong spool; lỗi mạng -> backoff, tồn đọng -> giới hạn tốc độ gửi lại."""
+        events = self.spool.pending(self.batch_size)
+        if not events:
+            self._backlog = False
+            return
+
+        with UPLOAD_SECONDS.time():
+            acked = self._deliver(events)
+        self.spool.ack(acked)
+        now = time.time()
+        if len(acked) < len(events):
+            self.spool.mark_attempt([e["id"] for e in events if e["id"] not in acked])
+            with self._lock:
+                self.counters["retries"] += 1
+            if self._backoff == 0:
+                print("🌐 Không gửi được lên server, sự kiện được giữ trong spool")
+            self._backoff = min(REPLAY_BACKOFF_MAX, max(1.0, self._backoff * 2, self._retry_after))
+            self._retry_after = 0
+            self._next_attempt = now + self._backoff
+            return
+
+        if self._backoff:
+            print("✅ Kết nối lại server, đang gửi lại sự kiện tồn đọng")
+        self._backoff = 0
+        self._backlog = len(events) == self.batch_size or self.spool.count() > 0
+        # Đang xả tồn đọng -> giãn nhịp theo REPLAY_RATE để không dội server vừa khởi động lại
+        self._next_attempt = now + len(events) / REPLAY_RATE if self._backlog else 0
+
+    def _deliver(self, batch):
+        """Trả về tập id đã được server xác nhận (kể cả bị từ chối hợp lệ – không gửi lại)."""
+        if self.batch_supported:
+            acked = self._deliver_batch(batch)
+            if acked is not None:
+                return acked
+        return self._deliver_each(batch)
+
+    def _deliver_batch(self, batch):
+        """POST /events/batch; None = cần gửi lẻ từng sự kiện."""
+        try:
+            r = self.session.post(
+                f"{self.api_base}/events/batch",
+                json={"events": [{k: e[k] for k in ("id", "type", "data", "ts")} for e in batch]},
+                timeout=UPLOAD_TIMEOUT,
+            )
+        except requests.RequestException:
+            UPLOAD_FAILURES.inc()
+            return set()
+        if r.status_code == 404:
+            print("⚠ Server chưa hỗ trợ /api/events/batch, gửi từng sự kiện")
+            self.batch_supported = False
+            return None
+        if r.status_code == 413 and len(batch) > 1:
+            # Batch vượt giới hạn body của server -> chia đôi và giảm batch_size cho các lần sau.
+            # Giữ thứ tự: nửa sau chỉ gửi khi nửa đầu đã xong
+            half = len(batch) // 2
+            self.batch_size = min(self.batch_size, half)
+            acked = self._deliver(batch[:half])
+            if len(acked) < half:
+                return acked
+            return acked | self._deliver(batch[half:])
+        return self._apply_batch_response(batch, r)
+
+    def _deliver_each(self, batch):
+        acked = set()
+        for e in batch:
+            try:
+                r = self.session.post(f"{self.api_base}/{e['type']}", json=e["data"], timeout=UPLOAD_TIMEOUT)
+            except requests.RequestException:
+                UPLOAD_FAILURES.inc()
+                break               # Giữ thứ tự: dừng ở sự kiện đầu tiên chưa gửi được
+            if r.status_code >= 500 or r.status_code in RETRY_STATUSES:
+                self._retry_later(r)
+                break
+            # 4xx còn lại: server đã kiểm tra và từ chối chính sự kiện này – gửi lại cũng vậy
+            self._set_status(e["id"], "sent" if r.ok else "failed")
+            acked.add(e["id"])
+        return acked
+
+    def _retry_later(self, r):
+        UPLOAD_FAILURES.inc()
+        if r.status_code in (401, 403) and self._backoff == 0:
+            print(f"🔑 Server từ chối xác thực ({r.status_code}), kiểm tra API key – sự kiện được giữ trong spool")
+        try:
+            self._retry_after = float(r.headers.get("Retry-After", 0))
+        except (TypeError, ValueError):
+            pass
+
+    def _apply_batch_response(self, batch, r):
+        if r.status_code >= 500 or r.status_code in RETRY_STATUSES:
+            self._retry_later(r)
+            return set()
+        if not r.ok:
+            # Server từ chối cả batch (sai định dạng, 1 sự kiện quá lớn...) -> gửi lẻ để tách sự kiện lỗi
+            return None
+        with self._lock:
+            self.counters["batches"] += 1
+
+        try:
+            results = {x.get("id"): x.get("status") for x in r.json().get("results", [])}
+        except ValueError:
+            results = {}
+        for e in batch:
+            # "error" = server kiểm tra dữ liệu sự kiện và từ chối -> failed, không gửi lại
+            status = results.get(e["id"], "ok")
+            self._set_status(e["id"], "failed" if status == "error" else "sent")
+        return {e["id"] for e in batch}
+
+    def close(self, timeout=5):
+        """Dừng nhận sự kiện mới; hàng đợi được ghi hết vào spool, phần chưa gửi sẽ gửi ở lần chạy sau."""
+        self.running = False
+        self._thread.join(timeout=timeout)
+        self.session.close()
+        if not self._thread.is_alive():
+            self.spool.close()
@@ -0,0 +1,357 @@
+import os
+import time
+import threading
+import queue
+from collections import deque
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from pipeline import DropOldestQueue, LatestFrameGrabber, RENDER_QUEUE_SIZE, ANALYZE_SECONDS, RENDER_SECONDS
+from detection import DETECT_MAX_SIDE
+from analysis import create_face_detector
+from supervisor import YUNET_MODEL
+from scheduler import DETECT
+
+# ================= CẤU HÌNH WORKER POOL =================
+POOL_WORKERS = max(1, (os.cpu_count() or 2) - 1)   # Chừa 1 core cho capture + điều phối
+RING_SLOTS_PER_WORKER = 2
+RING_MAX_FRAME = (1920, 1080)                       # Cỡ slot (w, h) khi nguồn không cho biết độ phân giải
+TASK_TIMEOUT = 5.0                                  # Giây: frame chưa có kết quả quá lâu (worker chết / treo) -> bỏ qua
+
+
+class FrameRing:
+    """Ring buffer frame BGR cấp phát sẵn trong shared memory, mỗi slot 1 frame."""
+
+    def __init__(self, shm, slots, slot_bytes, owner=False):
+        self.shm = shm
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = owner
+
+    @classmethod
+    def create(cls, slots, max_frame=RING_MAX_FRAME):
+        slot_bytes = max_frame[0] * max_frame[1] * 3
+        shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        return cls(shm, slots, slot_bytes, owner=True)
+
+    def descriptor(self):
+        return {"name": self.shm.name, "slots": self.slots, "slot_bytes": self.slot_bytes}
+
+    @classmethod
+    def attach(cls, desc):
+        shm = shared_memory.SharedMemory(name=desc["name"])
+        return cls(shm, desc["slots"], desc["slot_bytes"])
+
+    def view(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot, frame):
+        self.view(slot, frame.shape)[:] = frame
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def frame_capacity(cap, max_frame=None):
+    """
+    Cỡ frame lớn nhất ring phải chứa: độ phân giải nguồn báo (cap.get), nâng lên max_frame nếu có
+    (vd: mức cao nhất ResolutionController có thể chuyển tới); không biết gì -> RING_MAX_FRAME.
+    """
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+    if max_frame:
+        w, h = max(w, max_frame[0]), max(h, max_frame[1])
+    return (w, h) if w and h else RING_MAX_FRAME
+
+
+def detect_worker(ring_desc, tasks, results, detect_max_side, tiling=None, index=0, current=None):
+    """
+    Tiến trình worker: đọc frame từ slot, chỉ detect, trả mảng mặt (không gửi frame).
+    Nhận diện do tiến trình chính làm qua FaceTracker.identify (chỉ track mới / đến hạn).
+    current[index] = seq đang xử lý (-1 khi rảnh) để bộ điều phối biết slot nào worker chết còn giữ.
+    """
+    ring = FrameRing.attach(ring_desc)
+    detector = create_face_detector(YUNET_MODEL, tiling, detect_max_side)
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot, shape, side = task
+            if current is not None:
+                current[index] = seq
+            if side and tiling is None:
+                detector.max_side = side
+            frame = ring.view(slot, shape)
+            started = time.perf_counter()
+
+            # Lỗi ở 1 frame không được làm chết worker: luôn trả kết quả (rỗng) để slot được thu hồi
+            try:
+                faces = detector.detect(frame)
+                if faces is None:
+                    faces = np.empty((0, 15), dtype=np.float32)
+            except Exception as e:
+                print(f"⚠ Worker {os.getpid()} lỗi ở frame {seq}: {e}")
+                faces = np.empty((0, 15), dtype=np.float32)
+
+            # (box + 5 landmarks + score, thời gian xử lý) – vài trăm byte thay vì cả frame
+            results.put((seq, slot, faces.astype(np.float32), time.perf_counter() - started))
+            if current is not None:
+                current[index] = -1
+    finally:
+        ring.close()
+
+
+class PooledFramePipeline:
+    """
+    Chế độ đa tiến trình: capture ghi frame vào FrameRing, pool worker detect song song
+    trên các slot, bộ điều phối sắp lại kết quả theo thứ tự frame rồi gọi
+    post(frame, faces) -> result (track + nhận diện track mới / đến hạn, như chế độ thread)
+    và render(packet) như FramePipeline.
+    Hết slot trống thì frame mới bị bỏ (không bao giờ chặn capture).
+    Slot được cấp theo frame_capacity(cap, max_frame); frame lớn hơn slot bị bỏ và báo lỗi.
+    detector: ScaledFaceDetector ở tiến trình chính mà ResolutionController chỉnh max_side;
+    giá trị hiện tại gửi kèm mỗi task nên worker đổi cạnh detect theo (None = giữ detect_max_side).
+    Frame đầu hàng chờ quá TASK_TIMEOUT (worker chết / treo) bị bỏ qua để thứ tự không kẹt mãi;
+    slot của nó bị cách ly (worker treo có thể vẫn đang đọc) tới khi kết quả muộn về
+    hoặc worker giữ nó được xác nhận đã chết. Worker chết được khởi động lại.
+    Nhịp gửi frame do scheduler quyết định như FramePipeline, ngân sách nhân theo số worker;
+    gate (MotionGate) đóng thì frame dùng lại kết quả gần nhất, không tốn worker.
+    """
+
+    def __init__(self, cap, post, render, workers=POOL_WORKERS, scheduler=None, gate=None, adjust=None,
+                 max_frame=None, detect_max_side=DETECT_MAX_SIDE, detector=None, tiling=None):
+        self.post = post
+        self.render = render
+        self.workers = workers
+        self.scheduler = scheduler
+        if scheduler:
+            scheduler.capacity = workers
+        self.gate = gate
+        self.max_frame = frame_capacity(cap, max_frame)
+        self.task_timeout = TASK_TIMEOUT
+        self.detect_max_side = detect_max_side
+        self.detector = detector
+        self.tiling = tiling
+
+        self.grabber = LatestFrameGrabber(cap, on_frame=self._feed, pace=gate.capture_delay if gate else None,
+                                          adjust=adjust)
+        self.render_queue = DropOldestQueue(RENDER_QUEUE_SIZE)
+        self.running = False
+        self.dropped = 0
+        self.oversized = 0
+        self.gated = 0
+        self.sent = 0
+        self.completed = 0
+        self.expired = 0
+        self.restarted = 0
+        self._last_result = None
+
+        self._lock = threading.Lock()
+        self._free = deque()
+        self._order = deque()           # seq đã gửi, theo thứ tự
+        self._pending = {}              # seq -> FramePacket
+        self._inflight = {}             # seq -> (slot, thời điểm gửi)
+        self._ready = {}                # seq -> kết quả worker
+        self._abandoned = {}            # seq đã bỏ qua -> slot đang cách ly, chờ kết quả muộn / worker chết
+        self._ring = None
+        self._procs = []
+        self._checked_at = 0.0
+        self._collector = None
+
+    def _start_workers(self):
+        ctx = mp.get_context("spawn")
+        slots = self.workers * RING_SLOTS_PER_WORKER
+        self._ring = FrameRing.create(slots, self.max_frame)
+        self._free.extend(range(slots))
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._current = ctx.Array("q", [-1] * self.workers, lock=False)
+        for i in range(self.workers):
+            self._procs.append(self._spawn(i, ctx))
+
+    def _spawn(self, index, ctx=None):
+        ctx = ctx or mp.get_context("spawn")
+        p = ctx.Process(
+            target=detect_worker,
+            args=(self._ring.descriptor(), self._tasks, self._results,
+                  self.detect_max_side, self.tiling, index, self._current),
+            daemon=True,
+        )
+        p.start()
+        return p
+
+    def _check_workers(self):
+        # Tối đa 1 lần/giây: worker lỗi ngay khi khởi động không bị spawn dồn dập
+        now = time.monotonic()
+        if now - self._checked_at < 1.0:
+            return
+        self._checked_at = now
+        for i, p in enumerate(self._procs):
+            if not p.is_alive() and self.running:
+                print(f"⚠ Worker {p.pid} đã dừng (exit {p.exitcode}) – khởi động lại")
+                self._reclaim(self._current[i])
+                self._current[i] = -1
+                self._procs[i] = self._spawn(i)
+                self.restarted += 1
+
+    def _reclaim(self, seq):
+        """Worker đang giữ seq đã chết: không ai còn đọc slot đó nữa -> trả slot, frame coi như bỏ."""
+        with self._lock:
+            if seq in self._abandoned:
+                self._free.append(self._abandoned.pop(seq))
+            elif seq in self._inflight:
+                slot, _ = self._inflight.pop(seq)
+                self._free.append(slot)
+                self._ready[seq] = None
+
+    def _feed(self, packet):
+        if self.scheduler and not self.scheduler.due(DETECT, packet.ts):
+            self._reuse_last(packet)
+            return
+        frame = packet.frame
+        if self.gate and not self.gate.admit(frame, packet.ts):
+            self.gated += 1
+            self._reuse_last(packet)
+            return
+        if frame.nbytes > self._ring.slot_bytes:
+            if not self.oversized:
+                print(f"❌ Frame {frame.shape[1]}x{frame.shape[0]} lớn hơn slot ring "
+                      f"{self.max_frame[0]}x{self.max_frame[1]} – không phân tích được, hãy truyền max_frame")
+            self.oversized += 1
+            return
+        with self._lock:
+            if not self._free:
+                self.dropped += 1
+                return
+            slot = self._free.popleft()
+            self._ring.write(slot, frame)
+            self._pending[packet.seq] = packet
+            self._inflight[packet.seq] = (slot, time.monotonic())
+            self._order.append(packet.seq)
+            self.sent += 1
+        side = self.detector.max_side if self.detector is not None else None
+        self._tasks.put((packet.seq, slot, frame.shape, side))
+
+    def _reuse_last(self, packet):
+        # Chỉ dùng lại kết quả khi không còn frame nào đang chờ worker (giữ thứ tự)
+        if self._last_result is not None and not self._order:
+            packet.result = self._last_result
+            self.render_queue.put(packet)
+
+    def _release(self, now):
+        """Gọi khi đang giữ _lock: lấy các frame đầu hàng đã xong; frame đầu hàng quá hạn -> kết quả None."""
+        done = []
+        while self._order:
+            s = self._order[0]
+            if s in self._ready:
+                result = self._ready.pop(s)
+            elif now - self._inflight[s][1] > self.task_timeout:
+                # Worker treo: bỏ frame nhưng cách ly slot (có thể vẫn đang bị đọc), không ghi đè
+                slot, _ = self._inflight.pop(s)
+                self._abandoned[s] = slot
+                self.expired += 1
+                result = None
+            else:
+                break
+            self._order.popleft()
+            done.append((self._pending.pop(s), result))
+        return done
+
+    def _collect(self):
+        while self.running:
+            try:
+                seq, slot, faces, elapsed = self._results.get(timeout=0.5)
+            except queue.Empty:
+                seq = None
+            if seq is not None:
+                ANALYZE_SECONDS.observe(elapsed)
+                if self.scheduler:
+                    self.scheduler.record(DETECT, elapsed)
+
+            self._check_workers()
+            with self._lock:
+                if seq in self._abandoned:
+                    # Kết quả muộn của frame đã bỏ: worker đã đọc xong, giờ mới trả slot
+                    self._free.append(self._abandoned.pop(seq))
+                elif seq in self._inflight:
+                    self._inflight.pop(seq, None)
+                    self._free.append(slot)
+                    self._ready[seq] = faces
+                done = self._release(time.monotonic())
+
+            for packet, result in done:
+                if result is None:
+                    self.completed += 1
+                    continue
+                try:
+                    packet.result = self.post(packet.frame, result)
+                except Exception as e:
+                    print(f"⚠ Lỗi hậu xử lý: {e}")
+                    self.completed += 1
+                    continue
+                self._last_result = packet.result
+                self.render_queue.put(packet)
+                self.completed += 1
+
+    def drained(self):
+        """Nguồn đã hết và mọi frame đã gửi worker đều đã có kết quả và được hiển thị."""
+        return self.grabber.ended and self.sent == self.completed and not len(self.render_queue)
+
+    def stats(self):
+        return {
+            "captured": self.grabber.seq,
+            "dropped_infer": self.dropped,
+            "oversized": self.oversized,
+            "dropped_render": self.render_queue.dropped,
+            "gated": self.gated,
+            "expired": self.expired,
+            "restarted": self.restarted,
+            "infer_queue": len(self._order),
+            "render_queue": len(self.render_queue),
+        }
+
+    def run(self):
+        self._start_workers()
+        self.running = True
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        self.grabber.start()
+
+        try:
+            while self.running:
+                packet = self.render_queue.get(timeout=0.1)
+                if packet is None:
+                    if self.drained():
+                        break
+                    continue
+                with RENDER_SECONDS.time():
+                    keep = self.render(packet)
+                if keep is False:
+                    break
+        finally:
+            self.stop()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.grabber.stop()
+        # Dừng bộ điều phối trước để nó không khởi động lại worker đang thoát
+        if self._collector and self._collector is not threading.current_thread():
+            self._collector.join(timeout=2)
+        for _ in self._procs:
+            self._tasks.put(None)
+        for p in self._procs:
+            p.join(timeout=3)
+            if p.is_alive():
+                p.terminate()
+        if self._ring:
+            self._ring.close()
+            self._ring = None
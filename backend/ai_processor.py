@@ -1,8 +1,14 @@
-import requests
-import time
+import atexit
+import threading
+
+# Dùng chung bộ gửi sự kiện (batch + spool) với các client trong ai_processor/:
+# chạy với thư mục ai_processor/ trong PYTHONPATH, vd PYTHONPATH=ai_processor python client.py
+from uploader import EventUploader
+from cooldown import CooldownStore
 
 # ================= CẤU HÌNH =================
-BACKEND_URL = "http://localhost:3000/api/report"  # Đúng endpoint
+BACKEND_API = "http://localhost:3000/api"         # /report, /events/batch
+SPOOL_FILE = "ai_processor_spool.db"              # Sự kiện chưa gửi được, gửi bù khi backend sống lại
 API_KEY = "so_secret_123"                         # Phải khớp với server.js
 HEADERS = {
     "x-api-key": API_KEY,
@@ -10,12 +16,27 @@ HEADERS = {
 }
 
 # Biến toàn cục chống spam (tương tự code cũ)
-last_report_time = {}  # {name_violation_type: timestamp}
+last_report_time = CooldownStore()  # {(name, violation_type): hết hạn}, tự dọn + giới hạn kích thước
+
+# Tạo khi cần (init() hoặc lần gửi đầu tiên): import module không mở spool, không chạy thread
+uploader = None
+_uploader_lock = threading.Lock()
+
+
+def init(api_base=BACKEND_API, spool_path=SPOOL_FILE):
+    """Khởi tạo bộ gửi sự kiện (gọi nhiều lần vẫn chỉ tạo 1), trả về EventUploader."""
+    global uploader
+    with _uploader_lock:
+        if uploader is None:
+            uploader = EventUploader(api_base, headers=HEADERS, spool_path=spool_path)
+            atexit.register(uploader.close)   # Ghi nốt hàng đợi vào spool trước khi thoát
+    return uploader
+
 
 def send_to_backend(name: str, violation_type: str, min_interval=3.0) -> bool:
     """
-    Gửi báo cáo vi phạm lên backend Node.js
-    Trả về True nếu gửi thành công, False nếu thất bại
+    Gửi báo cáo vi phạm lên backend Node.js (không chặn, có spool trên đĩa)
+    Trả về True nếu đã nhận vào hàng đợi gửi, False nếu bị chống spam hoặc hàng đợi đầy
     
     Args:
         name: Tên học sinh
@@ -23,38 +44,20 @@ def send_to_backend(name: str, violation_type: str, min_interval=3.0) -> bool:
         min_interval: Khoảng cách tối thiểu giữa 2 lần gửi cùng loại (giây)
     
     Returns:
-        bool: Thành công hay không
+        bool: Đã xếp hàng gửi hay không
     """
-    # Tạo key chống spam: kết hợp name + type để tránh spam cùng học sinh cùng loại
-    spam_key = f"{name}_{violation_type}"
-    
-    current_time = time.time()
-    if spam_key in last_report_time and (current_time - last_report_time[spam_key]) < min_interval:
+    # Key chống spam: (name, type) để tránh spam cùng học sinh cùng loại
+    if not last_report_time.allow((name, violation_type), ttl=min_interval):
         print(f"⏳ Chống spam: {name} - {violation_type} (chưa đủ {min_interval}s)")
         return False
     
-    try:
-        response = requests.post(
-            BACKEND_URL,
-            json={"name": name, "type": violation_type},
-            headers=HEADERS,
-            timeout=2.0  # Timeout 2 giây, tránh treo
-        )
-        
-        if response.status_code == 200:
-            last_report_time[spam_key] = current_time
-            print(f"✅ Gửi báo cáo thành công: {name} → {violation_type}")
-            return True
-        else:
-            print(f"❌ Lỗi từ server: {response.status_code} - {response.text}")
-            return False
-            
-    except requests.exceptions.Timeout:
-        print(f"⌛ Timeout khi gửi báo cáo: {name} - {violation_type}")
-        return False
-    except requests.exceptions.ConnectionError:
-        print(f"🌐 Không kết nối được tới backend Node.js ({BACKEND_URL})")
-        return False
-    except Exception as e:
-        print(f"🚨 Lỗi không xác định khi gửi báo cáo: {str(e)}")
+    # Ghi vào hàng đợi + spool trên đĩa rồi trả về ngay; backend tắt/khởi động lại
+    # thì sự kiện được giữ lại và gửi bù khi backend phản hồi
+    uploader = init()
+    event_id = uploader.send("report", {"name": name, "type": violation_type})
+    if uploader.status(event_id) == "dropped":
+        print(f"❌ Hàng đợi gửi đầy, bỏ báo cáo: {name} - {violation_type}")
         return False
+
+    print(f"📨 Đã xếp hàng báo cáo: {name} → {violation_type}")
+    return True
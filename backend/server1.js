@@ -55,6 +55,7 @@ let attendance = [];
 let ledStatus = { color: "off", updatedAt: new Date() };
 let currentTemp = 25.0;
 let currentHum = 60.0;
+let currentEnvAt = 0;   // ms – thời điểm đo của giá trị hiện tại, bản gửi bù cũ hơn không ghi đè
 
 function loadData() {
     try {
@@ -236,183 +237,281 @@ io.on("connection", (socket) => {
 
 /* ========== PUBLIC API (ESP & AI) ========== */
 
-// ESP gửi dữ liệu môi trường - FIXED
-app.post("/api/env", (req, res) => {
-    try {
-        console.log("🌡️ Nhận dữ liệu môi trường:", req.body);
-        
-        const { temp, hum } = req.body;
-        
-        if (temp === undefined || hum === undefined) {
-            console.error("❌ Thiếu dữ liệu temp hoặc hum");
-            return res.status(400).json({ 
-                error: "Thiếu dữ liệu temp hoặc hum",
-                status: "error"
-            });
-        }
-        
-        currentTemp = parseFloat(temp);
-        currentHum = parseFloat(hum);
-        
-        console.log(`✅ Đã nhận: Nhiệt độ=${currentTemp}°C, Độ ẩm=${currentHum}%`);
-        
-        // Tạo log
-        const log = {
-            id: logs.length + 1,
-            type: "env",
-            message: `Nhiệt độ: ${currentTemp}°C, Độ ẩm: ${currentHum}%`,
-            temp: currentTemp,
-            hum: currentHum,
-            timestamp: new Date().toISOString()
+// Xử lý từng loại sự kiện, dùng chung cho API đơn lẻ và /api/events/batch.
+// Trả về { code, body, changed } – changed = true nếu cần saveData().
+// ts (giây, tùy chọn) = thời điểm AI ghi nhận sự kiện; sự kiện gửi bù sau khi mất mạng
+// vẫn được tính đúng ngày/giờ thay vì giờ server nhận.
+
+function eventTime(ts) {
+    const ms = Number(ts) * 1000;
+    if (!ts || !Number.isFinite(ms) || ms > Date.now() + 60 * 1000) {
+        return new Date().toISOString();
+    }
+    return new Date(ms).toISOString();
+}
+
+// Id sự kiện batch đã xử lý gần đây: AI gửi lại khi không nhận được phản hồi -> bỏ qua bản trùng
+const SEEN_EVENT_LIMIT = 5000;
+const seenEventIds = new Set();
+
+function rememberEvent(id) {
+    if (id === undefined || id === null) return true;
+    if (seenEventIds.has(id)) return false;
+    seenEventIds.add(id);
+    if (seenEventIds.size > SEEN_EVENT_LIMIT) {
+        seenEventIds.delete(seenEventIds.values().next().value);
+    }
+    return true;
+}
+
+function processEnv(data, ts) {
+    const { temp, hum } = data || {};
+    
+    if (temp === undefined || hum === undefined) {
+        console.error("❌ Thiếu dữ liệu temp hoặc hum");
+        return {
+            code: 400,
+            body: { error: "Thiếu dữ liệu temp hoặc hum", status: "error" }
         };
-        
-        logs.unshift(log);
-        if (logs.length > 500) logs.pop();
-        
-        // Gửi qua socket
+    }
+    
+    const reading = { temp: parseFloat(temp), hum: parseFloat(hum) };
+    const timestamp = eventTime(ts);
+    const measuredAt = Date.parse(timestamp);
+    
+    // Sự kiện gửi bù sau khi mất mạng có thể đến sau bản đo mới hơn: chỉ ghi vào lịch sử
+    const latest = measuredAt >= currentEnvAt;
+    if (latest) {
+        currentTemp = reading.temp;
+        currentHum = reading.hum;
+        currentEnvAt = measuredAt;
+    }
+    
+    console.log(`✅ Đã nhận: Nhiệt độ=${reading.temp}°C, Độ ẩm=${reading.hum}%${latest ? "" : " (bản cũ)"}`);
+    
+    // Tạo log
+    const log = {
+        id: logs.length + 1,
+        type: "env",
+        message: `Nhiệt độ: ${reading.temp}°C, Độ ẩm: ${reading.hum}%`,
+        temp: reading.temp,
+        hum: reading.hum,
+        timestamp
+    };
+    
+    logs.unshift(log);
+    if (logs.length > 500) logs.pop();
+    
+    // Gửi qua socket
+    if (latest) {
         io.emit("sensor_data", { 
             temp: currentTemp, 
             hum: currentHum, 
             timestamp: log.timestamp 
         });
-        
-        // Lưu data
-        saveData();
-        
-        res.json({ 
+    }
+    
+    return {
+        code: 200,
+        changed: true,
+        body: {
             status: "ok",
             message: "Dữ liệu đã nhận",
             temp: currentTemp,
             hum: currentHum
-        });
-        
-    } catch (err) {
-        console.error("❌ Lỗi /api/env:", err);
-        res.status(500).json({ 
-            error: "Lỗi server",
-            message: err.message,
-            status: "error"
-        });
-    }
-});
+        }
+    };
+}
 
-// AI gửi báo cáo vi phạm
-app.post("/api/report", (req, res) => {
-    try {
-        console.log("🚨 Nhận báo cáo vi phạm:", req.body);
-        
-        const { name, type } = req.body;
+function processReport(data, ts) {
+    const { name, type } = data || {};
 
-        if (!name || !type) {
-            return res.status(400).json({ 
-                error: "Thiếu name hoặc type",
-                status: "error"
-            });
-        }
+    if (!name || !type) {
+        return {
+            code: 400,
+            body: { error: "Thiếu name hoặc type", status: "error" }
+        };
+    }
 
-        let level = "info";
-        if (type.includes("Ngu") || type.includes("Quay")) {
-            level = "red";
-        } else if (type.includes("dong phuc") || type.includes("Đồng phục")) {
-            level = "green";
-
-            // Kiểm tra nếu đã báo hôm nay
-            const today = new Date().toISOString().split('T')[0];
-            const alreadyReported = logs.some(l =>
-                l.name === name &&
-                l.type === type &&
-                l.timestamp.startsWith(today)
-            );
-            if (alreadyReported) {
-                console.log(`⏭️ ${name} đã báo '${type}' hôm nay`);
-                return res.json({
+    let level = "info";
+    if (type.includes("Ngu") || type.includes("Quay")) {
+        level = "red";
+    } else if (type.includes("dong phuc") || type.includes("Đồng phục")) {
+        level = "green";
+
+        // Kiểm tra nếu đã báo trong ngày xảy ra sự kiện
+        const today = eventTime(ts).split('T')[0];
+        const alreadyReported = logs.some(l =>
+            l.name === name &&
+            l.type === type &&
+            l.timestamp.startsWith(today)
+        );
+        if (alreadyReported) {
+            console.log(`⏭️ ${name} đã báo '${type}' hôm nay`);
+            return {
+                code: 200,
+                body: {
                     status: "already_reported",
                     message: `${name} đã báo '${type}' hôm nay`
-                });
-            }
+                }
+            };
         }
+    }
 
-        const log = {
-            id: logs.length + 1,
-            type: type,
-            level: level,
-            message: `${name}: ${type}`,
-            name: name,
-            timestamp: new Date().toISOString()
-        };
+    const log = {
+        id: logs.length + 1,
+        type: type,
+        level: level,
+        message: `${name}: ${type}`,
+        name: name,
+        timestamp: eventTime(ts)
+    };
 
-        logs.unshift(log);
-        if (logs.length > 500) logs.pop();
+    logs.unshift(log);
+    if (logs.length > 500) logs.pop();
 
-        io.emit("violation", log);
-        console.log(`🚨 Vi phạm: ${name} - ${type} (${level})`);
+    io.emit("violation", log);
+    console.log(`🚨 Vi phạm: ${name} - ${type} (${level})`);
 
-        saveData();
-        res.json({ 
-            status: "ok",
-            message: "Báo cáo đã nhận"
-        });
-        
-    } catch (err) {
-        console.error("❌ Lỗi /api/report:", err);
-        res.status(500).json({ 
-            error: "Lỗi server",
-            status: "error"
-        });
+    return {
+        code: 200,
+        changed: true,
+        body: { status: "ok", message: "Báo cáo đã nhận" }
+    };
+}
+
+function processAttendance(data, ts) {
+    const { name } = data || {};
+    
+    if (!name) {
+        return {
+            code: 400,
+            body: { error: "Thiếu tên", status: "error" }
+        };
     }
-});
+    
+    // Kiểm tra đã điểm danh trong ngày xảy ra sự kiện chưa
+    const timestamp = eventTime(ts);
+    const today = timestamp.split('T')[0];
+    const alreadyAttended = attendance.some(a => 
+        a.name === name && a.timestamp.startsWith(today)
+    );
+    
+    if (alreadyAttended) {
+        console.log(`⏭️ ${name} đã điểm danh rồi`);
+        return {
+            code: 200,
+            body: {
+                status: "already_attended",
+                message: `${name} đã điểm danh hôm nay`
+            }
+        };
+    }
+    
+    const record = {
+        id: attendance.length + 1,
+        name: name,
+        timestamp: timestamp
+    };
+    
+    attendance.push(record);
+    
+    io.emit("attendance", { 
+        name: name, 
+        timestamp: record.timestamp 
+    });
+    
+    console.log(`✅ Điểm danh thành công: ${name}`);
+    
+    return {
+        code: 200,
+        changed: true,
+        body: { status: "ok", message: "Điểm danh thành công" }
+    };
+}
+
+const EVENT_HANDLERS = {
+    env: processEnv,
+    report: processReport,
+    attendance: processAttendance
+};
+
+function handleEvent(route, processor) {
+    return (req, res) => {
+        try {
+            const result = processor(req.body);
+            if (result.changed) saveData();
+            res.status(result.code).json(result.body);
+        } catch (err) {
+            console.error(`❌ Lỗi ${route}:`, err);
+            res.status(500).json({ 
+                error: "Lỗi server",
+                message: err.message,
+                status: "error"
+            });
+        }
+    };
+}
+
+// ESP gửi dữ liệu môi trường - FIXED
+app.post("/api/env", (req, res, next) => {
+    console.log("🌡️ Nhận dữ liệu môi trường:", req.body);
+    next();
+}, handleEvent("/api/env", processEnv));
+
+// AI gửi báo cáo vi phạm
+app.post("/api/report", (req, res, next) => {
+    console.log("🚨 Nhận báo cáo vi phạm:", req.body);
+    next();
+}, handleEvent("/api/report", processReport));
 
 // AI gửi điểm danh
-app.post("/api/attendance", (req, res) => {
+app.post("/api/attendance", (req, res, next) => {
+    console.log("✅ Nhận điểm danh:", req.body);
+    next();
+}, handleEvent("/api/attendance", processAttendance));
+
+// AI gửi nhiều sự kiện trong 1 request: { events: [{ id, type, data, ts }] }
+// Ghi file 1 lần cho cả batch thay vì mỗi sự kiện 1 lần
+app.post("/api/events/batch", (req, res) => {
     try {
-        console.log("✅ Nhận điểm danh:", req.body);
-        
-        const { name } = req.body;
-        
-        if (!name) {
+        const events = Array.isArray(req.body && req.body.events) ? req.body.events : null;
+        if (!events) {
             return res.status(400).json({ 
-                error: "Thiếu tên",
+                error: "Thiếu danh sách events",
                 status: "error"
             });
         }
-        
-        // Kiểm tra đã điểm danh hôm nay chưa
-        const today = new Date().toISOString().split('T')[0];
-        const alreadyAttended = attendance.some(a => 
-            a.name === name && a.timestamp.startsWith(today)
-        );
-        
-        if (alreadyAttended) {
-            console.log(`⏭️ ${name} đã điểm danh rồi`);
-            return res.json({ 
-                status: "already_attended",
-                message: `${name} đã điểm danh hôm nay`
-            });
-        }
-        
-        const record = {
-            id: attendance.length + 1,
-            name: name,
-            timestamp: new Date().toISOString()
-        };
-        
-        attendance.push(record);
-        
-        io.emit("attendance", { 
-            name: name, 
-            timestamp: record.timestamp 
-        });
-        
-        console.log(`✅ Điểm danh thành công: ${name}`);
-        
-        saveData();
-        res.json({ 
-            status: "ok",
-            message: "Điểm danh thành công"
+
+        let changed = false;
+        const results = events.map(ev => {
+            const processor = EVENT_HANDLERS[ev && ev.type];
+            if (!processor) {
+                return { id: ev && ev.id, status: "error", error: "Loại sự kiện không hợp lệ" };
+            }
+            if (!rememberEvent(ev.id)) {
+                return { id: ev.id, status: "duplicate" };
+            }
+            try {
+                const result = processor(ev.data, ev.ts);
+                changed = changed || !!result.changed;
+                return {
+                    id: ev.id,
+                    status: result.code === 200 ? result.body.status : "error",
+                    error: result.body.error
+                };
+            } catch (err) {
+                console.error(`❌ Lỗi sự kiện ${ev.type}:`, err);
+                return { id: ev.id, status: "error", error: err.message };
+            }
         });
-        
+
+        if (changed) saveData();
+        console.log(`📦 Batch: ${events.length} sự kiện`);
+        res.json({ status: "ok", results });
+
     } catch (err) {
-        console.error("❌ Lỗi /api/attendance:", err);
+        console.error("❌ Lỗi /api/events/batch:", err);
         res.status(500).json({ 
             error: "Lỗi server",
             status: "error"